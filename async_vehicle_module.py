@@ -0,0 +1,146 @@
+import asyncio
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+import vehicle_module as vm
+
+""" This module provides an asyncio client for the vintage car database, for mass operations
+    where many requests must be in flight at the same time. It needs the optional `httpx`
+    package (pip install httpx).
+
+    Example:
+        async with AsyncVehicleClient("http://localhost", 3000, "vehicles", concurrency=50) as client:
+            summary = await client.delete_many(["1234", "3214"])
+"""
+
+
+# Asynchronous client of the vehicle database.
+class AsyncVehicleClient:
+    """
+    Sends database operations concurrently over a pool of keep-alive connections.
+
+    Every method returns the same result dictionaries as `vehicle_module.run_operation`: the
+    "op", the "id", "ok" (bool), the HTTP "status" when the server replied, and either the
+    resulting "data" or an "error" message. Errors never raise, so one failed car does not
+    stop a bulk operation.
+
+    Parameters:
+    - server_address (str): The address of the server, e.g. "http://localhost".
+    - port_number (int): The port number of the server (default: 3000).
+    - database (str): The name of the database (default: "vehicles").
+    - concurrency (int): The largest number of requests in flight at the same time.
+    - timeout (float): Seconds allowed for each request, connection included.
+    """
+    def __init__ (self, server_address, port_number=3000, database="vehicles", concurrency=20, timeout=10.0):
+        if httpx is None:
+            raise ImportError("AsyncVehicleClient needs the httpx package: pip install httpx")
+        self.base_url = f"{server_address}:{port_number}/{database}"
+        self.timeout = timeout
+        self._limit = asyncio.Semaphore(concurrency)
+        self._client = httpx.AsyncClient(
+            timeout=httpx.Timeout(timeout),
+            limits=httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency))
+
+    async def __aenter__ (self):
+        return self
+
+    async def __aexit__ (self, *exc_info):
+        await self.close()
+
+    async def close (self):
+        """ Closes every pooled connection. """
+        await self._client.aclose()
+
+    def url (self, cid=None):
+        """ Returns the URL of the collection, or of a single car when `cid` is given. """
+        return self.base_url if cid is None else f"{self.base_url}/{cid}"
+
+    async def _send (self, op, method, cid=None, **kwargs):
+        result = {"op": op, "id": cid, "ok": False}
+        try:
+            async with self._limit:
+                reply = await asyncio.wait_for(self._client.request(method, self.url(cid), **kwargs), self.timeout)
+        except asyncio.TimeoutError:
+            result["error"] = "timeout"
+            return result
+        except httpx.HTTPError as e:
+            result["error"] = f"communication error ({e.__class__.__name__})"
+            return result
+        result["status"] = reply.status_code
+        if reply.status_code in (200, 201, 204):
+            if method != "DELETE" and reply.content:
+                try:
+                    result["data"] = reply.json()
+                except ValueError:
+                    result["error"] = "the server sent an invalid reply"
+                    return result
+                if op == "add" and isinstance(result["data"], dict):
+                    result["id"] = result["data"].get("id")
+            result["ok"] = True
+        elif reply.status_code == 404:
+            result["error"] = f"the cid {cid} is not in the database"
+        else:
+            result["error"] = "server error"
+        return result
+
+    async def list (self, **params):
+        """ Lists the cars; `params` are passed as query parameters, e.g. `_page=1, _limit=20, brand="BMW"`. """
+        return await self._send("list", "GET", params=params)
+
+    async def get (self, cid):
+        """ Fetches one car. """
+        return await self._send("get", "GET", cid)
+
+    async def add (self, data):
+        """ Adds a car after checking it with `vehicle_module.validate_car`. """
+        errors = vm.validate_car(data)
+        if errors:
+            return {"op": "add", "id": data.get("id"), "ok": False, "error": "; ".join(errors)}
+        return await self._send("add", "POST", json=data)
+
+    async def update (self, cid, data):
+        """ Replaces a car after checking it with `vehicle_module.validate_car`. """
+        errors = vm.validate_car(dict(data, id=cid))
+        if errors:
+            return {"op": "update", "id": cid, "ok": False, "error": "; ".join(errors)}
+        return await self._send("update", "PUT", cid, json=data)
+
+    async def delete (self, cid):
+        """ Deletes a car. """
+        return await self._send("delete", "DELETE", cid)
+
+    async def add_many (self, records):
+        """ Adds every record concurrently. Returns a summary, see `summarize`. """
+        return summarize(await asyncio.gather(*(self.add(record) for record in records)))
+
+    async def update_many (self, mapping):
+        """ Replaces every car of `mapping` (id -> new record) concurrently. Returns a summary, see `summarize`. """
+        return summarize(await asyncio.gather(*(self.update(cid, data) for cid, data in mapping.items())))
+
+    async def delete_many (self, ids):
+        """ Deletes every car of `ids` concurrently. Returns a summary, see `summarize`. """
+        return summarize(await asyncio.gather(*(self.delete(cid) for cid in ids)))
+
+
+# Function to summarize the results of a bulk operation.
+def summarize (results):
+    """
+    Collects the results of a bulk operation.
+
+    Parameters:
+    results (list): The result dictionaries of the single operations.
+
+    Returns:
+    dict: "succeeded" (the ids that were done), "failed" (id -> error message) and "results"
+          (every result, in the order of the input).
+    """
+    summary = {"succeeded": [], "failed": {}, "results": results}
+    for result in results:
+        if result["ok"]:
+            summary["succeeded"].append(result["id"])
+        else:
+            summary["failed"][result["id"]] = result.get("error")
+    return summary
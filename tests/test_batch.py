@@ -0,0 +1,61 @@
+import io
+import json
+
+import pytest
+
+import vehicle_module as vm
+import vehicle_server
+
+""" Tests of the batch mode (`vehicle_module.read_operations` and `run_batch`). """
+
+
+@pytest.fixture
+def client ():
+    cars = [{"id": str(cid), "brand": "Ford", "model": f"M{cid}", "production_year": 1950, "convertible": False}
+            for cid in range(1, 4)]
+    server = vehicle_server.VehicleServer(address=("127.0.0.1", 0), data={"vehicles": cars}, quiet=True).start()
+    client = vm.VehicleClient("http://127.0.0.1", server.server_address[1], "vehicles")
+    client.server = server
+    yield client
+    client.close()
+    server.stop()
+
+
+def run (client, text):
+    out = io.StringIO()
+    failed = vm.run_batch(client, vm.read_operations(io.StringIO(text)), out)
+    return failed, [json.loads(line) for line in out.getvalue().splitlines()]
+
+
+def test_one_result_per_operation_in_order (client):
+    failed, results = run(client, "\n".join([
+        '# comment lines and blank lines are skipped',
+        '',
+        '{"op": "get", "id": "1"}',
+        '{"op": "add", "data": {"id": "9", "brand": "Fiat", "model": "Uno", "production_year": 1990}}',
+        '{"op": "update", "id": "2", "data": {"production_year": 1960}}',
+        '{"op": "delete", "id": "3"}',
+        '{"op": "list", "filters": {"brand": "Fiat"}}',
+    ]))
+    assert failed == 0
+    assert [(result["op"], result["id"], result["ok"]) for result in results] == [
+        ("get", "1", True), ("add", "9", True), ("update", "2", True), ("delete", "3", True), ("list", None, True)]
+    assert [car["id"] for car in results[-1]["data"]] == ["9"]
+    records = client.server.collections["vehicles"].records
+    assert records["2"]["production_year"] == 1960 and "3" not in records
+
+
+def test_failures_are_reported_and_counted (client):
+    failed, results = run(client, "\n".join([
+        '{"op": "get", "id": "77"}',
+        'not json',
+        '{"op": "add", "data": {"brand": "Fiat", "model": "Uno", "production_year": 2020}}',
+        '{"op": "add", "id": "1", "data": {"brand": "Fiat", "model": "Uno", "production_year": 1990}}',
+        '{"op": "fly"}',
+    ]))
+    assert failed == 5 and not any(result["ok"] for result in results)
+    assert results[0]["error"] == "the cid 77 is not in the database"
+    assert results[1]["error"] == "line 2 is not valid JSON"
+    assert "production_year" in results[2]["error"]
+    assert results[3]["id"] == "1" and results[3]["status"] == 412
+    assert results[4]["error"] == "unknown operation 'fly'"
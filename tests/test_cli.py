@@ -0,0 +1,35 @@
+import pytest
+
+import vintage_car_db
+
+""" Tests of the command line of `vintage_car_db.py`: the older forms mapped onto the subcommands. """
+
+
+@pytest.fixture
+def parse ():
+    parser = vintage_car_db.command_parser()
+    return lambda argv: parser.parse_args(vintage_car_db.legacy_arguments(argv, parser))
+
+
+def test_server_address_starts_the_menu (parse):
+    args = parse(["http://localhost", "3001", "cars", "42"])
+    assert (args.command, args.server_address, args.port_number, args.database, args.cid) == \
+           ("menu", "http://localhost", 3001, "cars", "42")
+
+
+def test_option_values_before_the_server_address (parse):
+    args = parse(["--connect-timeout", "5", "http://localhost", "3000"])
+    assert (args.command, args.server_address, args.port_number, args.connect_timeout) == \
+           ("menu", "http://localhost", 3000, 5.0)
+    args = parse(["--read-timeout=4", "--retries", "2", "http://localhost"])
+    assert (args.server_address, args.read_timeout, args.retries) == ("http://localhost", 4.0, 2)
+
+
+def test_options_before_a_subcommand (parse):
+    args = parse(["--retries", "1", "list", "http://localhost", "--format", "csv"])
+    assert (args.command, args.retries, args.format) == ("list", 1, "csv")
+
+
+def test_batch_option (parse):
+    args = parse(["--batch", "operations.jsonl", "http://localhost"])
+    assert (args.command, args.file, args.server_address) == ("batch", "operations.jsonl", "http://localhost")
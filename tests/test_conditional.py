@@ -0,0 +1,48 @@
+import pytest
+
+import vehicle_module as vm
+import vehicle_server
+
+""" Tests of the conditional writes of `vehicle_module.conditional_write` and `run_operation`. """
+
+
+@pytest.fixture
+def client ():
+    cars = [{"id": "1", "brand": "Ford", "model": "T", "production_year": 1920, "convertible": True, "version": 1}]
+    server = vehicle_server.VehicleServer(address=("127.0.0.1", 0), data={"vehicles": cars}, quiet=True).start()
+    client = vm.VehicleClient("http://127.0.0.1", server.server_address[1], "vehicles")
+    yield client
+    client.close()
+    server.stop()
+
+
+def test_update_sends_only_the_changed_fields (client):
+    result = vm.run_operation(client, {"op": "update", "id": "1", "data": {"model": "A"}})
+    assert result["ok"]
+    assert client.get("1").json() == {"id": "1", "brand": "Ford", "model": "A", "production_year": 1920,
+                                      "convertible": True, "version": 2}
+
+
+def test_other_fields_changed_meanwhile_are_merged (client):
+    base, etag = vm.fetch_car(client, "1")
+    client.patch("1", {"brand": "Audi", "version": 2})
+    result = vm.conditional_write(client, "update", "1", {"model": "A"}, base, etag)
+    assert result["ok"]
+    record = client.get("1").json()
+    assert (record["brand"], record["model"], record["version"]) == ("Audi", "A", 3)
+
+
+def test_the_same_field_changed_meanwhile_is_a_conflict (client):
+    base, etag = vm.fetch_car(client, "1")
+    client.patch("1", {"model": "B", "version": 2})
+    result = vm.conditional_write(client, "update", "1", {"model": "A"}, base, etag)
+    assert result["conflict"] and result["current"]["model"] == "B"
+    assert client.get("1").json()["model"] == "B"
+
+
+def test_stale_version_or_etag_is_a_conflict (client):
+    client.patch("1", {"model": "B", "version": 2})
+    result = vm.run_operation(client, {"op": "delete", "id": "1", "version": 1})
+    assert result["conflict"] and client.get("1").status_code == 200
+    _, etag = vm.fetch_car(client, "1")
+    assert vm.run_operation(client, {"op": "delete", "id": "1", "etag": etag})["ok"]
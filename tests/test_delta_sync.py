@@ -0,0 +1,123 @@
+import pytest
+
+import vehicle_module as vm
+import vehicle_server
+
+""" Tests of the delta sync of a cached collection (`vehicle_module.delta_sync`), in every mode,
+    against the in-process `vehicle_server.VehicleServer`.
+"""
+
+
+def make_cars (ids, stamp=None):
+    cars = []
+    for cid in ids:
+        car = {"id": str(cid), "brand": "Ford", "model": f"M{cid}", "production_year": 1950, "convertible": False}
+        if stamp is not None:
+            car["updated_at"] = stamp
+        cars.append(car)
+    return cars
+
+
+@pytest.fixture
+def serve ():
+    servers = []
+
+    def start (cars):
+        server = vehicle_server.VehicleServer(address=("127.0.0.1", 0), data={"vehicles": cars}, quiet=True).start()
+        servers.append(server)
+        return server, "http://127.0.0.1", server.server_address[1], "vehicles"
+
+    yield start
+    for server in servers:
+        server.stop()
+
+
+def count_requests (client):
+    """ Wraps the session of `client` and returns the list (method, status, body size) of its requests. """
+    log = []
+    send = client.session.request
+
+    def request (method, url, **kwargs):
+        reply = send(method, url, **kwargs)
+        log.append((method, reply.status_code, len(reply.content)))
+        return reply
+
+    client.session.request = request
+    return log
+
+
+def same_cars (store, server):
+    """ True if the store holds exactly the live cars of the server. """
+    live = {cid: record for cid, record in server.collections["vehicles"].records.items() if not record.get("deleted")}
+    local = {str(record["id"]): {key: value for key, value in record.items() if value is not None} for record in store}
+    return local == {cid: {key: value for key, value in record.items() if value is not None} for cid, record in live.items()}
+
+
+def change_some (client):
+    client.post(make_cars(["9001"])[0])
+    client.patch("12", {"brand": "Audi"})
+    client.delete("13")
+
+
+def test_change_feed (serve, monkeypatch):
+    monkeypatch.setattr(vm, "SYNC_MODE", "auto")
+    server, *address = serve(make_cars(range(1, 50)))
+    store = vm.load_collection(*address)
+    assert vm._collection_cache[vm.collection_url(*address)]["sync"]["mode"] == "changes"
+    client = vm.get_client(*address)
+    change_some(client)
+    log = count_requests(client)
+    assert vm.load_collection(*address) is store
+    assert same_cars(store, server)
+    assert [method for method, status, size in log] == ["GET"]
+    log.clear()
+    assert vm.load_collection(*address) is store
+    assert len(log) == 1 and log[0][2] < 100
+
+
+def test_updated_at_with_tombstones_and_hard_deletes (serve, monkeypatch):
+    monkeypatch.setattr(vm, "SYNC_MODE", "updated_at")
+    server, *address = serve(make_cars(range(1, 50), stamp=1))
+    store = vm.load_collection(*address)
+    client = vm.get_client(*address)
+    client.patch("12", {"brand": "Audi", "updated_at": 2})
+    client.patch("14", {"deleted": True, "updated_at": 3})
+    client.post(make_cars(["77"], stamp=3)[0])
+    assert vm.load_collection(*address) is store
+    assert same_cars(store, server)
+    assert "14" not in store and store.get("12")["brand"] == "Audi"
+    # A car removed without a tombstone is found by comparing the counts and then the slices.
+    client.delete("15")
+    assert vm.load_collection(*address) is store
+    assert "15" not in store and same_cars(store, server)
+
+
+def test_slices_only_transfer_the_changed_slices (serve, monkeypatch):
+    monkeypatch.setattr(vm, "SYNC_MODE", "slices")
+    ids = list(range(1, 1000)) + ["x7", "y"]
+    server, *address = serve(make_cars(ids))
+    store = vm.load_collection(*address)
+    state = vm._collection_cache[vm.collection_url(*address)]["sync"]
+    assert state["mode"] == "slices" and len(state["slices"]) == len(vm.slice_names())
+    client = vm.get_client(*address)
+    change_some(client)
+    log = count_requests(client)
+    assert vm.load_collection(*address) is store
+    assert same_cars(store, server)
+    # Only slices 12, 13 and 90 changed: they are downloaded, the others reply 304.
+    assert [status for method, status, size in log if method == "GET"].count(200) == 3
+    log.clear()
+    assert vm.load_collection(*address) is store
+    assert [(method, status) for method, status, size in log] == [("HEAD", 200)]
+
+
+def test_slices_are_not_primed_when_the_collection_changes_meanwhile (serve, monkeypatch):
+    monkeypatch.setattr(vm, "SYNC_MODE", "slices")
+    server, *address = serve(make_cars(range(1, 200)))
+    client = vm.get_client(*address)
+    state = vm.finish_sync(vm.start_sync(client), 199, etag=client.head().headers["ETag"])
+    client.patch("150", {"brand": "Audi"})
+    assert vm.prime_slices(client, state)["slices"] == {}
+    store = vm.VehicleStore(make_cars(range(1, 200)))
+    assert vm.delta_sync(client, store, state) == len(vm.slice_names())
+    assert same_cars(store, server)
@@ -0,0 +1,105 @@
+import json
+import threading
+
+import pytest
+
+import vehicle_module as vm
+import vehicle_server
+
+""" Tests of `vehicle_module.import_cars` against the in-process `vehicle_server.VehicleServer`. """
+
+
+def make_cars (ids):
+    return [{"id": str(cid), "brand": "Ford", "model": f"M{cid}", "production_year": 1950, "convertible": False}
+            for cid in ids]
+
+
+def write_cars (path, cars):
+    path.write_text("".join(json.dumps(car) + "\n" for car in cars))
+    return str(path)
+
+
+def failing_posts (failures):
+    """ Returns a handler class whose POSTs reply 500 while `failures()` is True. """
+    lock = threading.Lock()
+
+    class Handler (vehicle_server.VehicleHandler):
+        def do_POST (self):
+            with lock:
+                fail = failures()
+            if fail:
+                self._read_body()
+                return self._error(500, "failed on purpose")
+            super().do_POST()
+
+    return Handler
+
+
+@pytest.fixture
+def serve ():
+    servers = []
+
+    def start (handler=vehicle_server.VehicleHandler):
+        server = vehicle_server.VehicleServer(address=("127.0.0.1", 0), data={"vehicles": []}, quiet=True)
+        server.RequestHandlerClass = handler
+        server.start()
+        servers.append(server)
+        return server, vm.VehicleClient("http://127.0.0.1", server.server_address[1], "vehicles",
+                                        retries=0, reset_timeout=0.2)
+
+    yield start
+    for server in servers:
+        server.stop()
+
+
+def test_open_circuit_waits_for_the_trial_call (serve, tmp_path):
+    posts = iter(range(1000))
+    server, client = serve(failing_posts(lambda: next(posts) < 5))
+    path = write_cars(tmp_path / "cars.jsonl", make_cars(range(1, 101)))
+    summary = vm.import_cars(client, path, workers=4, batch_size=20)
+    assert (summary["imported"], summary["failed"], summary["stopped"]) == (95, 5, False)
+    assert len(server.collections["vehicles"].records) == 95
+    assert client.breaker.state == "closed"
+
+
+def test_import_stops_while_the_server_is_down (serve, tmp_path):
+    server, client = serve(failing_posts(lambda: True))
+    path = write_cars(tmp_path / "cars.jsonl", make_cars(range(1, 101)))
+    summary = vm.import_cars(client, path, workers=4, batch_size=20, circuit_wait=0.5)
+    assert summary["stopped"] and summary["imported"] == 0
+    # The posts stop once the circuit stays open, instead of failing every record one by one.
+    assert summary["failed"] <= 20
+
+
+def test_failed_records_stay_in_the_checkpoint (serve, tmp_path):
+    broken = {"3", "47"}
+
+    class Handler (vehicle_server.VehicleHandler):
+        def _parse_body (self, body):
+            record = super()._parse_body(body)
+            if record is not None and record.get("id") in broken:
+                self._error(500, "failed on purpose")
+                return None
+            return record
+
+    server, client = serve(Handler)
+    path = write_cars(tmp_path / "cars.jsonl", make_cars(range(1, 101)))
+    checkpoint = path + ".checkpoint"
+    summary = vm.import_cars(client, path, workers=4, batch_size=20)
+    assert (summary["imported"], summary["failed"]) == (98, 2)
+    assert vm.read_checkpoint(checkpoint, path) == (100, {2, 46})
+
+    broken.clear()
+    summary = vm.import_cars(client, path, workers=4, batch_size=20)
+    assert (summary["imported"], summary["failed"], summary["skipped"]) == (2, 0, 98)
+    assert len(server.collections["vehicles"].records) == 100
+    assert not (tmp_path / "cars.jsonl.checkpoint").exists()
+
+
+def test_resume_starts_at_the_checkpoint (serve, tmp_path):
+    server, client = serve()
+    path = write_cars(tmp_path / "cars.jsonl", make_cars(range(1, 101)))
+    vm.write_checkpoint(path + ".checkpoint", path, 60)
+    summary = vm.import_cars(client, path, workers=4, batch_size=20)
+    assert (summary["imported"], summary["skipped"]) == (40, 60)
+    assert sorted(server.collections["vehicles"].records, key=int) == [str(cid) for cid in range(61, 101)]
@@ -0,0 +1,65 @@
+import json
+import random
+
+import pytest
+
+import vehicle_module as vm
+
+""" Tests of `vehicle_module.iter_json_array`, the incremental parser of the streamed car list. """
+
+
+def chunked (text, sizes):
+    """ Splits the UTF-8 encoding of `text` into pieces of the given sizes (the last piece takes the rest). """
+    data = text.encode()
+    pieces, position = [], 0
+    for size in sizes:
+        pieces.append(data[position:position + size])
+        position += size
+    pieces.append(data[position:])
+    return pieces
+
+
+def random_value (rng, depth=0):
+    kind = rng.choice(["int", "float", "exp", "string", "literal", "object", "array"] if depth < 3 else ["int", "string"])
+    if kind == "int":
+        return rng.randint(-10 ** 6, 10 ** 6)
+    if kind == "float":
+        return round(rng.uniform(-1000, 1000), rng.randint(0, 6))
+    if kind == "exp":
+        return float(f"{rng.randint(1, 9)}.{rng.randint(0, 99)}e{rng.randint(-5, 20)}")
+    if kind == "string":
+        return "".join(rng.choice('ab é€😀"\\,]} ') for _ in range(rng.randint(0, 8)))
+    if kind == "literal":
+        return rng.choice([True, False, None])
+    if kind == "object":
+        return {f"k{index}": random_value(rng, depth + 1) for index in range(rng.randint(0, 3))}
+    return [random_value(rng, depth + 1) for _ in range(rng.randint(0, 3))]
+
+
+def test_cars_split_at_every_byte ():
+    cars = [{"id": "1", "brand": "Citroën", "model": "DS", "production_year": 1955, "convertible": False},
+            {"id": "2", "brand": "BMW", "model": "2002", "production_year": 1972, "convertible": None}]
+    text = json.dumps(cars, ensure_ascii=False)
+    for cut in range(len(text.encode()) + 1):
+        assert list(vm.iter_json_array(chunked(text, [cut]))) == cars
+
+
+def test_numbers_cut_by_a_chunk_boundary ():
+    assert list(vm.iter_json_array([b"[4.", b"5e3, 1", b"2 ,-", b"7]"])) == [4500.0, 12, -7]
+    assert list(vm.iter_json_array([b"[1", b"e", b"2", b"]"])) == [100.0]
+    assert list(vm.iter_json_array([b"[tr", b"ue, nul", b"l]"])) == [True, None]
+
+
+@pytest.mark.parametrize("seed", range(200))
+def test_random_arrays_and_random_chunks (seed):
+    rng = random.Random(seed)
+    values = [random_value(rng) for _ in range(rng.randint(0, 6))]
+    text = json.dumps(values, ensure_ascii=rng.random() < 0.5, indent=rng.choice([None, 1]))
+    sizes = [rng.randint(1, 5) for _ in range(len(text))]
+    assert list(vm.iter_json_array(chunked(text, sizes))) == values
+
+
+@pytest.mark.parametrize("text", ['{"id": 1}', '[1, 2', '[1 2]', '[1,]', '[1] 2', '', '[{"id": 1}'])
+def test_invalid_text_raises (text):
+    with pytest.raises(ValueError):
+        list(vm.iter_json_array(chunked(text, [1] * len(text))))
@@ -0,0 +1,32 @@
+import vehicle_module as vm
+import vehicle_record
+
+""" Tests of the `Vehicle` record type and of the paths that build cars through it. """
+
+
+def test_round_trip_keeps_extra_fields ():
+    record = {"id": "7", "brand": "Fiat", "model": "500", "production_year": 1957,
+              "convertible": False, "version": 3}
+    vehicle = vehicle_record.Vehicle.from_dict(record)
+    assert vehicle.extra == {"version": 3}
+    assert vehicle.to_dict() == record
+    assert vehicle == vehicle_record.Vehicle.from_dict(dict(record))
+
+
+def test_missing_id_is_left_out ():
+    vehicle = vehicle_record.Vehicle(brand="Ford", model="T", production_year=1920, convertible=True)
+    assert "id" not in vehicle.to_dict()
+    assert vehicle.is_valid()
+
+
+def test_problems_match_the_dictionary_rules ():
+    record = {"id": "x1", "brand": "", "model": "T", "production_year": 2020, "convertible": "yes"}
+    assert vehicle_record.Vehicle.from_dict(record).problems() == vehicle_record.problems(record)
+    assert len(vm.validate_car(record)) == 4
+
+
+def test_prompts_build_a_vehicle (monkeypatch):
+    answers = iter(["Ford", "Model T", "1920", "y"])
+    monkeypatch.setattr("builtins.input", lambda prompt="": next(answers))
+    assert vm.input_car_data(False) == {"brand": "Ford", "model": "Model T", "production_year": 1920,
+                                        "convertible": True}
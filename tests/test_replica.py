@@ -0,0 +1,112 @@
+import pytest
+
+import vehicle_module as vm
+import vehicle_replica
+import vehicle_server
+import vintage_car_db
+
+""" Tests of the offline replica (`vehicle_replica.VehicleReplica`) and of its use by the menu. """
+
+
+def make_cars (ids):
+    return [{"id": str(cid), "brand": "Ford", "model": f"M{cid}", "production_year": 1950, "convertible": False}
+            for cid in ids]
+
+
+@pytest.fixture
+def served ():
+    server = vehicle_server.VehicleServer(address=("127.0.0.1", 0), data={"vehicles": make_cars(range(1, 6))},
+                                          quiet=True).start()
+    target = ("http://127.0.0.1", server.server_address[1], "vehicles")
+    yield server, target
+    server.stop()
+
+
+@pytest.fixture
+def replica (served):
+    replica = vehicle_replica.VehicleReplica(":memory:")
+    replica.sync(vm.get_client(*served[1]))
+    yield replica
+    replica.close()
+
+
+def stored (server):
+    return server.collections["vehicles"].records
+
+
+def test_queued_changes_are_replayed_in_order (served, replica):
+    server, target = served
+    assert replica.queue("add", "9", dict(make_cars([9])[0], brand="Fiat")) is None
+    assert replica.queue("update", "2", dict(make_cars([2])[0], brand="Audi")) is None
+    assert replica.queue("delete", "3") is None
+    assert replica.queue("delete", "77") == "The cid 77 is not in the database."
+    assert replica.get("9")["brand"] == "Fiat" and replica.get("3") is None
+    summary = replica.replay(vm.get_client(*target))
+    assert (summary["replayed"], summary["conflicts"], summary["pending"]) == (3, [], 0)
+    assert stored(server)["9"]["brand"] == "Fiat" and stored(server)["2"]["brand"] == "Audi"
+    assert "3" not in stored(server)
+
+
+def test_a_change_made_on_the_server_meanwhile_is_a_conflict (served, replica):
+    server, target = served
+    client = vm.get_client(*target)
+    replica.queue("update", "2", dict(make_cars([2])[0], brand="Audi"))
+    client.patch("2", {"brand": "Opel"})
+    summary = replica.replay(client)
+    assert [(op, cid) for op, cid, _ in summary["conflicts"]] == [("update", "2")]
+    assert stored(server)["2"]["brand"] == "Opel"
+    replica.sync(client)
+    assert replica.get("2")["brand"] == "Opel"
+
+
+def test_menu_syncs_the_replica_only_when_needed (served, tmp_path, monkeypatch):
+    server, target = served
+    monkeypatch.setenv("VINTAGE_CAR_DB_REPLICA", str(tmp_path / "replica.sqlite3"))
+    choices = iter(["1", "1", "2", "1", "1", "0"])
+    monkeypatch.setattr(vm, "read_user_choice", lambda: next(choices))
+    monkeypatch.setattr(vm, "print_menu", lambda: None)
+    monkeypatch.setattr(vm, "browse_cars", lambda *args, **kwargs: None)
+    monkeypatch.setattr(vm, "add_car", lambda *args: None)
+    syncs = []
+    sync = vehicle_replica.VehicleReplica.sync
+    monkeypatch.setattr(vehicle_replica.VehicleReplica, "sync", lambda self, client: syncs.append(1) or sync(self, client))
+    assert vintage_car_db.run_menu(*target) == 0
+    # Once when the menu starts and once after the add, not before every menu.
+    assert len(syncs) == 2
+
+
+def test_updates_are_replayed_as_conditional_writes (served, replica, monkeypatch):
+    server, target = served
+    client = vm.get_client(*target)
+    client.patch("4", {"version": 1})
+    replica.sync(client)
+    replica.queue("update", "4", dict(make_cars([4])[0], production_year=1960))
+    sent = []
+    send = client.session.request
+    monkeypatch.setattr(client.session, "request",
+                        lambda method, url, **kwargs: sent.append((method, kwargs.get("headers"), kwargs.get("json")))
+                        or send(method, url, **kwargs))
+    assert replica.replay(client)["replayed"] == 1
+    method, headers, body = sent[-1]
+    assert method == "PATCH" and headers["If-Match"] and body == {"production_year": 1960, "version": 2}
+    assert stored(server)["4"] == dict(make_cars([4])[0], production_year=1960, version=2)
+    assert replica.get("4")["version"] == 2
+
+
+def test_a_change_made_after_the_check_is_not_overwritten (served, replica, monkeypatch):
+    server, target = served
+    client = vm.get_client(*target)
+    replica.queue("update", "2", dict(make_cars([2])[0], brand="Audi"))
+    fetch_car = vm.fetch_car
+
+    def fetch_then_change (client, cid):
+        fetched = fetch_car(client, cid)
+        # Another writer changes the same field between the check and the write.
+        vm.VehicleClient(*target).patch(cid, {"brand": "Opel"})
+        monkeypatch.setattr(vm, "fetch_car", fetch_car)
+        return fetched
+
+    monkeypatch.setattr(vm, "fetch_car", fetch_then_change)
+    summary = replica.replay(client)
+    assert [(op, cid, record["brand"]) for op, cid, record in summary["conflicts"]] == [("update", "2", "Opel")]
+    assert stored(server)["2"]["brand"] == "Opel"
@@ -0,0 +1,87 @@
+import threading
+
+import pytest
+import requests
+
+import vehicle_module as vm
+import vehicle_resilience
+import vehicle_server
+
+""" Tests of the retry policy and the circuit breaker of `vehicle_resilience`, and of their use by `VehicleClient`. """
+
+
+def test_retry_decisions ():
+    policy = vehicle_resilience.RetryPolicy(retries=2)
+    assert policy.should_retry("GET", None, 0, status=503)
+    assert not policy.should_retry("GET", None, 0, status=500)
+    assert not policy.should_retry("GET", None, 2, status=503)
+    # An add is only sent again when it never reached the server, or carries an Idempotency-Key.
+    assert not policy.should_retry("POST", None, 0)
+    assert policy.should_retry("POST", None, 0, sent=False)
+    assert policy.should_retry("POST", {"Idempotency-Key": "k"}, 0)
+    assert all(0 <= policy.delay(attempt) <= min(10.0, 0.3 * 2 ** attempt) for attempt in range(8))
+    assert policy.delay(0, "4") == 4.0 and policy.delay(0, "600") == 10.0
+
+
+def test_circuit_breaker_states ():
+    now = [0.0]
+    breaker = vehicle_resilience.CircuitBreaker(failure_threshold=3, reset_timeout=10, clock=lambda: now[0])
+    for _ in range(3):
+        assert breaker.allow()
+        breaker.failure()
+    assert breaker.state == "open" and not breaker.allow() and breaker.retry_in() == 10
+    now[0] = 10.0
+    # One trial call in the half-open state, the others wait for its outcome.
+    assert breaker.allow() and breaker.state == "half-open" and not breaker.allow()
+    breaker.failure()
+    assert breaker.state == "open" and not breaker.allow()
+    now[0] = 20.0
+    assert breaker.allow()
+    breaker.success()
+    assert breaker.state == "closed" and breaker.failures == 0
+
+
+@pytest.fixture
+def flaky ():
+    """ A server whose GETs fail with 503 while `failures[0]` is positive (counting down). """
+    failures = [0]
+    lock = threading.Lock()
+
+    class Handler (vehicle_server.VehicleHandler):
+        def do_GET (self, send_body=True):
+            with lock:
+                fail = failures[0] > 0
+                failures[0] -= fail
+            if fail:
+                return self._error(503, "busy", send_body)
+            super().do_GET(send_body)
+
+    server = vehicle_server.VehicleServer(address=("127.0.0.1", 0), data={"vehicles": []}, quiet=True)
+    server.RequestHandlerClass = Handler
+    server.start()
+    yield server, failures
+    server.stop()
+
+
+def test_client_retries_a_busy_server (flaky):
+    server, failures = flaky
+    client = vm.VehicleClient("http://127.0.0.1", server.server_address[1], "vehicles", retries=3, backoff_factor=0.01)
+    failures[0] = 2
+    assert client.get().status_code == 200
+    failures[0] = 5
+    assert client.get().status_code == 503
+    client.close()
+
+
+def test_open_circuit_fails_at_once_or_waits_for_the_trial_call (flaky):
+    server, failures = flaky
+    client = vm.VehicleClient("http://127.0.0.1", server.server_address[1], "vehicles", retries=0,
+                              failure_threshold=2, reset_timeout=0.3)
+    failures[0] = 2
+    client.get()
+    client.get()
+    with pytest.raises(requests.ConnectionError):
+        client.get()
+    assert client.get(circuit_wait=1).status_code == 200
+    assert client.breaker.state == "closed"
+    client.close()
@@ -0,0 +1,78 @@
+import json
+import threading
+
+import requests
+
+import vehicle_server
+
+""" Tests of `vehicle_server.VehicleServer`: concurrent requests, the append-only log and the ETags. """
+
+
+def make_cars (ids):
+    return [{"id": str(cid), "brand": "Ford", "model": f"M{cid}", "production_year": 1950, "convertible": False}
+            for cid in ids]
+
+
+def start (path=None, cars=None):
+    server = vehicle_server.VehicleServer(path, address=("127.0.0.1", 0),
+                                          data=None if cars is None else {"vehicles": cars}, quiet=True)
+    return server.start(), f"http://127.0.0.1:{server.server_address[1]}/vehicles"
+
+
+def test_concurrent_posts ():
+    server, url = start(cars=[])
+
+    def post (first):
+        with requests.Session() as session:
+            for car in make_cars(range(first, first + 50)):
+                assert session.post(url, json=car).status_code == 201
+
+    threads = [threading.Thread(target=post, args=(first,)) for first in range(1, 401, 50)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(requests.get(url).json()) == 400
+    server.stop()
+
+
+def test_log_is_replayed_on_start (tmp_path):
+    path = tmp_path / "vehicle.json"
+    path.write_text(json.dumps({"vehicles": make_cars(range(1, 4))}))
+    server, url = start(str(path))
+    requests.patch(url + "/2", json={"brand": "Audi"})
+    requests.delete(url + "/3")
+    server._log.close()
+    # A crash: the file is not rewritten, the log holds the changes.
+    server.shutdown()
+    server.socket.close()
+    server, url = start(str(path))
+    assert [(car["id"], car["brand"]) for car in requests.get(url).json()] == [("1", "Ford"), ("2", "Audi")]
+    server.stop()
+
+
+def test_if_match_refuses_a_stale_version ():
+    server, url = start(cars=make_cars([1]))
+    etag = requests.get(url + "/1").headers["ETag"]
+    assert requests.patch(url + "/1", json={"brand": "Audi"}, headers={"If-Match": etag}).status_code == 200
+    assert requests.patch(url + "/1", json={"brand": "Fiat"}, headers={"If-Match": etag}).status_code == 412
+    server.stop()
+
+
+def test_no_stale_etag_after_a_restart_without_the_log (tmp_path):
+    path = tmp_path / "vehicle.json"
+    path.write_text(json.dumps({"vehicles": make_cars(range(1, 4))}))
+    server, url = start(str(path))
+    collection_etag = requests.get(url).headers["ETag"]
+    car_etag = requests.get(url + "/1").headers["ETag"]
+    server.stop()
+
+    # The file is edited by hand and the server starts without a log: its change numbers start again.
+    path.write_text(json.dumps({"vehicles": make_cars(range(1, 3)) + make_cars([9])}))
+    server, url = start(str(path))
+    reply = requests.get(url, headers={"If-None-Match": collection_etag})
+    assert reply.status_code == 200 and [car["id"] for car in reply.json()] == ["1", "2", "9"]
+    assert requests.get(url + "/1", headers={"If-None-Match": car_etag}).status_code == 200
+    etag = reply.headers["ETag"]
+    assert requests.get(url, headers={"If-None-Match": etag}).status_code == 304
+    server.stop()
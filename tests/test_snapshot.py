@@ -0,0 +1,100 @@
+import io
+import random
+
+import pytest
+
+import vehicle_module as vm
+import vehicle_snapshot
+
+""" Round-trip tests of the snapshot formats of `vehicle_snapshot`: the columnar layout (VCOL),
+    the text formats and their compressed files.
+"""
+
+
+def expected (record):
+    """ Returns a record as the columnar layout gives it back: every column present, the id as a string. """
+    return dict({name: None for name in vehicle_snapshot.COLUMNS}, **dict(record, id=str(record["id"])))
+
+
+def sample_cars (count, seed=0):
+    rng = random.Random(seed)
+    cars = []
+    for cid in range(1, count + 1):
+        car = {"id": cid if rng.random() < 0.5 else str(cid),
+               "brand": rng.choice(["BMW", "Citroën", "Fiat", "Ford"]),
+               "model": f"Model {rng.randint(1, 400)}"}
+        if rng.random() < 0.9:
+            car["production_year"] = rng.choice([rng.randint(1900, 2000), 40000, -40000])
+        if rng.random() < 0.8:
+            car["convertible"] = rng.random() < 0.5
+        if rng.random() < 0.1:
+            car["version"] = rng.randint(1, 9)
+        cars.append(car)
+    return cars
+
+
+def write_and_read (cars):
+    out = io.BytesIO()
+    assert vehicle_snapshot.write_columnar(iter(cars), out) == len(cars)
+    return list(vehicle_snapshot.iter_records(vehicle_snapshot.read_columnar(io.BytesIO(out.getvalue()))))
+
+
+@pytest.mark.parametrize("count", [0, 1, 7, 8, 9, 300])
+def test_columnar_round_trip (count):
+    cars = sample_cars(count, seed=count)
+    assert write_and_read(cars) == [expected(car) for car in cars]
+
+
+def test_columnar_keeps_odd_values ():
+    cars = [{"id": "1", "brand": None, "model": "", "production_year": -32768, "convertible": True},
+            {"id": "2", "brand": "Ž", "model": "A", "production_year": "1950", "extra": {"a": [1]}}]
+    assert write_and_read(cars) == [expected(car) for car in cars]
+
+
+def test_columnar_wide_dictionary ():
+    # More than 255 distinct models need two-byte codes.
+    cars = [{"id": str(cid), "brand": "Ford", "model": f"M{cid}", "production_year": 1950} for cid in range(1000)]
+    assert write_and_read(cars) == [expected(car) for car in cars]
+
+
+def test_columnar_rejects_other_files ():
+    with pytest.raises(ValueError):
+        vehicle_snapshot.read_columnar(io.BytesIO(b"[1, 2, 3]"))
+
+
+@pytest.mark.parametrize("name", ["cars.vcol", "cars.vcol.gz", "cars.jsonl", "cars.jsonl.gz", "cars.json", "cars.json.gz"])
+def test_file_round_trip (tmp_path, name):
+    cars = [dict(car, id=str(car["id"])) for car in sample_cars(50)]
+    path = str(tmp_path / name)
+    output_format = {".vcol": "columnar", ".jsonl": "jsonl", ".json": "json"}[
+        "." + vehicle_snapshot.base_name(name).rsplit(".", 1)[1]]
+    with vehicle_snapshot.open_file(path, "wb") as out:
+        assert vehicle_snapshot.write_snapshot(iter(cars), out, output_format, vm.format_rows) == len(cars)
+    read = list(vm.read_car_records(path))
+    assert read == ([expected(car) for car in cars] if output_format == "columnar" else cars)
+
+
+def test_csv_round_trip (tmp_path):
+    cars = [{"id": "1", "brand": "BMW", "model": "2002", "production_year": 1972, "convertible": True},
+            {"id": "2", "brand": "Fiat", "model": "500", "production_year": 1960, "convertible": False}]
+    path = str(tmp_path / "cars.csv")
+    with vehicle_snapshot.open_file(path, "wb") as out:
+        vehicle_snapshot.write_snapshot(iter(cars), out, "csv", vm.format_rows)
+    assert list(vm.read_car_records(path)) == cars
+
+
+def test_export_replaces_the_file_only_when_complete (tmp_path):
+    import vehicle_server
+    cars = [{"id": str(cid), "brand": "Ford", "model": "T", "production_year": 1920, "convertible": False} for cid in range(1, 21)]
+    server = vehicle_server.VehicleServer(address=("127.0.0.1", 0), data={"vehicles": cars}, quiet=True).start()
+    port = server.server_address[1]
+    path = str(tmp_path / "cars.vcol.gz")
+    try:
+        assert vm.export_cars("http://127.0.0.1", port, "vehicles", path, "columnar") == len(cars)
+        assert list(vm.read_car_records(path)) == cars
+        with pytest.raises(vm.requests.HTTPError):
+            vm.export_cars("http://127.0.0.1", port, "nosuch", path, "columnar")
+    finally:
+        server.stop()
+    assert list(vm.read_car_records(path)) == cars
+    assert sorted(file.name for file in tmp_path.iterdir()) == ["cars.vcol.gz"]
@@ -0,0 +1,91 @@
+import io
+import json
+
+import pytest
+
+import vehicle_module as vm
+import vehicle_stats
+
+""" Tests of the request timing and hot-path instrumentation of `vehicle_stats`. """
+
+
+@pytest.fixture
+def stats ():
+    vehicle_stats.reset()
+    vehicle_stats.enable()
+    yield vehicle_stats
+    vehicle_stats.disable()
+    vehicle_stats.reset()
+
+
+def histograms ():
+    return {(item["metric"], tuple(sorted(item["labels"].items()))): item for item in json.loads(vehicle_stats.to_json())}
+
+
+def histogram (metric, **labels):
+    return histograms()[(metric, tuple(sorted(labels.items())))]
+
+
+def test_nothing_is_recorded_while_disabled ():
+    vehicle_stats.reset()
+    vehicle_stats.record("request_seconds", 0.1, method="GET")
+    with vehicle_stats.timer("render_seconds"):
+        pass
+    assert histograms() == {}
+
+
+def test_histogram_buckets_and_percentiles ():
+    histogram = vehicle_stats.Histogram(vehicle_stats.SECONDS_BUCKETS)
+    for value in [0.0005] * 50 + [0.03] * 40 + [3.0] * 10:
+        histogram.observe(value)
+    assert histogram.count == 100
+    assert histogram.total == pytest.approx(0.0005 * 50 + 0.03 * 40 + 30)
+    assert histogram.percentile(50) == 0.001
+    assert histogram.percentile(90) == 0.05
+    assert histogram.percentile(99) == 3.0
+    assert sum(histogram.buckets) == 100
+
+
+def test_labels_hooks_and_trace (stats):
+    events = []
+    trace = io.StringIO()
+    stats.enable(trace)
+    stats.add_hook(events.append)
+    try:
+        stats.record("response_bytes", 2000, method="GET", target="item")
+        stats.record("response_bytes", 100, method="GET", target="collection")
+    finally:
+        stats.remove_hook(events.append)
+    assert histogram("response_bytes", method="GET", target="item")["buckets"]["4096"] == 1
+    assert histogram("response_bytes", method="GET", target="collection")["buckets"]["256"] == 1
+    assert [event["value"] for event in events] == [2000, 100]
+    assert trace.getvalue().splitlines()[0] == "method=GET target=item metric=response_bytes value=2000"
+
+
+def test_prometheus_buckets_are_cumulative (stats):
+    for value in (0.002, 0.002, 0.2):
+        stats.record("request_seconds", value, method="GET", status=200)
+    lines = stats.to_prometheus().splitlines()
+    assert "# TYPE vintage_car_db_request_seconds histogram" in lines
+    assert 'vintage_car_db_request_seconds_bucket{method="GET",status="200",le="0.0025"} 2' in lines
+    assert 'vintage_car_db_request_seconds_bucket{method="GET",status="200",le="+Inf"} 3' in lines
+    assert 'vintage_car_db_request_seconds_count{method="GET",status="200"} 3' in lines
+
+
+def test_client_requests_are_measured (stats):
+    import vehicle_server
+    cars = [{"id": str(cid), "brand": "Ford", "model": "T", "production_year": 1920} for cid in range(1, 101)]
+    server = vehicle_server.VehicleServer(address=("127.0.0.1", 0), data={"vehicles": cars}, quiet=True).start()
+    client = vm.VehicleClient("http://127.0.0.1", server.server_address[1], "vehicles")
+    try:
+        assert len(vm.decode_json(client.get())) == 100
+        client.post({"brand": "Fiat", "model": "500", "production_year": 1960})
+    finally:
+        client.close()
+        server.stop()
+    assert histogram("request_seconds", method="GET", target="collection", status=200)["count"] == 1
+    assert histogram("ttfb_seconds", method="GET", target="collection")["count"] == 1
+    assert histogram("response_bytes", method="GET", target="collection")["sum"] == len(json.dumps(cars))
+    assert histogram("json_decode_seconds")["count"] == 1
+    assert histogram("request_bytes", method="POST", target="collection")["count"] == 1
+    assert histogram("retries", method="GET", target="collection")["sum"] == 0
@@ -0,0 +1,98 @@
+import json
+
+import pytest
+
+import vehicle_module as vm
+import vehicle_server
+
+""" Tests of the indexes of `vehicle_module.VehicleStore` and of the paths that look cars up through them. """
+
+
+def make_cars (ids, brand="Ford"):
+    return [{"id": str(cid), "brand": brand, "model": f"M{cid}", "production_year": 1900 + cid % 100,
+             "convertible": cid % 2 == 0} for cid in ids]
+
+
+@pytest.fixture
+def serve ():
+    servers = []
+
+    def start (cars):
+        server = vehicle_server.VehicleServer(address=("127.0.0.1", 0), data={"vehicles": cars}, quiet=True).start()
+        servers.append(server)
+        return server, "http://127.0.0.1", server.server_address[1], "vehicles"
+
+    yield start
+    for server in servers:
+        server.stop()
+
+
+def test_find_follows_updates_and_removals ():
+    store = vm.VehicleStore(make_cars(range(1, 11)) + make_cars(range(11, 21), brand="BMW"))
+    assert [car["id"] for car in store.find(brand="BMW", convertible=True)] == [str(cid) for cid in range(12, 21, 2)]
+    store.update("12", dict(make_cars([12])[0], brand="Audi"))
+    store.remove("14")
+    assert [car["id"] for car in store.find(brand="BMW", convertible=True)] == ["20", "16", "18"]
+    assert [car["id"] for car in store.find(brand="Audi")] == ["12"]
+    # The last row moved into the hole of "14" is still found by its values.
+    assert store.find(model="M20")[0]["id"] == "20"
+
+
+def test_matching_applies_json_server_filters ():
+    store = vm.VehicleStore(make_cars(range(1, 101)))
+    found = store.matching({"convertible": "true", "production_year_gte": 1950, "production_year_lte": "1960"})
+    assert sorted(int(car["id"]) for car in found) == [50, 52, 54, 56, 58, 60]
+    assert store.matching({"brand": "BMW"}) == []
+
+
+def test_duplicate_ids ():
+    store = vm.VehicleStore(make_cars([1, 2]))
+    records = make_cars([2, 3, 3]) + [{"brand": "Ford"}, {"brand": "Ford"}]
+    assert store.duplicate_ids(records) == ["2", "3"]
+
+
+def test_add_car_checks_the_cached_collection (serve, monkeypatch, capsys):
+    server, *target = serve(make_cars(range(1, 6)))
+    vm.load_collection(*target)
+    answers = iter(["3", "Fiat", "Uno", "1990", "n"])
+    monkeypatch.setattr("builtins.input", lambda prompt="": next(answers))
+    client = vm.get_client(*target)
+    sent = []
+    send = client.session.request
+    monkeypatch.setattr(client.session, "request", lambda method, url, **kwargs: sent.append(method) or send(method, url, **kwargs))
+    vm.add_car(*target)
+    assert "already in the database" in capsys.readouterr().out
+    assert "POST" not in sent and "HEAD" not in sent
+
+
+def test_import_skips_stored_and_repeated_ids (serve, tmp_path):
+    server, *target = serve(make_cars(range(1, 6)))
+    path = tmp_path / "cars.jsonl"
+    path.write_text("".join(json.dumps(car) + "\n" for car in make_cars([4, 5, 6, 7, 7])))
+    summary = vm.import_cars(vm.get_client(*target), str(path), workers=4, batch_size=10)
+    assert (summary["imported"], summary["duplicate"], summary["failed"]) == (2, 3, 0)
+    assert sorted(server.collections["vehicles"].records, key=int) == [str(cid) for cid in range(1, 8)]
+
+
+def test_check_server_looks_the_id_up_in_the_cached_collection (serve):
+    server, *target = serve(make_cars(range(1, 6)))
+    running, store = vm.check_server(*target)
+    assert running and len(store) == 5
+    assert vm.check_server(*target, cid="3") == (True, store)
+    assert vm.check_server(*target, cid="9") == (False, None)
+
+
+def test_add_car_accepts_an_empty_created_reply (serve, monkeypatch, capsys):
+    server, *target = serve(make_cars(range(1, 3)))
+
+    class Handler (vehicle_server.VehicleHandler):
+        def _reply (self, status, body=b"{}", etag=None, headers=None, send_body=True):
+            super()._reply(status, b"" if status == 201 else body, etag, headers, send_body)
+
+    server.RequestHandlerClass = Handler
+    vm.load_collection(*target)
+    answers = iter(["7", "Fiat", "Uno", "1990", "n"])
+    monkeypatch.setattr("builtins.input", lambda prompt="": next(answers))
+    vm.add_car(*target)
+    assert "has been posted" in capsys.readouterr().out
+    assert "7" in vm.load_collection(*target)
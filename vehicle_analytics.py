@@ -0,0 +1,179 @@
+import heapq
+import itertools
+from array import array
+from collections import Counter
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+import vehicle_snapshot
+
+""" This module answers questions about the whole fleet: the cars and convertibles per brand,
+    the production years by decade, the models that appear more than once per brand and the
+    most common brands and models.
+
+    The cars are loaded once into columns (`FleetColumns`): brand and model dictionary-encoded
+    as integer codes, the years as an int16 array and the convertible flags as one byte per car.
+    Every statistic is then a counting pass over whole columns, done by NumPy when the optional
+    `numpy` package is installed and by the C-implemented `collections.Counter`, `zip` and
+    `itertools.compress` otherwise, so no Python code runs per car.
+
+    Example:
+        columns = FleetColumns.from_records(vehicle_module.stream_cars("http://localhost", 3000, "vehicles"))
+        print(format_report(columns.report(top=5)))
+"""
+
+MISSING_YEAR = vehicle_snapshot.MISSING_YEAR
+
+# The 8 flag bytes of every bitset byte (least significant bit first), used to unpack bitsets.
+_BITS = [bytes((byte >> bit) & 1 for bit in range(8)) for byte in range(256)]
+
+
+# Column-oriented copy of the fleet.
+class FleetColumns:
+    """
+    Holds the cars as columns: `brands` and `models` (the distinct values), `brand_codes` and
+    `model_codes` (one index into them per car), `years` (int16, `MISSING_YEAR` when unknown) and
+    `convertible` (one byte per car, 1 for a convertible).
+    """
+    def __init__ (self, brands, brand_codes, models, model_codes, years, convertible):
+        self.brands = brands
+        self.brand_codes = brand_codes
+        self.models = models
+        self.model_codes = model_codes
+        self.years = years
+        self.convertible = convertible
+
+    def __len__ (self):
+        return len(self.years)
+
+    @classmethod
+    def from_records (cls, records):
+        """ Builds the columns from car records (e.g. `vehicle_module.stream_cars`), in one pass. """
+        brands = {}
+        models = {}
+        brand_codes = array("I")
+        model_codes = array("I")
+        years = array("h")
+        convertible = bytearray()
+        for record in records:
+            brand_codes.append(brands.setdefault(record.get("brand"), len(brands)))
+            model_codes.append(models.setdefault(record.get("model"), len(models)))
+            year = record.get("production_year")
+            years.append(year if type(year) is int and MISSING_YEAR < year <= 32767 else MISSING_YEAR)
+            convertible.append(record.get("convertible") is True)
+        return cls(list(brands), brand_codes, list(models), model_codes, years, bytes(convertible))
+
+    @classmethod
+    def from_snapshot (cls, source):
+        """ Loads the columns of a columnar snapshot (`vehicle_snapshot`) without decoding it into records. """
+        columns = vehicle_snapshot.read_columnar(source, decode=False)
+        brands, brand_codes = columns["brand"]
+        models, model_codes = columns["model"]
+        is_set, is_true = columns["convertible"]
+        convertible = b"".join(_BITS[byte] for byte in is_true)[:len(brand_codes)]
+        return cls(brands, brand_codes, models, model_codes, columns["production_year"], convertible)
+
+    def _count (self, codes, size, selected=None):
+        """ Returns the number of cars with each code (0..size-1), only counting the `selected` cars when given. """
+        if numpy is not None:
+            values = _vector(codes)
+            if selected is not None:
+                values = values[numpy.frombuffer(selected, dtype=numpy.bool_)]
+            return numpy.bincount(values, minlength=size).tolist()
+        counts = Counter(codes if selected is None else itertools.compress(codes, selected))
+        return [counts[code] for code in range(size)]
+
+    def by_brand (self):
+        """ Returns [(brand, cars, convertibles)], the brands with the most cars first. """
+        totals = self._count(self.brand_codes, len(self.brands))
+        convertibles = self._count(self.brand_codes, len(self.brands), self.convertible)
+        rows = zip(self.brands, totals, convertibles)
+        return sorted(rows, key=lambda row: (-row[1], str(row[0])))
+
+    def decades (self):
+        """ Returns {decade: cars} in ascending order (e.g. {1950: 12, 1960: 40}); unknown years are left out. """
+        if numpy is not None:
+            years = _vector(self.years)
+            years = years[years != MISSING_YEAR].astype(numpy.int32)
+            decades, counts = numpy.unique(years // 10 * 10, return_counts=True)
+            return dict(zip(decades.tolist(), counts.tolist()))
+        histogram = Counter()
+        # Count every distinct year first (a C pass), then fold the few distinct years into decades.
+        for year, count in Counter(self.years).items():
+            if year != MISSING_YEAR:
+                histogram[year // 10 * 10] += count
+        return dict(sorted(histogram.items()))
+
+    def duplicate_models (self):
+        """ Returns {brand: [(model, cars)]} for the models that appear more than once for a brand. """
+        if numpy is not None:
+            # One int64 key per (brand, model) pair, so a single unique() pass counts the pairs.
+            stride = max(len(self.models), 1)
+            keys = _vector(self.brand_codes).astype(numpy.int64) * stride + _vector(self.model_codes)
+            keys, counts = numpy.unique(keys, return_counts=True)
+            repeated = counts > 1
+            brands, models, counts = keys[repeated] // stride, keys[repeated] % stride, counts[repeated]
+            order = numpy.lexsort((models, brands, -counts))
+            pairs = zip(brands[order].tolist(), models[order].tolist(), counts[order].tolist())
+        else:
+            pairs = sorted(((brand, model, count) for (brand, model), count
+                            in Counter(zip(self.brand_codes, self.model_codes)).items() if count > 1),
+                           key=lambda pair: (-pair[2], pair[0], pair[1]))
+        duplicates = {}
+        for brand, model, count in pairs:
+            duplicates.setdefault(self.brands[brand], []).append((self.models[model], count))
+        return duplicates
+
+    def top (self, column, n=10):
+        """ Returns the `n` most common values of "brand" or "model" as [(value, cars)]. """
+        values, codes = (self.brands, self.brand_codes) if column == "brand" else (self.models, self.model_codes)
+        counts = self._count(codes, len(values))
+        if numpy is not None and counts:
+            order = numpy.argsort(-numpy.asarray(counts), kind="stable")[:n].tolist()
+            return [(values[code], counts[code]) for code in order]
+        return [(values[code], counts[code]) for code in
+                heapq.nlargest(n, range(len(values)), key=lambda code: (counts[code], -code))]
+
+    def report (self, top=10):
+        """ Returns every statistic as a dictionary that can be written as JSON. """
+        return {
+            "cars": len(self),
+            "convertibles": self.convertible.count(1),
+            "brands": [{"brand": brand, "cars": cars, "convertibles": convertibles}
+                       for brand, cars, convertibles in self.by_brand()],
+            "decades": {str(decade): cars for decade, cars in self.decades().items()},
+            "duplicate_models": {str(brand): [{"model": model, "cars": cars} for model, cars in models]
+                                 for brand, models in self.duplicate_models().items()},
+            "top_brands": [{"brand": brand, "cars": cars} for brand, cars in self.top("brand", top)],
+            "top_models": [{"model": model, "cars": cars} for model, cars in self.top("model", top)],
+        }
+
+
+def _vector (column):
+    """ Returns a NumPy view of an `array.array` column, without copying it. """
+    return numpy.frombuffer(column, dtype=column.typecode)
+
+
+# Function to format a report as text.
+def format_report (report, width=40):
+    """ Returns the report of `FleetColumns.report` as readable text, with a bar chart of the decades. """
+    lines = [f"{report['cars']} cars, {report['convertibles']} convertibles", "",
+             f"{'brand':<20}{'cars':>10}{'convertibles':>14}"]
+    for row in report["brands"]:
+        lines.append(f"{str(row['brand']):<20}{row['cars']:>10}{row['convertibles']:>14}")
+    lines += ["", f"{'decade':<10}{'cars':>10}"]
+    largest = max(report["decades"].values(), default=0)
+    for decade, cars in report["decades"].items():
+        bar = "#" * (round(cars / largest * width) if largest else 0)
+        lines.append(f"{decade + 's':<10}{cars:>10}  {bar}")
+    lines += ["", "Models appearing more than once per brand:"]
+    for brand, models in report["duplicate_models"].items():
+        lines.append(f"    {brand}: " + ", ".join(f"{row['model']} ({row['cars']})" for row in models))
+    if not report["duplicate_models"]:
+        lines.append("    none")
+    lines += ["", "Most common brands: " + ", ".join(f"{row['brand']} ({row['cars']})" for row in report["top_brands"]),
+              "Most common models: " + ", ".join(f"{row['model']} ({row['cars']})" for row in report["top_models"])]
+    return "\n".join(lines) + "\n"
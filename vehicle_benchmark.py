@@ -0,0 +1,275 @@
+"""
+vehicle_benchmark.py - Benchmarks the hot paths of vehicle_module against a local stand-in server.
+
+The script starts `vehicle_server` in the same process, in memory only, seeds it with a
+synthetic collection shaped like `vehicle.json`, and measures the full collection fetch and JSON decoding, streaming, table
+rendering, paging, lookups, add/update/delete round trips and bulk import for each size.
+
+Usage:
+    vehicle_benchmark.py [--sizes 1000 100000 1000000] [--ops 200] [--output results.json] [--compare old.json]
+    vehicle_benchmark.py --startup [--startup-runs 20]
+
+Every measurement reports latency percentiles (p50/p90/p99, in milliseconds), the throughput in
+operations per second and the peak RSS of the process so far (the stand-in server runs in the
+same process, so it is included). The results are printed and can be written as JSON; with
+--compare, operations whose p50 latency grew by more than --threshold percent are reported as
+regressions and the exit code is 1.
+
+Every run also starts vintage_car_db.py in fresh interpreters for paths that never reach the
+network (--help, a usage error, an invalid port) and reports the time they add to a bare
+interpreter (the median of the runs) and their import time (from -X importtime). The exit code is 1
+when a case imports one of STARTUP_FORBIDDEN (e.g. requests); a case adding more than
+STARTUP_TARGET_MS is only flagged, since a few milliseconds of noise between runs are common.
+Stale bytecode skews this, so run it with writable __pycache__ directories
+(PYTHONDONTWRITEBYTECODE unset).
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import vehicle_module as vm
+import vehicle_server
+
+
+BRANDS = ["BMW", "Lexus", "Toyota", "AUDI", "Ford", "Fiat", "Porsche", "Jaguar", "Volvo", "Opel"]
+
+
+# Function to generate a synthetic collection.
+def synthetic_vehicles (count, seed=0):
+    """ Returns `count` car records shaped like the ones of `vehicle.json`, with ids "1".."count". """
+    generator = random.Random(seed)
+    return [{"id": str(number),
+             "brand": generator.choice(BRANDS),
+             "model": f"{generator.choice('ABCDEFGHKLMSTXZ')}{generator.randint(1, 9999)}",
+             "production_year": generator.randint(1900, 2000),
+             "convertible": generator.random() < 0.2}
+            for number in range(1, count + 1)]
+
+
+# Function to compute the statistics of a series of timings.
+def summarize (timings, operations=None):
+    """
+    Returns the latency percentiles (ms), the mean, the throughput and the current peak RSS of a
+    series of timings in seconds. `operations` is the number of operations covered, if it is not
+    one per timing (e.g. a bulk import).
+    """
+    timings = sorted(timings)
+
+    def percentile (p):
+        return timings[min(len(timings) - 1, int(round(p / 100 * (len(timings) - 1))))] * 1000
+
+    total = sum(timings)
+    return {"samples": len(timings),
+            "p50_ms": percentile(50), "p90_ms": percentile(90), "p99_ms": percentile(99),
+            "mean_ms": total / len(timings) * 1000,
+            "ops_per_s": (operations or len(timings)) / total if total else 0.0,
+            "peak_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss}
+
+
+# Function to time a function several times.
+def measure (function, repeat):
+    """ Calls `function(i)` for i in range(repeat) and returns the list of durations in seconds. """
+    timings = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        function(i)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+# Function to benchmark one collection size.
+def run_size (size, operations):
+    """ Seeds an in-memory `vehicle_server` with `size` synthetic cars and measures every hot path against it. """
+    records = synthetic_vehicles(size)
+    server = vehicle_server.VehicleServer(address=("127.0.0.1", 0), data={"vehicles": records}, quiet=True).start()
+    address, port = "http://127.0.0.1", server.server_address[1]
+    vm._clients.pop((address, port, "vehicles"), None)
+    client = vm.get_client(address, port, "vehicles")
+    passes = 3 if size > 100000 else 5
+    results = {}
+    ids = [record["id"] for record in records]
+    generator = random.Random(size)
+    new_cars = synthetic_vehicles(operations, seed=1)
+    for number, car in enumerate(new_cars):
+        car["id"] = str(size + 1 + number)
+
+    def full_fetch (i):
+        vm.invalidate_cache(address, port, "vehicles")
+        vm.load_collection(address, port, "vehicles")
+
+    def revalidate (i):
+        vm.load_collection(address, port, "vehicles")
+
+    def decode (i):
+        json.loads(body)
+
+    def stream (i):
+        for _ in vm.stream_cars(address, port, "vehicles"):
+            pass
+
+    def render (i):
+        with open(os.devnull, "w") as out:
+            vm.render_rows(records, "table", out, widths=vm.COLUMN_WIDTHS)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        body = server.collection("vehicles")[0]
+        results["list_full_fetch"] = summarize(measure(full_fetch, passes))
+        results["list_revalidate"] = summarize(measure(revalidate, passes))
+        results["json_decode"] = summarize(measure(decode, passes))
+        results["list_stream"] = summarize(measure(stream, passes))
+        results["render_table"] = summarize(measure(render, passes))
+        results["page"] = summarize(measure(
+            lambda i: vm.fetch_page(address, port, "vehicles", generator.randint(1, max(1, size // 20)), 20), operations))
+        results["lookup"] = summarize(measure(
+            lambda i: client.get(generator.choice(ids)), operations))
+        results["add"] = summarize(measure(lambda i: client.post(new_cars[i]), operations))
+        results["update"] = summarize(measure(
+            lambda i: client.put(new_cars[i]["id"], dict(new_cars[i], model="Z1")), operations))
+        results["delete"] = summarize(measure(lambda i: client.delete(new_cars[i]["id"]), operations))
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "bulk.jsonl")
+            # Ids after those of `new_cars`, so every record is a new car and not a rejected duplicate.
+            bulk_cars = synthetic_vehicles(operations * 10, seed=2)
+            with open(path, "w") as file:
+                for number, car in enumerate(bulk_cars):
+                    car["id"] = str(size + operations + 1 + number)
+                    file.write(json.dumps(car) + "\n")
+            results["bulk_import"] = summarize(measure(
+                lambda i: vm.import_cars(client, path, workers=8, batch_size=500), 1), operations * 10)
+
+        batch = [{"op": "get", "id": generator.choice(ids)} for _ in range(operations)]
+        results["bulk_batch"] = summarize(measure(
+            lambda i: vm.run_batch(client, batch, io.StringIO()), 1), operations)
+    server.stop()
+    client.close()
+    return results
+
+
+# Startup cases of the command line tool: none of them reaches the network.
+STARTUP_CASES = {
+    "help": ["--help"],
+    "subcommand_help": ["list", "--help"],
+    "usage_error": ["get"],
+    "invalid_port": ["http://localhost", "99999"],
+}
+# The p50 wall time a startup case should add to a bare interpreter (flagged, not failed), and the 
+# modules it must not import.
+STARTUP_TARGET_MS = 40.0
+STARTUP_FORBIDDEN = ("requests", "urllib3", "sqlite3", "concurrent.futures")
+
+
+def run_python (arguments, importtime=False):
+    """
+    Runs a fresh interpreter. With `importtime`, returns {module: (cumulative import time in ms, 
+    True for a module imported at the top level)} for every module it loaded.
+    """
+    process = subprocess.run([sys.executable] + (["-X", "importtime"] if importtime else []) + arguments,
+                             stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    modules = {}
+    for line in process.stderr.splitlines():
+        if line.startswith("import time:") and line.count("|") == 2:
+            _, cumulative, name = line.split("|")
+            if cumulative.strip().isdigit():
+                # Nested imports are indented, their time is part of the module that imported them.
+                modules[name.strip()] = (int(cumulative) / 1000, not name.startswith("  "))
+    return modules
+
+
+# Function to measure the startup time of the command line tool.
+def measure_startup (runs):
+    """
+    Runs a bare interpreter and every case of `STARTUP_CASES` `runs` times. Returns, for each case, 
+    the wall time summary, the time it adds to the bare interpreter ("overhead_ms", p50), the 
+    import time of the modules the bare interpreter does not load and the forbidden modules loaded.
+    """
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "vintage_car_db.py")
+    baseline = summarize(measure(lambda i: run_python(["-c", "pass"]), runs))
+    bare_modules = run_python(["-c", "pass"], importtime=True)
+    results = {"bare_interpreter": baseline}
+    for name, arguments in STARTUP_CASES.items():
+        result = summarize(measure(lambda i: run_python([script] + arguments), runs))
+        modules = run_python([script] + arguments, importtime=True)
+        result["overhead_ms"] = round(result["p50_ms"] - baseline["p50_ms"], 3)
+        result["import_ms"] = round(sum(time for module, (time, top_level) in modules.items()
+                                        if top_level and module not in bare_modules), 3)
+        result["forbidden"] = [module for module in STARTUP_FORBIDDEN if module in modules]
+        results[name] = result
+    return results
+
+
+# Function to compare two result files.
+def compare (old, new, threshold):
+    """ Prints the change of the p50 latency of every operation and returns the list of regressions. """
+    regressions = []
+    for size, operations in new["sizes"].items():
+        for name, result in operations.items():
+            before = old.get("sizes", {}).get(size, {}).get(name)
+            if not before or not before["p50_ms"]:
+                continue
+            change = (result["p50_ms"] - before["p50_ms"]) / before["p50_ms"] * 100
+            flag = ""
+            if change > threshold:
+                flag = "  <-- regression"
+                regressions.append((size, name, change))
+            print (f"{size:>9} {name:<18} {before['p50_ms']:10.2f} ms -> {result['p50_ms']:10.2f} ms  {change:+7.1f}%{flag}")
+    return regressions
+
+
+def main (argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark vehicle_module against a local stand-in server.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 100000, 1000000],
+                        help="collection sizes to benchmark (default: 1000 100000 1000000)")
+    parser.add_argument("--ops", type=int, default=200, help="operations per lookup/add/update/delete measurement (default: 200)")
+    parser.add_argument("--output", "-o", help="write the results as JSON to this file")
+    parser.add_argument("--compare", metavar="FILE", help="compare with the results of an earlier run")
+    parser.add_argument("--threshold", type=float, default=10.0, help="p50 growth in percent reported as a regression (default: 10)")
+    parser.add_argument("--startup", action="store_true",
+                        help=f"only measure the startup time of vintage_car_db.py (target: at most {STARTUP_TARGET_MS:.0f} ms "
+                             f"over a bare interpreter, without importing {', '.join(STARTUP_FORBIDDEN)})")
+    parser.add_argument("--startup-runs", type=int, default=20, help="runs of every startup case (default: 20)")
+    args = parser.parse_args(argv)
+
+    results = {"created": time.strftime("%Y-%m-%dT%H:%M:%S"), "python": sys.version.split()[0], "sizes": {}}
+    results["startup"] = measure_startup(args.startup_runs)
+    missed = []
+    print ("startup:")
+    for name, result in results["startup"].items():
+        flag = ""
+        if result.get("forbidden"):
+            flag = f"  <-- imports {', '.join(result['forbidden'])}"
+            missed.append(name)
+        elif result.get("overhead_ms", 0) > STARTUP_TARGET_MS:
+            flag = f"  <-- over the {STARTUP_TARGET_MS:.0f} ms target"
+        extra = f"  +{result['overhead_ms']:7.2f} ms  imports {result['import_ms']:7.2f} ms" if "overhead_ms" in result else ""
+        print (f"    {name:<18} p50 {result['p50_ms']:10.2f} ms  p99 {result['p99_ms']:10.2f} ms{extra}{flag}")
+    if args.startup:
+        args.sizes = []
+    for size in args.sizes:
+        results["sizes"][str(size)] = run_size(size, args.ops)
+        print (f"{size} vehicles:")
+        for name, result in results["sizes"][str(size)].items():
+            print (f"    {name:<18} p50 {result['p50_ms']:10.2f} ms  p99 {result['p99_ms']:10.2f} ms  "
+                   f"{result['ops_per_s']:12.1f} ops/s  peak RSS {result['peak_rss_kb'] // 1024} MB")
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
+    if args.compare:
+        with open(args.compare) as file:
+            regressions = compare(json.load(file), results, args.threshold)
+        if regressions:
+            return 1
+    return 1 if missed else 0
+
+
+if __name__ == "__main__":
+    sys.exit (main())
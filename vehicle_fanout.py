@@ -0,0 +1,215 @@
+from urllib.parse import urlsplit
+
+import vehicle_module as vm
+
+""" This module reads several vintage car databases at once, e.g. the regional catalogues kept on
+    different servers, and merges what they return.
+
+    An endpoint is written as a URL naming the server, the port and the database, optionally
+    preceded by a name used to tag the results, e.g. "eu=http://eu.example.com:3000/vehicles" or
+    "http://localhost:3001/catalogue". An endpoints file holds one endpoint per line (blank lines
+    and lines starting with # are skipped).
+
+    Every endpoint is queried in its own thread (`fan_out`), so the total time is close to the one
+    of the slowest endpoint rather than the sum of all of them. The cars are merged by id: a car
+    found in several databases is listed once, with the names of all of them in its "source"
+    field ("eu,us"); the copy of the first endpoint is kept, and the endpoints holding a different
+    copy are listed in "conflict". An endpoint that fails does not stop the others, its error is
+    returned with the results.
+
+    Example:
+        endpoints = [parse_endpoint("eu=http://localhost:3000/vehicles"), parse_endpoint("us=http://localhost:3001/vehicles")]
+        records, errors = list_all(endpoints)
+"""
+
+DEFAULT_PORT = 3000
+DEFAULT_DATABASE = "vehicles"
+
+
+# Function to read an endpoint.
+def parse_endpoint (text):
+    """
+    Parses "[name=]http://host[:port][/database]".
+
+    Returns:
+    dict: The "name" (default: host:port/database), "server_address", "port_number" and "database".
+
+    Exceptions:
+    ValueError: If the text is not an http(s) URL or the port is not valid.
+    """
+    name, separator, url = text.strip().partition("=")
+    if not separator or "://" in name:
+        name, url = None, text.strip()
+    parts = urlsplit(url)
+    if parts.scheme not in ("http", "https") or not parts.hostname:
+        raise ValueError(f"{text!r} is not an endpoint like http://host:3000/vehicles")
+    try:
+        port_number = parts.port or DEFAULT_PORT
+    except ValueError:
+        raise ValueError(f"{text!r} has an invalid port number")
+    database = parts.path.strip("/") or DEFAULT_DATABASE
+    # The host as written in the URL, so an IPv6 address keeps its brackets ("[::1]").
+    host = parts.netloc.rpartition("@")[2]
+    if parts.port is not None:
+        host = host[:host.rindex(":")]
+    return {"name": name or f"{host}:{port_number}/{database}",
+            "server_address": f"{parts.scheme}://{host}",
+            "port_number": port_number,
+            "database": database}
+
+
+# Function to read an endpoints file.
+def read_endpoints (path):
+    """
+    Returns the endpoints of a file with one endpoint per line.
+
+    Exceptions:
+    ValueError: If a line is not a valid endpoint (the message gives its number).
+    """
+    endpoints = []
+    with open(path, encoding="utf-8") as file:
+        for number, line in enumerate(file, 1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            try:
+                endpoints.append(parse_endpoint(line))
+            except ValueError as e:
+                raise ValueError(f"line {number}: {e}")
+    return endpoints
+
+
+# Function to check a list of endpoints.
+def check_endpoints (endpoints):
+    """ Raises ValueError if two endpoints have the same name, since their results could not be told apart. """
+    names = set()
+    for endpoint in endpoints:
+        if endpoint["name"] in names:
+            raise ValueError(f"the endpoint name {endpoint['name']!r} is used twice")
+        names.add(endpoint["name"])
+
+
+# Function to run a function on every endpoint at the same time.
+def fan_out (endpoints, function, workers=None):
+    """
+    Calls `function(endpoint)` for every endpoint, each in its own thread.
+
+    Parameters:
+    endpoints (list): The endpoints of `parse_endpoint`.
+    function (callable): Called with one endpoint; its exceptions are caught.
+    workers (int or None): The number of threads (default: one per endpoint).
+
+    Returns:
+    list: One (endpoint, result, error) tuple per endpoint, in the order of `endpoints`; `error` is
+          None or a message, and `result` is None when there is an error.
+    """
+    # Imported here: only the fan-out needs threads.
+    from concurrent.futures import ThreadPoolExecutor
+
+    def call (endpoint):
+        try:
+            return endpoint, function(endpoint), None
+        except vm.requests.HTTPError as e:
+            status = f" (HTTP {e.response.status_code})" if e.response is not None else ""
+            return endpoint, None, f"server error{status}"
+        except vm.requests.RequestException as e:
+            return endpoint, None, f"communication error ({e.__class__.__name__})"
+        except (ValueError, KeyError) as e:
+            return endpoint, None, f"invalid reply ({e.__class__.__name__})"
+
+    if not endpoints:
+        return []
+    with ThreadPoolExecutor(max_workers=workers or len(endpoints)) as pool:
+        return list(pool.map(call, endpoints))
+
+
+# Function to merge the cars of several endpoints.
+def merge_records (results):
+    """
+    Merges the car lists of `fan_out` by id, in the order of the endpoints and of their cars.
+
+    Returns:
+    list: The cars, each with a "source" field naming the endpoints that hold it and, when some of
+          them hold a different copy, a "conflict" list with their names.
+    """
+    merged = {}
+    for endpoint, records, error in results:
+        for record in records or ():
+            cid = str(record.get("id"))
+            kept = merged.get(cid)
+            if kept is None:
+                merged[cid] = dict(record, source=endpoint["name"])
+                continue
+            kept["source"] += "," + endpoint["name"]
+            if {key: value for key, value in kept.items() if key not in ("source", "conflict")} != record:
+                kept.setdefault("conflict", []).append(endpoint["name"])
+    return list(merged.values())
+
+
+def _errors (results):
+    return {endpoint["name"]: error for endpoint, result, error in results if error is not None}
+
+
+# Function to fetch the cars of one endpoint.
+def fetch_cars (endpoint):
+    """
+    Returns the list of cars of one endpoint, streamed and decoded while they arrive.
+
+    Exceptions:
+    requests.RequestException: If there is a communication error or the server does not reply with 200 OK.
+    ValueError: If the server sends an invalid car list.
+    """
+    client = vm.get_client(endpoint["server_address"], endpoint["port_number"], endpoint["database"])
+    with client.get(stream=True) as reply:
+        reply.raise_for_status()
+        return list(vm.iter_json_array(reply.iter_content(65536)))
+
+
+# Function to list the cars of every endpoint.
+def list_all (endpoints):
+    """ Returns (cars, errors): the merged cars of every endpoint (see `merge_records`) and {name: error message}. """
+    results = fan_out(endpoints, fetch_cars)
+    return merge_records(results), _errors(results)
+
+
+# Function to find one car in every endpoint.
+def get_all (endpoints, cid):
+    """ Returns (cars, errors): the copies of car `cid` merged like `merge_records`, and {name: error message}. """
+    def get (endpoint):
+        client = vm.get_client(endpoint["server_address"], endpoint["port_number"], endpoint["database"])
+        reply = client.get(cid)
+        if reply.status_code == vm.requests.codes.not_found:
+            return []
+        reply.raise_for_status()
+        return [reply.json()]
+
+    results = fan_out(endpoints, get)
+    return merge_records(results), _errors(results)
+
+
+# Function to search every endpoint.
+def search_all (endpoints, query, limit=10):
+    """
+    Searches the brand and model of the cars of every endpoint (see `VehicleStore.search`) and
+    ranks the hits of all of them together; a car found in several databases keeps its best score.
+
+    Returns:
+    tuple: ([{"score", "car"}], errors), the best first, with the "source" of every car as in
+           `merge_records`, and {name: error message}.
+    """
+    def search (endpoint):
+        store = vm.load_collection(endpoint["server_address"], endpoint["port_number"], endpoint["database"])
+        if store is None:
+            raise vm.requests.HTTPError("the collection could not be fetched")
+        return store.search(query, limit)
+
+    results = fan_out(endpoints, search)
+    scores = {}
+    for endpoint, hits, error in results:
+        for record, score in hits or ():
+            cid = str(record.get("id"))
+            scores[cid] = max(scores.get(cid, 0), score)
+    cars = merge_records([(endpoint, [record for record, score in hits or ()], error)
+                          for endpoint, hits, error in results])
+    ranked = sorted(cars, key=lambda car: -scores[str(car.get("id"))])
+    return [{"score": round(scores[str(car.get("id"))], 3), "car": car} for car in ranked[:limit]], _errors(results)
@@ -1,9 +1,464 @@
-import requests
+import codecs
+import csv
+import hashlib
+import importlib.util
+import io
+import itertools
 import json
+import os
+import shutil
+import sys
+import threading
+import time
+
+import vehicle_record
+import vehicle_resilience
+import vehicle_search
+import vehicle_snapshot
+import vehicle_stats
 
 """ This module comprises of all the functions to manage small database that gathers data 
     about the vintage cars. 
 """
+
+
+# Function to defer the import of a heavy module.
+def lazy_import (name):
+    """
+    Returns the module `name` without running it: the module is loaded on its first attribute 
+    access. Used for `requests` (which pulls in urllib3, charset detection and certifi), so that 
+    `--help`, usage errors and other paths that never reach the network start quickly.
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
+
+
+requests = lazy_import("requests")
+
+# Client that owns the HTTP connection pool used by every database operation.
+class VehicleClient:
+    """
+    Wraps the server address, port number and database of the vehicle collection together with 
+    a pooled, keep-alive `requests.Session`, so that many operations reuse the same connection 
+    instead of opening a new one each time.
+
+    Every request has connect and read timeouts and goes through the resilience layer of 
+    `vehicle_resilience`: failed attempts are retried with jittered exponential backoff when that 
+    is safe for the method, and after `failure_threshold` consecutive failures the circuit opens, 
+    so calls fail at once (with `requests.ConnectionError`) instead of waiting for the timeouts, 
+    until a trial call or the health probe finds the server back. Bulk jobs pass `circuit_wait` 
+    to wait for the trial call instead.
+
+    Parameters:
+    - server_address (str): The address of the server, e.g. "http://localhost".
+    - port_number (int): The port number of the server (default: 3000).
+    - database (str): The name of the database (default: "vehicles").
+    - pool_size (int): The number of connections kept open in the pool.
+    - retries (int): How many times a failed request is retried (see `vehicle_resilience.RetryPolicy`).
+    - backoff_factor (float): The base of the exponential backoff between retries, in seconds.
+    - backoff_max (float): The longest wait between two attempts, in seconds.
+    - connect_timeout (float): Seconds to wait for the connection to be established.
+    - read_timeout (float): Seconds to wait for the server to send data.
+    - failure_threshold (int): The consecutive failures that open the circuit.
+    - reset_timeout (float): The seconds the circuit stays open before a trial call.
+    """
+    def __init__ (self, server_address, port_number=3000, database="vehicles", pool_size=10,
+                  retries=3, backoff_factor=0.3, backoff_max=10.0, connect_timeout=3.05, read_timeout=30,
+                  failure_threshold=5, reset_timeout=30.0):
+        self.server_address = server_address
+        self.port_number = port_number
+        self.database = database
+        self.timeout = (connect_timeout, read_timeout)
+        self.retry = vehicle_resilience.RetryPolicy(retries, backoff_factor, backoff_max)
+        self.breaker = vehicle_resilience.CircuitBreaker(failure_threshold, reset_timeout)
+        self.health = None
+        from requests.adapters import HTTPAdapter
+        # Retries are made by `request`, which knows whether an attempt reached the server.
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def url (self, cid=None):
+        """ Returns the URL of the collection, or of a single car when `cid` is given. """
+        base = f"{self.server_address}:{self.port_number}/{self.database}"
+        return base if cid is None else f"{base}/{cid}"
+
+    def request (self, method, cid=None, circuit_wait=0, **kwargs):
+        """ 
+        Sends a request through the pooled session, applying the default timeouts, the retry policy 
+        and the circuit breaker. While the circuit is open, the request waits up to `circuit_wait` 
+        seconds for the trial call of the half-open circuit (its own, or the one of another thread) 
+        before it is refused.
+
+        While `vehicle_stats` is enabled, the total time, the time to first byte, the transfer time 
+        (for replies that are not streamed), the payload sizes and the retries are recorded.
+
+        Exceptions:
+        requests.RequestException: If the last attempt failed, or (`requests.ConnectionError`) while 
+                                   the circuit is still open after `circuit_wait` seconds.
+        """
+        kwargs.setdefault("timeout", self.timeout)
+        deadline = time.monotonic() + circuit_wait
+        attempt = 0
+        while True:
+            if not self.breaker.allow():
+                left = deadline - time.monotonic()
+                if left <= 0:
+                    raise requests.ConnectionError(f"{self.url()} is not responding; next attempt in "
+                                                   f"{self.breaker.retry_in():.0f} s (circuit open)")
+                # Half-open: another thread is making the trial call, so its outcome is polled.
+                time.sleep(min(left, self.breaker.retry_in() or 0.05))
+                continue
+            try:
+                reply = self._send(method, cid, kwargs)
+            except requests.RequestException as e:
+                self.breaker.failure()
+                if not self.retry.should_retry(method, kwargs.get("headers"), attempt, sent=not request_not_sent(e)):
+                    raise
+                wait = self.retry.delay(attempt)
+            else:
+                status = reply.status_code
+                if status >= 500 or status in vehicle_resilience.RETRY_STATUSES:
+                    self.breaker.failure()
+                else:
+                    self.breaker.success()
+                if not self.retry.should_retry(method, kwargs.get("headers"), attempt, status=status):
+                    if vehicle_stats.is_enabled():
+                        vehicle_stats.record("retries", attempt, method=method, target="collection" if cid is None else "item")
+                    return reply
+                wait = self.retry.delay(attempt, reply.headers.get("Retry-After"))
+                reply.close()
+            time.sleep(wait)
+            attempt += 1
+
+    def _send (self, method, cid, kwargs):
+        # One attempt, measured while `vehicle_stats` is enabled.
+        if not vehicle_stats.is_enabled():
+            return self.session.request(method, self.url(cid), **kwargs)
+        start = time.perf_counter()
+        reply = self.session.request(method, self.url(cid), **kwargs)
+        duration = time.perf_counter() - start
+        labels = {"method": method, "target": "collection" if cid is None else "item"}
+        vehicle_stats.record("request_seconds", duration, status=reply.status_code, **labels)
+        # `elapsed` stops when the headers are parsed, so it covers connection and server time.
+        vehicle_stats.record("ttfb_seconds", reply.elapsed.total_seconds(), **labels)
+        if not kwargs.get("stream"):
+            vehicle_stats.record("transfer_seconds", max(0.0, duration - reply.elapsed.total_seconds()), **labels)
+            vehicle_stats.record("response_bytes", len(reply.content), **labels)
+        body = reply.request.body
+        if body:
+            vehicle_stats.record("request_bytes", len(body), **labels)
+        return reply
+
+    def probe (self):
+        """ 
+        Checks the server with one HEAD request on the collection (no retries, short timeouts) and 
+        reports the outcome to the circuit breaker. Returns True if the server replied 200 OK.
+        """
+        try:
+            reply = self.session.head(self.url(), timeout=(self.timeout[0], min(self.timeout[1], 5)))
+        except requests.RequestException:
+            self.breaker.failure()
+            return False
+        if reply.status_code >= 500:
+            self.breaker.failure()
+        else:
+            self.breaker.success()
+        return reply.status_code == requests.codes.ok
+
+    def start_health_probe (self, interval=5.0):
+        """ Starts probing the server every `interval` seconds in the background (see `is_available`). """
+        if self.health is None:
+            self.health = vehicle_resilience.HealthProbe(self.probe, interval).start()
+        return self.health
+
+    def wait_available (self):
+        """ 
+        Probes the server again up to `retries` times, with the backoff of the retry policy, so one 
+        transient failure is not taken for a server that is down. Returns True once it replies.
+        """
+        for attempt in range(self.retry.retries):
+            time.sleep(self.retry.delay(attempt))
+            if self.probe():
+                return True
+        return False
+
+    def is_available (self):
+        """ 
+        Tells if the server answers for the database. Uses the last result of the health probe when 
+        it is running, is False at once while the circuit is open, and otherwise probes the server.
+        """
+        status = self.health.status() if self.health is not None else None
+        if status is not None:
+            return status
+        if self.breaker.state == "open" and not self.breaker.allow():
+            return False
+        return self.probe()
+
+    def get (self, cid=None, **kwargs):
+        return self.request("GET", cid, **kwargs)
+
+    def head (self, cid=None, **kwargs):
+        return self.request("HEAD", cid, **kwargs)
+
+    def post (self, data, **kwargs):
+        return self.request("POST", json=data, **kwargs)
+
+    def put (self, cid, data, **kwargs):
+        return self.request("PUT", cid, json=data, **kwargs)
+
+    def patch (self, cid, data, **kwargs):
+        return self.request("PATCH", cid, json=data, **kwargs)
+
+    def delete (self, cid, **kwargs):
+        return self.request("DELETE", cid, **kwargs)
+
+    def close (self):
+        """ Stops the health probe and closes every pooled connection. """
+        if self.health is not None:
+            self.health.stop()
+            self.health = None
+        self.session.close()
+
+
+# Function to tell if a failed request never reached the server.
+def request_not_sent (error):
+    """ Returns True for errors raised before the request was sent (connection refused, unknown host, connect timeout). """
+    if isinstance(error, requests.ConnectTimeout):
+        return True
+    from urllib3.exceptions import NewConnectionError
+    reason = getattr(error.args[0], "reason", None) if error.args else None
+    return isinstance(error, requests.ConnectionError) and isinstance(reason, NewConnectionError)
+
+
+# Clients shared by the module functions, keyed by (server_address, port_number, database).
+_clients = {}
+# Options of every new client (e.g. the timeouts given on the command line), see `VehicleClient`.
+CLIENT_DEFAULTS = {}
+
+
+# Function to get the shared client of a database.
+def get_client (server_address, port_number, database, **options):
+    """ 
+    Returns the shared `VehicleClient` of the given database, creating it on first use. 
+    The keyword `options` (on top of `CLIENT_DEFAULTS`) are passed to `VehicleClient` when the client is created.
+    """
+    key = (server_address, port_number, database)
+    if key not in _clients:
+        _clients[key] = VehicleClient(server_address, port_number, database, **dict(CLIENT_DEFAULTS, **options))
+    return _clients[key]
+
+
+# Compact, indexed in-memory copy of the collection.
+class VehicleStore:
+    """
+    Holds car records column by column, with a hash index on `id` and secondary indexes.
+
+    Every field of `COLUMNS` is kept in its own list (brand and model strings are interned, so 
+    repeated values are stored once) and fields outside `COLUMNS` go to a sparse dictionary. 
+    The `id` index maps each id to its row, so existence checks and lookups take constant time 
+    instead of scanning the collection. The secondary indexes map each value of an indexed 
+    column to the set of rows holding it, and are used by `find`. The search index over brand 
+    and model (`vehicle_search.SearchIndex`) is built by the first `search` and then kept up to 
+    date by `add`, `update` and `remove`.
+
+    Ids are compared as strings, so 1234 and "1234" are the same car.
+
+    Parameters:
+    - records (iterable): The car records (dictionaries) to load.
+    - indexes (tuple): The columns that get a secondary index.
+    """
+    INDEXED = ("brand", "model", "production_year", "convertible")
+
+    def __init__ (self, records=(), indexes=INDEXED):
+        self._columns = {name: [] for name in COLUMNS}
+        self._extra = {}
+        self._rows = {}
+        self._indexes = {name: {} for name in indexes}
+        self._search = None
+        for record in records:
+            self.add(record)
+
+    def __len__ (self):
+        return len(self._rows)
+
+    def __contains__ (self, cid):
+        return str(cid) in self._rows
+
+    def __iter__ (self):
+        for row in range(len(self._rows)):
+            yield self._record(row)
+
+    def _record (self, row):
+        record = {name: column[row] for name, column in self._columns.items()}
+        record.update(self._extra.get(row, ()))
+        return record
+
+    def _index (self, row, record, add):
+        for name, index in self._indexes.items():
+            value = record.get(name)
+            if add:
+                index.setdefault(value, set()).add(row)
+            else:
+                rows = index[value]
+                rows.discard(row)
+                if not rows:
+                    del index[value]
+
+    def _write (self, row, record):
+        for name, column in self._columns.items():
+            value = record.get(name)
+            column[row] = sys.intern(value) if name in ("brand", "model") and isinstance(value, str) else value
+        extra = {key: value for key, value in record.items() if key not in self._columns}
+        if extra:
+            self._extra[row] = extra
+        else:
+            self._extra.pop(row, None)
+
+    def get (self, cid):
+        """ Returns the record of the car with the given id, or None. """
+        row = self._rows.get(str(cid))
+        return None if row is None else self._record(row)
+
+    def add (self, record):
+        """ Adds a record. Returns False (and changes nothing) if its id is already stored. """
+        cid = str(record.get("id"))
+        if cid in self._rows:
+            return False
+        row = len(self._rows)
+        for column in self._columns.values():
+            column.append(None)
+        self._write(row, record)
+        self._rows[cid] = row
+        self._index(row, record, True)
+        if self._search is not None:
+            self._search.add(record)
+        return True
+
+    def update (self, cid, record):
+        """ Replaces the record of the car with the given id. Returns False if the id is not stored. """
+        row = self._rows.get(str(cid))
+        if row is None:
+            return False
+        self._index(row, self._record(row), False)
+        record = dict(record, id=self._columns["id"][row])
+        self._write(row, record)
+        self._index(row, record, True)
+        if self._search is not None:
+            self._search.update(record)
+        return True
+
+    def remove (self, cid):
+        """ Removes the car with the given id. Returns False if the id is not stored. """
+        row = self._rows.pop(str(cid), None)
+        if row is None:
+            return False
+        self._index(row, self._record(row), False)
+        if self._search is not None:
+            self._search.remove(cid)
+        last = len(self._rows)
+        if row != last:
+            # Move the last row into the hole, so the columns stay dense.
+            moved = self._record(last)
+            self._index(last, moved, False)
+            self._write(row, moved)
+            self._rows[str(moved["id"])] = row
+            self._index(row, moved, True)
+        for column in self._columns.values():
+            column.pop()
+        self._extra.pop(last, None)
+        return True
+
+    def upsert (self, record):
+        """ Adds the record, or replaces the stored car with the same id. """
+        if not self.update(record.get("id"), record):
+            self.add(record)
+
+    def ids (self):
+        """ Returns the stored ids (as strings). """
+        return list(self._rows)
+
+    def find (self, **criteria):
+        """
+        Returns the records whose fields equal all the given values, e.g. `find(brand="BMW", convertible=True)`.
+        Indexed columns are answered from their indexes, the others by checking the remaining rows.
+        """
+        rows = None
+        for name, value in criteria.items():
+            if name in self._indexes:
+                matches = self._indexes[name].get(value, set())
+                rows = matches if rows is None else rows & matches
+        if rows is None:
+            rows = range(len(self._rows))
+        records = (self._record(row) for row in sorted(rows))
+        return [record for record in records if all(record.get(name) == value for name, value in criteria.items())]
+
+    def matching (self, filters):
+        """
+        Returns the records matching json-server style filters (see `fetch_page`): plain fields such 
+        as `brand=BMW` or `convertible=true` are answered by `find` from the indexes, and the 
+        `_gte`/`_lte` bounds are checked on the records it returns.
+        """
+        criteria = {}
+        bounds = []
+        for key, value in filters.items():
+            name, _, bound = key.rpartition("_")
+            if bound in ("gte", "lte") and name in self._columns:
+                bounds.append((name, bound, int(value) if str(value).isdigit() else value))
+            elif key == "convertible" and value in ("true", "false"):
+                criteria[key] = value == "true"
+            elif key == "production_year" and str(value).isdigit():
+                criteria[key] = int(value)
+            else:
+                criteria[key] = value
+
+        def within (record):
+            for name, bound, limit in bounds:
+                value = record.get(name)
+                try:
+                    if value is None or (value < limit if bound == "gte" else value > limit):
+                        return False
+                except TypeError:
+                    return False
+            return True
+
+        return [record for record in self.find(**criteria) if within(record)]
+
+    def search (self, query, limit=10):
+        """
+        Returns the cars whose brand and model best match a free-text query, as [(record, score)], 
+        the best first (see `vehicle_search.SearchIndex.search`). The index is built on the first call.
+        """
+        with vehicle_stats.timer("search_seconds"):
+            if self._search is None:
+                self._search = vehicle_search.SearchIndex(self)
+            return [(self.get(cid), score) for cid, score in self._search.search(query, limit)]
+
+    def duplicate_ids (self, records):
+        """ 
+        Returns the ids of `records` that are already stored or appear more than once among them. 
+        Records without an id (assigned by the server) are never duplicates.
+        """
+        seen = set()
+        duplicates = []
+        for record in records:
+            if record.get("id") is None:
+                continue
+            cid = str(record.get("id"))
+            if cid in self._rows or cid in seen:
+                duplicates.append(record.get("id"))
+            seen.add(cid)
+        return duplicates
+
+
 # Funtion to print menu.
 def print_menu ():
     """ This function prints the header and the menu of the application"""
@@ -18,25 +473,403 @@ def print_menu ():
     print ("2. Add new car")
     print ("3. Delete car")
     print ("4. Update car")
+    print ("5. Search cars")
     print ("0. Exit")
 
 
 # Function to take user input for menu and validate it.
 def read_user_choice ():
-    """ This function prompts the user to enter an integer between 0 and 4 and 
+    """ This function prompts the user to enter an integer between 0 and 5 and 
         validates the input to ensure it falls within this range. It returns the integer in string form. """
     try:
-        choice = int(input("Enter your choice (0..4): "))
-        if choice not in (list(range(0, 5))):
+        choice = int(input("Enter your choice (0..5): "))
+        if choice not in (list(range(0, 6))):
             raise ValueError
     except ValueError:
-        print ("Please enter a number 0..4")
+        print ("Please enter a number 0..5")
         read_user_choice ()   
     else:
         print(f'You entered {choice}.')
         return str (choice)
 
 
+# Client-side cache of fetched collections, keyed by the collection URL. Each entry keeps the
+# vehicle data together with the validators (ETag, Last-Modified) the server sent, or a digest of
+# the collection when it sent none.
+_collection_cache = {}
+
+
+# Function to build the collection URL.
+def collection_url (server_address, port_number, database):
+    """ Returns the URL of the collection, which is also the key of its cache entry. """
+    return f"{server_address}:{port_number}/{database}"
+
+
+# Function to drop a cached collection.
+def invalidate_cache (server_address, port_number, database):
+    """ 
+    Removes the cached copy of the collection so that the next call of `load_collection` 
+    downloads it again in full.
+    """
+    _collection_cache.pop(collection_url(server_address, port_number, database), None)
+
+
+# Function to patch the cached collection after a successful write.
+def patch_cache (server_address, port_number, database, cid, record=None):
+    """ 
+    Applies a successful write to the cached collection so it stays usable without a refetch.
+
+    Parameters:
+    - cid (str): The id of the car that was written.
+    - record (dict or None): The new content of the car. None means the car was deleted.
+
+    The validators are left untouched, so the next revalidation still sees that the server 
+    content has changed and fetches the collection once.
+    """
+    entry = _collection_cache.get(collection_url(server_address, port_number, database))
+    if entry is None or cid is None:
+        return
+    store = entry["data"]
+    # The digest no longer describes the patched copy.
+    entry["digest"] = None
+    if record is None:
+        store.remove(cid)
+    elif cid in store:
+        store.update(cid, record)
+    else:
+        store.add(dict(record, id=cid))
+
+
+# How a cached collection is brought up to date: "auto" picks the best protocol the server supports, 
+# "changes", "updated_at" and "slices" force one of them, and "full" revalidates the whole collection.
+SYNC_MODE = "auto"
+# Number of leading id digits that define a slice, and the collection size below which slices are not used.
+SLICE_DIGITS = 2
+SLICE_MIN_SIZE = 10000
+
+
+# Function to find the slice of an id.
+def id_slice (cid, digits=SLICE_DIGITS):
+    """ 
+    Returns the name of the id-partitioned slice holding `cid`: its first `digits` digits, 
+    "short" for shorter ids, or "other" for ids that do not start with digits.
+    """
+    cid = str(cid)
+    if len(cid) < digits:
+        return "short"
+    return cid[:digits] if cid[:digits].isdigit() else "other"
+
+
+# Function to list the slices.
+def slice_names (digits=SLICE_DIGITS):
+    """ Returns the names of every id-partitioned slice (see `id_slice`). """
+    return ["short", "other"] + [str(number).zfill(digits) for number in range(10 ** digits)]
+
+
+# Function to build the query of one slice.
+def slice_query (name, digits=SLICE_DIGITS):
+    """ Returns the json-server `id_like` filter that selects the cars of a slice. """
+    if name == "short":
+        return {"id_like": f"^.{{0,{digits - 1}}}$"}
+    if name == "other":
+        return {"id_like": f"^(?!\\d{{{digits}}}).{{{digits},}}"}
+    return {"id_like": f"^{name}"}
+
+
+# Function to decide how a collection will be synchronised.
+def start_sync (client, mode=None):
+    """
+    Prepares the synchronisation state of a collection that is about to be fetched in full.
+
+    The change feed (GET /{database}/_changes) is probed before the full fetch, so no change made 
+    during the fetch can be missed. `finish_sync` completes the state once the records are known.
+
+    Returns:
+    dict: The synchronisation state, with its "mode".
+    """
+    mode = mode or SYNC_MODE
+    if mode in ("auto", "changes"):
+        try:
+            reply = client.get("_changes", params={"since": 0, "limit": 0})
+            if reply.status_code == requests.codes.ok:
+                return {"mode": "changes", "seq": decode_json(reply)["seq"]}
+        except (requests.RequestException, ValueError, KeyError, TypeError):
+            pass
+    return {"mode": "full" if mode == "changes" else mode}
+
+
+def finish_sync (state, count, hwm=None, tombstones=0, etag=None):
+    """
+    Completes the state of `start_sync` once the full fetch is done.
+
+    Parameters:
+    state (dict): The state returned by `start_sync`.
+    count (int): The number of live cars fetched.
+    hwm: The largest `updated_at` of the fetched cars, or None if they carry no such field.
+    tombstones (int): The number of fetched cars marked `"deleted": true`.
+    etag (str or None): The ETag of the full collection.
+    """
+    if state["mode"] in ("auto", "updated_at"):
+        if hwm is not None:
+            state.update(mode="updated_at", hwm=hwm, tombstones=tombstones)
+            return state
+        state["mode"] = "auto" if state["mode"] == "auto" else "full"
+    if state["mode"] == "auto":
+        state["mode"] = "slices" if count >= SLICE_MIN_SIZE else "full"
+    if state["mode"] == "slices":
+        state.update(etag=etag, slices={})
+    return state
+
+
+# Function to record the slice ETags of a collection that was just fetched.
+def prime_slices (client, state):
+    """
+    Fills in the ETag of every slice after a full fetch in "slices" mode, with HEAD requests that 
+    transfer no cars, so the first `delta_sync` only downloads the slices that changed instead of 
+    all of them. The ETags are only kept if the collection still has the ETag of the full fetch 
+    afterwards, i.e. no car changed while they were read. Other modes are left as they are.
+
+    Returns:
+    dict: The state, updated.
+
+    Exceptions:
+    requests.RequestException: If there is a communication error.
+    """
+    if state["mode"] != "slices" or not state.get("etag"):
+        return state
+    etags = {}
+    for name in slice_names():
+        reply = client.head(params=slice_query(name))
+        if reply.status_code != requests.codes.ok or not reply.headers.get("ETag"):
+            return state
+        etags[name] = reply.headers["ETag"]
+    reply = client.head()
+    if reply.status_code == requests.codes.ok and reply.headers.get("ETag") == state["etag"]:
+        state["slices"] = etags
+    return state
+
+
+# Function to apply the changes of the server to a local copy.
+def delta_sync (client, target, state):
+    """
+    Brings a local copy of the collection up to date by transferring only what changed.
+
+    - "changes": reads GET /{database}/_changes?since=<seq>, a feed of {"seq", "id", "deleted", 
+      "record"} entries, and moves the high-water mark `seq` forward.
+    - "updated_at": fetches the cars with `updated_at` at or after the high-water mark; cars marked 
+      `"deleted": true` are tombstones. If the server count then differs from the local one, cars 
+      were removed without a tombstone, and the slices are compared for this round.
+    - "slices": compares the ETag of the collection (HEAD) and, if it changed, revalidates every 
+      id-partitioned slice with If-None-Match, so the server hashes the slices and only the 
+      changed ones are transferred and replaced.
+
+    Parameters:
+    client (VehicleClient): The client of the collection.
+    target: The local copy, with `upsert(record)`, `remove(cid)`, `ids()` and `len()` (e.g. a `VehicleStore`).
+    state (dict): The synchronisation state made by `start_sync` / `finish_sync`; it is updated.
+
+    Returns:
+    int or None: The number of changes applied, or None if the copy must be fetched in full.
+
+    Exceptions:
+    requests.RequestException: If there is a communication error.
+    """
+    mode = state["mode"]
+    applied = 0
+    if mode == "changes":
+        while True:
+            reply = client.get("_changes", params={"since": state["seq"]})
+            if reply.status_code != requests.codes.ok:
+                return None
+            feed = decode_json(reply)
+            for change in feed["changes"]:
+                if change.get("deleted"):
+                    target.remove(change["id"])
+                else:
+                    target.upsert(change["record"])
+                applied += 1
+            state["seq"] = feed["seq"]
+            if not feed.get("more"):
+                return applied
+    if mode == "updated_at":
+        reply = client.get(params={"updated_at_gte": state["hwm"]})
+        if reply.status_code != requests.codes.ok:
+            return None
+        for record in decode_json(reply):
+            if record.get("deleted"):
+                if target.remove(record.get("id")):
+                    state["tombstones"] += 1
+            else:
+                target.upsert(record)
+            state["hwm"] = max(state["hwm"], record["updated_at"])
+            applied += 1
+        reply = client.get(params={"_page": 1, "_limit": 1})
+        total = reply.headers.get("X-Total-Count")
+        if total is None or int(total) == len(target) + state["tombstones"]:
+            return applied
+        changed = sync_slices(client, target, state.setdefault("slices", {}))
+        if changed is None:
+            return None
+        # The server count includes the tombstones still stored there.
+        state["tombstones"] = int(total) - len(target)
+        return applied + changed
+    if mode == "slices":
+        reply = client.head()
+        if reply.status_code != requests.codes.ok:
+            return None
+        etag = reply.headers.get("ETag")
+        if etag and etag == state.get("etag"):
+            return 0
+        changed = sync_slices(client, target, state["slices"])
+        state["etag"] = etag
+        return changed
+    return None
+
+
+# Function to replace the slices that changed on the server.
+def sync_slices (client, target, etags):
+    """
+    Revalidates every id-partitioned slice with its ETag and replaces the local cars of the slices 
+    that changed: inserts, updates and removals included (cars marked `"deleted": true` count as 
+    removed). `etags` maps slice names to their last ETag and is updated.
+
+    Returns:
+    int or None: The number of slices replaced, or None on a server error.
+    """
+    local = None
+    replaced = 0
+    for name in slice_names():
+        headers = {"If-None-Match": etags[name]} if name in etags else {}
+        reply = client.get(params=slice_query(name), headers=headers)
+        if reply.status_code == requests.codes.not_modified:
+            continue
+        if reply.status_code != requests.codes.ok:
+            return None
+        records = decode_json(reply)
+        if reply.headers.get("ETag"):
+            etags[name] = reply.headers["ETag"]
+        if local is None:
+            local = {}
+            for cid in target.ids():
+                local.setdefault(id_slice(cid), []).append(cid)
+        records = [record for record in records if not record.get("deleted")]
+        fresh = {str(record.get("id")) for record in records}
+        for cid in local.get(name, []):
+            if cid not in fresh:
+                target.remove(cid)
+        for record in records:
+            target.upsert(record)
+        replaced += 1
+    return replaced
+
+
+# Function to load the collection through the cache.
+def load_collection (server_address, port_number, database):
+    """
+    Returns the collection as a `VehicleStore`, downloading it only when needed.
+
+    A cached copy is brought up to date with `delta_sync` when the server supports a change feed, 
+    `updated_at` stamps, or when the collection is large enough for id-partitioned slices (see 
+    `SYNC_MODE`), so only the changed cars are transferred. Otherwise the cached copy is revalidated 
+    with If-None-Match or If-Modified-Since, and only downloaded again when the server reports a 
+    change. If the server sends no validators, the collection is downloaded again and compared with 
+    a digest of the cached one, so it is only decoded and indexed again when its content changed.
+
+    Returns:
+    VehicleStore or None: The collection, or None if the server did not reply with 200 OK.
+
+    Exceptions:
+    requests.RequestException: If there is a communication error.
+    """
+    url = collection_url(server_address, port_number, database)
+    client = get_client(server_address, port_number, database)
+
+    def has_validators (reply):
+        return bool(reply.headers.get("ETag") or reply.headers.get("Last-Modified"))
+
+    def content_digest (reply):
+        return hashlib.blake2b(reply.content, digest_size=16).digest()
+
+    def fetch_collection ():
+        sync = start_sync(client)
+        reply = client.get()
+        if reply.status_code != requests.codes.ok:
+            return None
+        records = decode_json(reply)
+        report_invalid(vehicle_record.validate_records(records))
+        # Cars marked as deleted are tombstones left for `delta_sync`, not cars.
+        store = VehicleStore(record for record in records if not record.get("deleted"))
+        stamps = [record["updated_at"] for record in records if record.get("updated_at") is not None]
+        _collection_cache[url] = {
+            "data": store,
+            "etag": reply.headers.get("ETag"),
+            "last_modified": reply.headers.get("Last-Modified"),
+            "digest": None if has_validators(reply) else content_digest(reply),
+            "sync": prime_slices(client, finish_sync(sync, len(store), max(stamps) if stamps else None,
+                                                     len(records) - len(store), reply.headers.get("ETag"))),
+        }
+        return store
+
+    def replace_collection (reply):
+        # A full reply to a revalidation: the cached copy and its validators are replaced.
+        records = decode_json(reply)
+        report_invalid(vehicle_record.validate_records(records))
+        store = VehicleStore(record for record in records if not record.get("deleted"))
+        entry.update(data=store, etag=reply.headers.get("ETag"),
+                     last_modified=reply.headers.get("Last-Modified"),
+                     digest=None if has_validators(reply) else content_digest(reply))
+        return store
+
+    entry = _collection_cache.get(url)
+    if entry is None:
+        return fetch_collection()
+    if entry["sync"]["mode"] != "full":
+        if delta_sync(client, entry["data"], entry["sync"]) is None:
+            return fetch_collection()
+        return entry["data"]
+    headers = {}
+    if entry["etag"]:
+        headers["If-None-Match"] = entry["etag"]
+    if entry["last_modified"]:
+        headers["If-Modified-Since"] = entry["last_modified"]
+    if headers:
+        reply = client.get(headers=headers)
+        if reply.status_code == requests.codes.not_modified:
+            return entry["data"]
+        if reply.status_code != requests.codes.ok:
+            return None
+        return replace_collection(reply)
+    # No validators - download the collection again; the same size does not mean the same cars 
+    # (e.g. "Ford" renamed "Audi"), so the content itself is compared.
+    reply = client.get()
+    if reply.status_code != requests.codes.ok:
+        return None
+    if not has_validators(reply) and content_digest(reply) == entry["digest"]:
+        return entry["data"]
+    return replace_collection(reply)
+
+
+# Function to warn about the invalid cars of a download.
+def report_invalid (invalid, limit=10):
+    """ 
+    Prints one warning with the ids of the cars found by `vehicle_record.validate_records`, if any, 
+    on stderr so it never mixes with machine-readable output (JSONL, CSV).
+    """
+    if not invalid:
+        return
+    ids = ", ".join(str(item["id"]) for item in invalid[:limit])
+    more = f" and {len(invalid) - limit} more" if len(invalid) > limit else ""
+    print (f"Warning: {len(invalid)} cars in the database break the validation rules (ids {ids}{more}); "
+           f"`vintage_car_db.py validate` lists the problems.", file=sys.stderr)
+
+
+# Function to decode a JSON reply.
+def decode_json (reply):
+    """ Returns the decoded JSON body of a reply, recording the decoding time in `vehicle_stats`. """
+    with vehicle_stats.timer("json_decode_seconds"):
+        return reply.json()
+
+
 # Function to check the server 
 def check_server (server_address, port_number, database, cid=None):
     """ 
@@ -48,10 +881,17 @@ def check_server (server_address, port_number, database, cid=None):
         cid
     If a cid is provided, the function checks whether a car with the specified cid exists in 
     the database and returns a boolean result accordingly.
+
+    The data is returned as a `VehicleStore` loaded through the cache of `load_collection`, 
+    so the collection is only downloaded again when the server reports a change.
          """
     def is_server_running ():
+        # A HEAD probe first, so a server that is down is not waited for with a full download.
+        if not server_is_alive(server_address, port_number, database):
+            print ("Server is not responding.")
+            return False, None
         try: 
-            reply = requests.get(f"{server_address}:{port_number}/{database}")
+            vehicle_data = load_collection(server_address, port_number, database)
         except requests.exceptions.InvalidURL:
             print('The URL is invalid.')
             return False, None
@@ -61,21 +901,24 @@ def check_server (server_address, port_number, database, cid=None):
         except requests.exceptions.Timeout:
             print ("Connection taking longer than expected.")
             return False, None
-        except:
-            print("Error")
+        except requests.RequestException as e:
+            print (f"Communication error! ({e.__class__.__name__})")
             return False, None
-        else:
-            if reply.status_code == requests.codes.ok:
-                return True, reply.json()
+        except ValueError:
+            print ("The server sent an invalid car list.")
+            return False, None
+        if vehicle_data is None:
+            print ("Server error! The car list could not be fetched.")
+            return False, None
+        return True, vehicle_data
     
     server_running, vehicle_data = is_server_running ()
-                
 
     if server_running and cid is not None:
         print ("Server is running and cid is provided")
 
         # Check if the cid is present in the database
-        if any(vehicle.get("id") == cid for vehicle in vehicle_data):
+        if cid in vehicle_data:
             print (f'The cid {cid} is in the database.')
             return True, vehicle_data
         else:
@@ -91,6 +934,129 @@ def check_server (server_address, port_number, database, cid=None):
 
 
 
+# The columns of the car list table, in display order, and their default widths.
+COLUMNS = ['id', 'brand', 'model', 'production_year', 'convertible']
+COLUMN_WIDTHS = [10, 20, 20, 15, 10]
+
+
+# Function to build the row template of the car list table.
+def table_layout (widths=None):
+    """
+    Precomputes the template used to format every row of the car list table.
+
+    Each cell is left aligned and cut to the width of its column, so long values are truncated 
+    instead of breaking the table.
+
+    Parameters:
+    - widths (list or None): The width of each column of `COLUMNS` (default: `COLUMN_WIDTHS`).
+
+    Returns:
+    str: A `str.format` template for one row, ending with a newline.
+    """
+    widths = widths or COLUMN_WIDTHS
+    return "".join(f"{{:<{w}.{w}}}| " for w in widths) + "\n"
+
+
+# Function to build the header row of the car list table.
+def table_header (widths=None, columns=None):
+    """ Returns the header row of the car list table; column names are never truncated. """
+    return "".join(name.ljust(w) + "| " for name, w in zip(columns or COLUMNS, widths or COLUMN_WIDTHS)) + "\n"
+
+
+# Function to choose the column widths from the data and the terminal.
+def fit_widths (rows, maximum=40, columns=None):
+    """
+    Chooses the width of each column from the longest value in `rows` (at most `maximum`), then 
+    narrows the widest columns until the table fits in the terminal.
+
+    Parameters:
+    - rows (list): A sample of the car records to be shown.
+    - maximum (int): The largest width a column may get.
+    - columns (list or None): The columns shown (default: `COLUMNS`).
+
+    Returns:
+    list: The width of each column.
+    """
+    columns = columns or COLUMNS
+    widths = [len(name) for name in columns]
+    for row in rows:
+        for i, name in enumerate(columns):
+            widths[i] = max(widths[i], len(str(row.get(name))))
+    widths = [min(w, maximum) for w in widths]
+    available = shutil.get_terminal_size().columns - 2 * len(widths)
+    while sum(widths) > available and max(widths) > 4:
+        widths[widths.index(max(widths))] -= 1
+    return widths
+
+
+# Function to format a chunk of rows.
+def format_rows (rows, output_format="table", template=None, columns=None):
+    """
+    Formats a list of car records into one string, ready to be written at once.
+
+    Parameters:
+    - rows (list): The car records.
+    - output_format (str): "table", "csv" or "jsonl".
+    - template (str or None): The row template of `table_layout` used by the "table" format.
+    - columns (list or None): The columns of the "table" and "csv" formats (default: `COLUMNS`).
+
+    Returns:
+    str: The formatted rows.
+    """
+    columns = columns or COLUMNS
+    if output_format == "jsonl":
+        return "".join(json.dumps(row) + "\n" for row in rows)
+    if output_format == "csv":
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, lineterminator="\n")
+        writer.writerows([row.get(name) for name in columns] for row in rows)
+        return buffer.getvalue()
+    template = template or table_layout()
+    return "".join(template.format(*[str(row.get(name)) for name in columns]) for row in rows)
+
+
+# Function to write the car list in chunks.
+def render_rows (rows, output_format="table", out=None, chunk_size=1000, widths=None, columns=None):
+    """
+    Writes car records to `out` with one `write` call per chunk of `chunk_size` rows, instead of 
+    one print call per cell.
+
+    The layout is computed once. For the "table" format without explicit `widths`, the column 
+    widths are chosen from the first chunk and the terminal size. The "csv" format starts with 
+    a header row, the "jsonl" format writes one JSON object per line.
+
+    Parameters:
+    - rows (iterable): The car records; a generator is consumed chunk by chunk.
+    - output_format (str): "table", "csv" or "jsonl".
+    - out (file or None): Where to write the rows (default: `sys.stdout`).
+    - chunk_size (int): The number of rows formatted and written at a time.
+    - widths (list or None): The width of each table column.
+    - columns (list or None): The columns of the "table" and "csv" formats (default: `COLUMNS`, 
+                              e.g. `COLUMNS + ["source"]` for merged results of several databases).
+
+    Returns:
+    int: The number of rows written.
+    """
+    out = out or sys.stdout
+    rows = iter(rows)
+    chunk = list(itertools.islice(rows, chunk_size))
+    template = None
+    if output_format == "table":
+        widths = widths or fit_widths(chunk, columns=columns)
+        template = table_layout(widths)
+        out.write(table_header(widths, columns) + "_" * (sum(widths) + 2 * len(widths)) + "\n")
+    elif output_format == "csv":
+        out.write(",".join(columns or COLUMNS) + "\n")
+    count = 0
+    while chunk:
+        with vehicle_stats.timer("render_seconds", format=output_format):
+            out.write(format_rows(chunk, output_format, template, columns))
+        count += len(chunk)
+        chunk = list(itertools.islice(rows, chunk_size))
+    out.flush()
+    return count
+
+
 # Function to print carlist header.
 def print_header ():
     """ 
@@ -99,12 +1065,7 @@ def print_header ():
     The header displays column names ('id', 'brand', 'model', 'production_year', 'convertible') 
     aligned according to the specified widths for each column, providing a formatted table header. 
     """
-    header_names = ['id', 'brand', 'model', 'production_year', 'convertible']
-    widths = [10, 20, 20, 15, 10]
-    for n, w in zip(header_names, widths):
-        print (n.ljust(w), end = "| ")
-    print ()
-    print("__"*45)
+    sys.stdout.write(table_header() + "__" * 45 + "\n")
 
 def print_content (json):
     """ 
@@ -117,32 +1078,24 @@ def print_content (json):
     The function aligns each field according to predefined column widths, printing 
     the row in a table-like format.
     """
-    header_names = ['id', 'brand', 'model', 'production_year', 'convertible']
-    widths = [10, 20, 20, 15, 10]
-    for n, w in zip(header_names, widths):
-        print(str(json[n]).ljust(w), end = "| ")
-    print ()
+    sys.stdout.write(format_rows([json]))
 
 def print_json (elements):
     """ 
-    Prints the car list in a formatted table view by invoking `print_header` 
-    and `print_content` functions. 
+    Prints the car list in a formatted table view with `render_rows`, which writes the 
+    rows in buffered chunks.
 
     Parameters:
-    - elements (list or dict): The JSON data containing car records. If `elements` 
-                               is a list, it prints each car record in the list. 
-                               If `elements` is a dictionary, it prints a single record.
+    - elements (iterable or dict): The JSON data containing car records. If `elements` 
+                                   is a list or any other iterable (such as the generator 
+                                   returned by `stream_cars`), it prints each car record as 
+                                   it arrives. If `elements` is a dictionary, it prints a single record.
     
-    The function first prints the header, then iterates through each element 
-    to display individual car details.
+    The function first prints the header, then the car details.
     """
-    print_header()
-    if type(elements) is list:
-        for element in elements:
-            print_content(element)
-    elif type(elements) is dict:
-        if elements:
-            print_content(elements)
+    if isinstance(elements, dict):
+        elements = [elements] if elements else []
+    render_rows(elements)
 
 
 # function to print list car.
@@ -155,18 +1108,296 @@ def list_cars (vehicle_data):
     Otherwise, it calls the `print_json` function to display the car details.
 
     Parameters:
-    vehicle_data (list): A list of dictionaries, where each dictionary contains information about a car.
+    vehicle_data (iterable): A list of dictionaries, or a generator yielding them one at a time, 
+                             where each dictionary contains information about a car.
 
     Returns:
     None
     """
-    size = len([vehicle for vehicle in vehicle_data])
-    if size == 0:
+    vehicles = iter(vehicle_data)
+    first = next(vehicles, None)
+    if first is None:
         print ("*** Database is empty ***") 
     else:
-        print_json(vehicle_data)
+        print_json(itertools.chain([first], vehicles))
+
+
+# Function to parse a JSON array incrementally.
+def iter_json_array (chunks):
+    """
+    Parses a JSON array arriving in pieces and yields its elements one at a time.
+
+    Only the part of the text that has not been parsed yet is kept in memory, so memory use 
+    depends on the size of one element instead of the size of the whole array.
+
+    Parameters:
+    chunks (iterable): The UTF-8 encoded pieces (bytes) of the JSON text.
+
+    Raises:
+    ValueError: If the text is not a JSON array or is incomplete.
+    """
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder("utf-8")()
+    buffer = ""
+    position = 0
+    # The parser is expecting: "start" the opening bracket, "first" the first element or the 
+    # closing bracket, "value" an element, "separator" a comma or the closing bracket, "end" nothing.
+    state = "start"
+    for chunk in itertools.chain(chunks, [None]):
+        last = chunk is None
+        buffer += text_decoder.decode(b"" if last else chunk, final=last)
+        while True:
+            while position < len(buffer) and buffer[position].isspace():
+                position += 1
+            if position == len(buffer):
+                break
+            if state == "start":
+                if buffer[position] != "[":
+                    raise ValueError("The data is not a JSON array.")
+                position += 1
+                state = "first"
+            elif state == "first" and buffer[position] == "]":
+                position += 1
+                state = "end"
+            elif state in ("first", "value"):
+                try:
+                    element, end = decoder.raw_decode(buffer, position)
+                except json.JSONDecodeError:
+                    if last:
+                        raise
+                    break
+                # A number may continue in the next chunk (e.g. "4." then "5e3"), so a value that is not 
+                # an object, an array or a string is only complete once a comma or the closing bracket follows.
+                if not last and buffer[position] not in '{["':
+                    following = end
+                    while following < len(buffer) and buffer[following].isspace():
+                        following += 1
+                    if following == len(buffer) or buffer[following] not in ",]":
+                        break
+                yield element
+                position = end
+                state = "separator"
+            elif state == "separator":
+                if buffer[position] == ",":
+                    state = "value"
+                elif buffer[position] == "]":
+                    state = "end"
+                else:
+                    raise ValueError(f"Unexpected {buffer[position]!r} in the JSON array.")
+                position += 1
+            else:
+                raise ValueError("Unexpected data after the JSON array.")
+        buffer = buffer[position:]
+        position = 0
+    if state != "end":
+        raise ValueError("The JSON array is incomplete.")
+
+
+# Function to stream the collection from the server.
+def stream_cars (server_address, port_number, database, chunk_size=65536):
+    """
+    Downloads the collection and yields the cars one at a time while the rest is still arriving.
+
+    The reply is read with `stream=True` and parsed by `iter_json_array`, so the whole collection 
+    is never held in memory and the first cars can be printed right away.
+
+    Parameters:
+    server_address (str): The address of the server.
+    port_number (int): The port number to use for the connection.
+    database (str): The name of the database.
+    chunk_size (int): The number of bytes read from the connection at a time.
+
+    Exceptions:
+    requests.RequestException: If there is a communication error or the server does not reply with 
+                               200 OK (`requests.HTTPError`), possibly after some cars were yielded.
+    ValueError: If the server sends an invalid car list.
+    """
+    client = get_client(server_address, port_number, database)
+    with client.get(stream=True) as reply:
+        reply.raise_for_status()
+        yield from iter_json_array(reply.iter_content(chunk_size))
+
+
+# Function to probe the server.
+def server_is_alive (server_address, port_number, database):
+    """
+    Checks that the server answers for the database, without transferring car data and without 
+    blocking on a server that is known to be down (see `VehicleClient.is_available`): the last 
+    result of the background health probe when it runs, a refusal while the circuit is open, or 
+    else one HEAD request.
+
+    Returns:
+    bool: True if the server replied with 200 OK, False otherwise.
+    """
+    return get_client(server_address, port_number, database).is_available()
+
+
+# Function to fetch one page of the car list.
+def fetch_page (server_address, port_number, database, page=1, limit=20, sort=None, order="asc", filters=None):
+    """
+    Asks the server for one page of the car list, so only the cars being shown are transferred.
+
+    The query uses the json-server parameters `_page`/`_limit` for paging, `_sort`/`_order` for 
+    sorting, and plain field filters such as `brand=BMW`, `production_year_gte=1950` or `convertible=true`.
+
+    Parameters:
+    server_address (str): The address of the server.
+    port_number (int): The port number to use for the connection.
+    database (str): The name of the database.
+    page (int): The number of the page, starting from 1.
+    limit (int): The number of cars per page.
+    sort (str or None): The column to sort by, one of `COLUMNS`.
+    order (str): "asc" or "desc".
+    filters (dict or None): The field filters pushed down to the server.
+
+    Returns:
+    tuple: The list of cars of the page and the total number of matching cars (None if the server 
+           does not send an X-Total-Count header). Returns (None, None) on a communication or server error.
+    """
+    params = {"_page": page, "_limit": limit}
+    if sort:
+        params["_sort"] = sort
+        params["_order"] = order
+    params.update(filters or {})
+    try:
+        reply = get_client(server_address, port_number, database).get(params=params)
+    except requests.RequestException as e:
+        print (f"Communication error! ({e.__class__.__name__})")
+        return None, None
+    if reply.status_code != requests.codes.ok:
+        print (f"Server error! (HTTP {reply.status_code})")
+        return None, None
+    total = reply.headers.get("X-Total-Count")
+    vehicles = decode_json(reply)
+    # A server without paging support sends the whole list, show only the requested page of it. 
+    # Such a server may ignore the filters too, so they are applied here through the indexes of a 
+    # `VehicleStore`.
+    if total is None and len(vehicles) > limit:
+        if filters:
+            vehicles = VehicleStore(vehicles).matching(filters)
+        total = len(vehicles)
+        vehicles = vehicles[(page - 1) * limit:page * limit]
+    return vehicles, (int(total) if total is not None else None)
+
+
+# Function to ask the user how to sort and filter the car list.
+def enter_list_options ():
+    """
+    Prompts the user for the sort column, the sort order and the filters of the car list. 
+    Every question can be skipped with an empty answer.
+
+    Returns:
+    tuple: The sort column (or None), the order ("asc" or "desc") and the dictionary of filters.
+    """
+    sort = None
+    while True:
+        answer = input(f"Sort by ({', '.join(COLUMNS)}) or empty for none: ").strip()
+        if answer == "" or answer in COLUMNS:
+            sort = answer or None
+            break
+        print (f"The column must be one of: {', '.join(COLUMNS)}.")
+    order = "asc"
+    if sort and input("Descending order > [y/n] : ").strip().lower() == "y":
+        order = "desc"
+
+    filters = {}
+    for what in ("brand", "model"):
+        answer = input(f"Only cars of {what} (empty for all): ").strip()
+        if answer:
+            filters[what] = answer
+    for suffix, label in (("gte", "from"), ("lte", "to")):
+        while True:
+            answer = input(f"Production year {label} (empty for no limit): ").strip()
+            if answer == "" or production_year_is_valid(answer):
+                break
+            print ("Year must be fourdigit integer value from 1900 to 2000")
+        if answer:
+            filters[f"production_year_{suffix}"] = int(answer)
+    answer = input("Only convertible cars > [y/n] or empty for all : ").strip().lower()
+    if answer in ("y", "n"):
+        filters["convertible"] = "true" if answer == "y" else "false"
+    return sort, order, filters
+
+
+# Function to browse the car list page by page.
+def browse_cars (server_address, port_number, database, limit=20, source=None):
+    """
+    Shows the car list one page at a time, sorted and filtered on the server.
+
+    After each page the user can go to the next or previous page or go back to the menu.
+
+    Parameters:
+    server_address (str): The address of the server.
+    port_number (int): The port number to use for the connection.
+    database (str): The name of the database.
+    limit (int): The number of cars per page.
+    source (callable or None): A function taking (page, limit, sort, order, filters) and returning 
+                               the same as `fetch_page`, used instead of the server (e.g. 
+                               `VehicleReplica.fetch_page` when working offline).
+
+    Returns:
+    None
+    """
+    sort, order, filters = enter_list_options()
+    page = 1
+    while True:
+        if source is None:
+            vehicles, total = fetch_page(server_address, port_number, database, page, limit, sort, order, filters)
+        else:
+            vehicles, total = source(page, limit, sort, order, filters)
+        if vehicles is None:
+            return
+        if not vehicles and page == 1:
+            print ("*** No cars found ***")
+            return
+        print_json(vehicles)
+        has_next = (page * limit < total) if total is not None else len(vehicles) == limit
+        pages = f"{page} of {-(-total // limit)}" if total is not None else f"{page}"
+        print (f"Page {pages}")
+        choices = (["n = next"] if has_next else []) + (["p = previous"] if page > 1 else []) + ["q = back to menu"]
+        answer = input(f"{', '.join(choices)}: ").strip().lower()
+        if answer == "n" and has_next:
+            page += 1
+        elif answer == "p" and page > 1:
+            page -= 1
+        elif answer == "q" or answer == "":
+            return
+
+
+# Function to search cars by brand and model.
+def search_cars (server_address, port_number, database, store=None, limit=20):
+    """
+    Asks for a free-text query and shows the cars whose brand and model match it best, the best 
+    first. Prefixes and small typos match too (see `vehicle_search`).
 
+    Parameters:
+    server_address (str): The address of the server.
+    port_number (int): The port number to use for the connection.
+    database (str): The name of the database.
+    store (VehicleStore or None): The cars to search; None searches the cached collection of the server.
+    limit (int): The maximum number of cars shown.
 
+    Returns:
+    None
+    """
+    query = input("Search brand or model: ").strip()
+    if not query:
+        return
+    if store is None:
+        try:
+            store = load_collection(server_address, port_number, database)
+        except (requests.RequestException, ValueError) as e:
+            print (f"Communication error ({e.__class__.__name__}) - the cars could not be searched.")
+            return
+        if store is None:
+            print ("Server error - the cars could not be searched.")
+            return
+    hits = store.search(query, limit)
+    if not hits:
+        print ("*** No cars found ***")
+        return
+    print_json([record for record, score in hits])
+    print (f"{len(hits)} best matches for {query!r}")
 
 
 # Function to enter and validate Car ID.
@@ -187,7 +1418,7 @@ def enter_id ():
             cid = input("enter a Car ID (only integers number are allowed): ")
             if cid == "":
                 return None
-            if not cid.isdigit():
+            if not vehicle_record.id_is_valid(cid):
                 raise ValueError
         except ValueError:
             print ("The Car Id must contain only digits.")
@@ -210,7 +1441,7 @@ def name_is_valid (name):
     bool: True if the name is valid (non-empty and contains only alphanumeric characters or spaces),
           False otherwise.
     """
-    return bool(name) and all(char.isalnum() or char.isspace() for char in name)
+    return vehicle_record.name_is_valid(name)
 
 
 # Function to allow user to enter car brand name and model and checks it's valid.
@@ -237,6 +1468,22 @@ def enter_name (what):
         else:
             return what
 
+# Function to validate the production year.
+def production_year_is_valid (production_year):
+    """
+    Validates the car production year.
+
+    The year is valid when it is a four-digit integer (or a string of four digits) between 1900 and 2000.
+
+    Parameters:
+    production_year (int or str): The production year to be validated.
+
+    Returns:
+    bool: True if the year is valid, False otherwise.
+    """
+    return vehicle_record.year_is_valid(production_year)
+
+
 # Function to enter and validate production year.
 def enter_production_year ():
     """
@@ -251,13 +1498,9 @@ def enter_production_year ():
     while True:
         try:
             production_year = input("Car production year: ")
-            if production_year == "" or len(production_year) != 4 or not production_year.isdigit():
+            if not production_year_is_valid (production_year):
                 raise ValueError
             production_year = int(production_year)
-            if not (1900 <= production_year <= 2000):
-                raise ValueError
-
-
         except ValueError:
             print ("Year must be fourdigit integer value from 1900 to 2000")
         else:
@@ -304,7 +1547,8 @@ def input_car_data (with_id):
     with_id (bool): If `True`, the function prompts the user for a car ID; otherwise, it skips this step.
 
     Returns:
-    dict: A dictionary containing the car's details, such as 'id', 'brand', 'model', 'production_year', and 'convertible'.
+    dict: A dictionary containing the car's details, such as 'id', 'brand', 'model', 'production_year', and 'convertible',
+          built from a `vehicle_record.Vehicle`.
 
     Raises:
     ValueError: If `with_id` is not a boolean value (True/False).
@@ -332,16 +1576,120 @@ def input_car_data (with_id):
             new_car["convertible"] = convertible
 
         # Return the dictionary of the user entered value.
-        return new_car
+        return vehicle_record.Vehicle(**new_car).to_dict()
     except ValueError:
         print ("Only True / False is allowed as an argument.")
 
+# Number of times a conflicting update is retried against a freshly fetched car.
+CONFLICT_RETRIES = 3
+
+
+# Function to fetch one car together with its version.
+def fetch_car (client, cid):
+    """
+    Fetches one car and the ETag of the stored version.
+
+    Returns:
+    tuple: (record, etag), with etag None when the server sends none, or (None, None) when the car 
+           is not in the database.
+
+    Exceptions:
+    requests.RequestException: If there is a communication error or the server replies with an error.
+    """
+    reply = client.get(cid)
+    if reply.status_code == requests.codes.not_found:
+        return None, None
+    if reply.status_code != requests.codes.ok:
+        raise requests.HTTPError(f"Server error! (HTTP {reply.status_code})", response=reply)
+    return reply.json(), reply.headers.get("ETag")
+
+
+# Function to compute the fields a change touches.
+def changed_fields (old, new):
+    """ Returns the fields of `new` whose value differs from `old`; the id is never included. """
+    return {key: value for key, value in new.items() if key != "id" and old.get(key) != value}
+
+
+# Function to find the fields two writers changed differently.
+def conflicting_fields (base, current, changes):
+    """ Returns the fields of `changes` that another writer changed, between `base` and `current`, to another value. """
+    return [key for key, value in changes.items() if current.get(key) != base.get(key) and current.get(key) != value]
+
+
+# Function to update or delete a car only if it is still the version the change was based on.
+def conditional_write (client, op, cid, changes=None, base=None, etag=None, retries=CONFLICT_RETRIES):
+    """
+    Sends an update or a delete of car `cid` that only succeeds while the stored car is still the 
+    version `base` the caller saw. An update is a PATCH carrying only the changed fields.
+
+    The write carries `If-Match` with the ETag of that version, so the server answers 412 
+    Precondition Failed (or 409 Conflict) instead of overwriting a newer car. A car with an 
+    integer "version" field has it incremented by every update, so servers that check the field 
+    detect the same conflicts. When an update conflicts, the car is fetched again: if the other 
+    writer changed none of the fields in `changes`, the update is retried against the fresh 
+    version (at most `retries` times); otherwise, and always for a delete, a conflict is returned.
+
+    Parameters:
+    client (VehicleClient): The client of the database.
+    op (str): "update" or "delete".
+    cid (str): The car id.
+    changes (dict): The fields to change (update only).
+    base (dict or None): The car the change is based on; None fetches the current one.
+    etag (str or None): The ETag of `base`.
+    retries (int): How many times a conflicting update is retried.
+
+    Returns:
+    dict: A result like `run_operation`. A conflict has "conflict": True, the HTTP "status", the 
+          "current" car (None when it was deleted in the meantime) and its "etag", so the caller 
+          can show it and retry against it.
+    """
+    result = {"op": op, "id": cid, "ok": False}
+    try:
+        if base is None:
+            base, etag = fetch_car(client, cid)
+            if base is None:
+                result.update(status=requests.codes.not_found, error=f"the cid {cid} is not in the database")
+                return result
+        for attempt in range(retries + 1):
+            headers = {"If-Match": etag} if etag else {}
+            if op == "delete":
+                reply = client.delete(cid, headers=headers)
+            else:
+                body = dict(changes)
+                if isinstance(base.get("version"), int):
+                    body["version"] = base["version"] + 1
+                reply = client.patch(cid, body, headers=headers)
+            if reply.status_code not in (requests.codes.precondition_failed, requests.codes.conflict):
+                break
+            current, etag = fetch_car(client, cid)
+            if op == "delete" or current is None or attempt == retries or conflicting_fields(base, current, changes):
+                result.update(status=reply.status_code, conflict=True, current=current, etag=etag,
+                              error=f"the cid {cid} was changed by another writer in the meantime")
+                return result
+            base = current
+    except requests.RequestException as e:
+        result["error"] = f"communication error ({e.__class__.__name__})"
+        return result
+    result["status"] = reply.status_code
+    if reply.status_code in (requests.codes.ok, requests.codes.no_content):
+        result["ok"] = True
+        if op == "update":
+            result["data"] = reply.json() if reply.content else dict(base, **body)
+    elif reply.status_code == requests.codes.not_found:
+        result["error"] = f"the cid {cid} is not in the database"
+    else:
+        result["error"] = "server error"
+    return result
+
+
 def add_car (server_address, port_number, database):
     """
     Collects car data from the user and sends it as a POST request to the specified server and database.
 
     This function prompts the user to input car details (such as ID, brand, model, production year, and convertible status)
-    and then sends this data to the server via a POST request to the specified database. If the server responds with a
+    and then sends this data to the server via a POST request to the specified database. An id that is already 
+    in the cached collection (see `load_collection`, which only transfers what changed) is refused by a lookup 
+    in its id index, and the POST asks the server with "If-None-Match: *" to refuse an id taken in the meantime. If the server responds with a
     successful status, it confirms that the car entry has been added to the database.
 
     Parameters:
@@ -357,27 +1705,41 @@ def add_car (server_address, port_number, database):
     """
     # Invokes the gathered data.
     data = input_car_data (True)
+    client = get_client(server_address, port_number, database)
+    # Refuse an id that is already in the database, before sending anything: the cached collection 
+    # is brought up to date and its id index answers in constant time.
+    if data.get("id") is not None:
+        try:
+            store = load_collection(server_address, port_number, database)
+        except (requests.RequestException, ValueError):
+            store = None
+        if store is not None and data["id"] in store:
+            print (f'The cid {data["id"]} is already in the database.')
+            return
     # Add the gathered data into the database.
-    # Prepare to write a new car data into the database.
-    h_close = {"Connection" : "Close"}
-    h_content = {"Content-Type" : "application/json"}
+    # "If-None-Match: *" asks the server to refuse the car if the id was taken in the meantime.
     try:
-        reply = requests.post(f"{server_address}:{port_number}/{database}", headers=h_content, data = json.dumps(data))
+        reply = client.post(data, headers={"If-None-Match": "*"} if data.get("id") is not None else {})
         print (reply.status_code)
-    except requests.RequestException:
-        print ("Communication error!")
+    except requests.RequestException as e:
+        print (f"Communication error! ({e.__class__.__name__})")
     else:
         if reply.status_code == requests.codes.created:
             print (f'The entry {json.dumps(data)} has been posted to the vehicle database.')
+            record = reply.json() if reply.content else data
+            patch_cache(server_address, port_number, database, record.get("id"), record)
+        elif reply.status_code in (requests.codes.precondition_failed, requests.codes.conflict):
+            print (f'The cid {data["id"]} is already in the database.')
         else:
-            print ("Server error!")
+            print (f"Server error! (HTTP {reply.status_code})")
 
 def delete_car (server_address, port_number, database):
     """
     Prompts the user for a car ID and attempts to delete the corresponding car entry from the database.
 
-    This function asks the user for the car's ID, validates the input, and sends a DELETE request to the 
-    specified server to remove the car entry from the database. If the car is successfully deleted, a 
+    This function asks the user for the car's ID, validates the input, fetches the car and sends a DELETE 
+    request conditional on that version (If-Match) to remove the car entry from the database. If the car 
+    was changed in the meantime, the new version is shown and the user confirms the delete again. If the car is successfully deleted, a 
     success message is displayed. If no entry is found or if there's a communication error, an appropriate message is shown.
 
     Parameters:
@@ -393,29 +1755,53 @@ def delete_car (server_address, port_number, database):
     """
     # Take the car id from the user and validate the cid.
     cid = enter_id ()
-    # Delete the car data from the vehicle database with user entered cid.
-    headers = {"Connection" : "Close"}
+    if cid is None:
+        print ("No Car ID entered, nothing to delete.")
+        return
+    # Fetch the car first, so that only the version shown to the user is deleted.
+    client = get_client(server_address, port_number, database)
     try:
-        reply = requests.delete(f"{server_address}:{port_number}/{database}/{cid}")
-        print ("res = " +str(reply.status_code))
-    except requests.RequestException:
-        print ("Communication error!")
-    else:
-        if reply.status_code == requests.codes.ok:
-            print (f'The entry of {cid} has been deleted successfully from the database.')
-        elif reply.status_code == requests.codes.no_content:
-            print (f'No entry found with the id of {cid}.')
+        current, etag = fetch_car(client, cid)
+    except requests.RequestException as e:
+        print (f"Communication error! ({e.__class__.__name__})")
+        return
+    if current is None:
+        print (f'No entry found with the id of {cid}.')
+        return
+    print (f"Deleting {json.dumps(current)}")
+    # Delete the car data from the vehicle database with user entered cid.
+    result = conditional_write(client, "delete", cid, base=current, etag=etag)
+    if result.get("conflict") and result["current"] is not None:
+        print (f'The entry of {cid} was changed in the meantime, it now holds {json.dumps(result["current"])}.')
+        if input ("Delete it anyway? (y/n): ").strip().lower() == "y":
+            result = conditional_write(client, "delete", cid, base=result["current"], etag=result["etag"])
         else:
-            print ("Server error.")
+            return
+    print ("res = " + str(result.get("status")))
+    if result["ok"]:
+        print (f'The entry of {cid} has been deleted successfully from the database.')
+        patch_cache(server_address, port_number, database, cid)
+    elif result.get("status") == requests.codes.not_found or (result.get("conflict") and result["current"] is None):
+        print (f'No entry found with the id of {cid}.')
+        patch_cache(server_address, port_number, database, cid)
+    elif result.get("conflict"):
+        print (f'The entry of {cid} was changed again, nothing was deleted.')
+    elif "status" in result:
+        print (f"Server error! (HTTP {result['status']})")
+    else:
+        print (result["error"][:1].upper() + result["error"][1:] + "!")
 
 def update_car (server_address, port_number, database):
     """
     Prompts the user for a car ID and updates the corresponding car entry in the database.
 
-    This function asks the user for the car ID (cid), validates it, and then prompts for the updated car data 
-    (brand, model, production year, and convertible status). It sends a PUT request to the server to update 
-    the car entry in the database. If the update is successful, a confirmation message is shown; if the 
-    car ID is not found or if there's a communication error, an appropriate message is displayed.
+    This function asks the user for the car ID (cid), validates it, shows the stored car and then prompts for 
+    the updated car data (brand, model, production year, and convertible status). Only the fields that changed 
+    are sent, as a PATCH request conditional on the version that was shown (see `conditional_write`). If 
+    another user changed the car in the meantime, the update is retried automatically when the other change 
+    touched different fields; otherwise the new version is shown and the user decides whether to apply the 
+    change to it. If the update is successful, a confirmation message is shown; if the car ID is not found 
+    or if there's a communication error, an appropriate message is displayed.
 
     Parameters:
     server_address (str): The address of the server.
@@ -426,27 +1812,487 @@ def update_car (server_address, port_number, database):
     None
 
     Exceptions:
-    requests.RequestException: If there is a communication error while sending the PUT request.
+    requests.RequestException: If there is a communication error while sending the PATCH request.
     """
-    cid = str(enter_id ())
-    data_to_update = input_car_data (False)
+    cid = enter_id ()
+    if cid is None:
+        print ("No Car ID entered, nothing to update.")
+        return
+    # Fetch the car first: the change is based on this version and only the changed fields are sent.
+    client = get_client(server_address, port_number, database)
+    try:
+        current, etag = fetch_car(client, cid)
+    except requests.RequestException as e:
+        print (f"Communication error! ({e.__class__.__name__})")
+        return
+    if current is None:
+        print (f'The cid no. {cid} is not in the database.')
+        return
+    print (f"Current entry: {json.dumps(current)}")
+    data_to_update = changed_fields(current, input_car_data (False))
     print (data_to_update)
-  
+    if not data_to_update:
+        print ("Nothing to update.")
+        return
+
     # Updading the database with new data of the cid.
-    h_content = {"Content-Type" : "application/json"}
-    try:
-        reply = requests.put(f"{server_address}:{port_number}/{database}/{cid}", headers=h_content, data = json.dumps(data_to_update))
-        print ("res = " +str(reply.status_code)) 
-    except requests.RequestException:
-        print ("Comminication error!")
+    result = conditional_write(client, "update", cid, data_to_update, current, etag)
+    if result.get("conflict") and result["current"] is not None:
+        print (f'The entry with cid no. {cid} was changed in the meantime, it now holds {json.dumps(result["current"])}.')
+        if input ("Apply your changes to it anyway? (y/n): ").strip().lower() == "y":
+            result = conditional_write(client, "update", cid, data_to_update, result["current"], result["etag"])
+        else:
+            return
+    print ("res = " + str(result.get("status")))
+    if result["ok"]:
+        print (f'The new data {data_to_update} has been updated in the entry with cid no. {cid}')
+        patch_cache(server_address, port_number, database, cid, result["data"])
+    elif result.get("status") == requests.codes.not_found or (result.get("conflict") and result["current"] is None):
+        print (f'The cid no. {cid} is not in the database.')
+    elif result.get("conflict"):
+        print (f'The entry with cid no. {cid} was changed again, nothing was updated.')
+    elif "status" in result:
+        print (f"Server error! (HTTP {result['status']})")
     else:
-        if reply.status_code == requests.codes.ok:
-            print (f'The new data {data_to_update} has been updated in the entry with cid no. {cid}')
-        elif reply.status_code == requests.codes.not_found:
-            print (f'The cid no. {cid} is not in the database.')
+        print (result["error"][:1].upper() + result["error"][1:] + "!")
+
+
+# Function to validate a car record that does not come from the prompts.
+def validate_car (record):
+    """
+    Checks a car record with the same rules the prompts use (see `vehicle_record`).
+
+    Parameters:
+    record (dict): The car record with 'id', 'brand', 'model', 'production_year' and 'convertible'.
+
+    Returns:
+    list: The list of problems found in the record. An empty list means the record is valid.
+    """
+    return vehicle_record.Vehicle.from_dict(record).problems()
+
+
+# Function to convert a CSV row into a car record.
+def csv_row_to_car (row):
+    """
+    Converts a row read by `csv.DictReader` into a car record with the proper value types.
+
+    Empty cells become None, the production year becomes an integer when it is made of digits, 
+    and 'true'/'y'/'1' or 'false'/'n'/'0' become the boolean convertible flag.
+    """
+    car = {key: (value if value != "" else None) for key, value in row.items()}
+    year = car.get("production_year")
+    if isinstance(year, str) and year.isdigit():
+        car["production_year"] = int(year)
+    convertible = car.get("convertible")
+    if isinstance(convertible, str):
+        flag = convertible.strip().lower()
+        if flag in ("true", "y", "yes", "1"):
+            car["convertible"] = True
+        elif flag in ("false", "n", "no", "0"):
+            car["convertible"] = False
+    return car
+
+
+# Function to read car records from a file.
+def read_car_records (path):
+    """
+    Yields the car records stored in a file, one at a time.
+
+    The format is taken from the file extension:
+    - .csv: a header row followed by one car per row.
+    - .jsonl / .ndjson: one JSON object per line.
+    - .vcol: a columnar snapshot written by `export_cars`.
+    - .json: a JSON array of cars, or an object holding the array (like `vehicle.json`).
+    A further .gz, .zst or .zstd extension means the file is compressed.
+
+    Parameters:
+    path (str): The path of the file.
+    """
+    extension = os.path.splitext(vehicle_snapshot.base_name(path))[1].lower()
+    if extension == ".vcol":
+        yield from vehicle_snapshot.iter_records(vehicle_snapshot.read_columnar(path))
+    elif extension == ".csv":
+        with io.TextIOWrapper(vehicle_snapshot.open_file(path), newline="", encoding="utf-8") as file:
+            for row in csv.DictReader(file):
+                yield csv_row_to_car(row)
+    elif extension in (".jsonl", ".ndjson"):
+        with io.TextIOWrapper(vehicle_snapshot.open_file(path), encoding="utf-8") as file:
+            for line in file:
+                if line.strip():
+                    yield json.loads(line)
+    else:
+        with vehicle_snapshot.open_file(path) as file:
+            head = file.read(65536)
+            if head.lstrip()[:1] == b"[":
+                # A top level array is parsed incrementally.
+                yield from iter_json_array(itertools.chain([head], iter(lambda: file.read(65536), b"")))
+                return
+            data = json.loads(head + file.read())
+        if isinstance(data, dict):
+            data = next((value for value in data.values() if isinstance(value, list)), [])
+        yield from data
+
+
+# Function to read the position an interrupted import has reached.
+def read_checkpoint (checkpoint, path):
+    """ 
+    Returns the number of records of `path` already handled according to the checkpoint file and 
+    the set of indexes among them that failed, or (0, set()) without a checkpoint of `path`.
+    """
+    try:
+        with open(checkpoint, encoding="utf-8") as file:
+            state = json.load(file)
+    except (OSError, ValueError):
+        return 0, set()
+    if state.get("path") != os.path.abspath(path):
+        return 0, set()
+    return state.get("offset", 0), set(state.get("failed", ()))
+
+
+# Function to save the position an import has reached.
+def write_checkpoint (checkpoint, path, offset, failed=()):
+    """ 
+    Atomically writes the number of records of `path` already handled, and the indexes of those 
+    that failed, to the checkpoint file.
+    """
+    temporary = checkpoint + ".tmp"
+    with open(temporary, "w", encoding="utf-8") as file:
+        json.dump({"path": os.path.abspath(path), "offset": offset, "failed": sorted(failed)}, file)
+    os.replace(temporary, checkpoint)
+
+
+# Function to import cars from a file in parallel batches.
+def import_cars (client, path, workers=8, batch_size=500, checkpoint=None, circuit_wait=None):
+    """
+    Imports the cars stored in a file without prompting, posting them with a bounded pool of threads.
+
+    Records are read one at a time, validated in the same pass (`vehicle_record.checked`), and posted in batches of 
+    `batch_size` records, held as `vehicle_record.Vehicle` until they are sent. After each batch the number of handled records 
+    and the indexes of the records that failed are written to the checkpoint file, so an interrupted 
+    import continues where it stopped and sends the failed records again. The checkpoint file is 
+    removed once the whole file has been imported without failures. Records whose id is already in the database 
+    (e.g. posted after the last checkpoint of an interrupted run) or repeated within a batch are 
+    not posted: they are found with `VehicleStore.duplicate_ids` on the cached collection.
+
+    When failures open the circuit of the client, the posts wait for its trial call instead of 
+    failing at once, so a short outage does not fail the rest of the file. If the circuit is still 
+    open after `circuit_wait` seconds, the import stops ('stopped' is True); the records of the 
+    batch that were not sent are kept as failed in the checkpoint, so it can be resumed once the 
+    server is back.
+
+    Parameters:
+    client (VehicleClient): The client of the target database.
+    path (str): The file to import (.json, .jsonl or .csv).
+    workers (int): The number of requests sent at the same time.
+    batch_size (int): The number of records handled between two checkpoints.
+    checkpoint (str): The checkpoint file (default: `path` + ".checkpoint").
+    circuit_wait (float): The seconds a post waits for an open circuit (default: twice its reset timeout).
+
+    Returns:
+    dict: The number of 'imported', 'invalid', 'duplicate' and 'failed' records, the 'skipped' records that 
+          were already handled before (the failed ones are sent again), whether the import 'stopped' early, the elapsed 'seconds' and 
+          the 'rate' in records per second.
+    """
+    checkpoint = checkpoint or path + ".checkpoint"
+    offset, retried = read_checkpoint(checkpoint, path)
+    if circuit_wait is None:
+        circuit_wait = 2 * client.breaker.reset_timeout
+    summary = {"imported": 0, "invalid": 0, "duplicate": 0, "failed": 0, "skipped": offset - len(retried),
+               "stopped": False}
+    failed = set()
+    stopped = threading.Event()
+    start = time.perf_counter()
+    try:
+        existing = load_collection(client.server_address, client.port_number, client.database)
+    except (requests.RequestException, ValueError):
+        existing = None
+    if existing is None:
+        # Without a copy of the collection, only the ids repeated within a batch are caught.
+        existing = VehicleStore(indexes=())
+
+    def post_one (index, record):
+        if stopped.is_set():
+            return index, record, "not sent, the server is not responding"
+        try:
+            reply = client.post(record.to_dict(), circuit_wait=circuit_wait)
+        except requests.RequestException as e:
+            if client.breaker.retry_in() > 0:
+                # Still open after the wait: the server is down, the other posts are not sent.
+                stopped.set()
+            return index, record, f"communication error ({e.__class__.__name__})"
+        if reply.status_code == requests.codes.created:
+            return index, record, None
+        return index, record, f"server replied {reply.status_code}"
+
+    def run_batch (pool, batch):
+        # A repeated id is posted once: two threads posting it at the same time would race.
+        repeated = {str(cid) for cid in existing.duplicate_ids(record.to_dict() for _, record in batch)}
+        seen = set()
+        posted = []
+        for index, record in batch:
+            cid = str(record.id)
+            if cid in repeated and (cid in existing or cid in seen):
+                summary["duplicate"] += 1
+                print (f"Record {index} (id {record.id}) is already in the database.")
+            else:
+                posted.append((index, record))
+            seen.add(cid)
+        for index, record, error in pool.map(lambda item: post_one(*item), posted):
+            if error is None:
+                summary["imported"] += 1
+            else:
+                summary["failed"] += 1
+                failed.add(index)
+                print (f"Record {index} (id {record.id}) failed: {error}")
+
+    from concurrent.futures import ThreadPoolExecutor
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        batch = []
+        handled = offset
+        # The records are checked while they are read; a problem is reported before its record is yielded.
+        invalid = []
+        for index, record in enumerate(vehicle_record.checked(read_car_records(path), invalid)):
+            if index < offset and index not in retried:
+                continue
+            handled = max(handled, index + 1)
+            if invalid and invalid[-1]["index"] == index:
+                summary["invalid"] += 1
+                print (f"Record {index} (id {record.get('id')}) is invalid: {'; '.join(invalid[-1]['problems'])}")
+            else:
+                # A pending batch is held as slotted `Vehicle` records rather than dicts.
+                batch.append((index, vehicle_record.Vehicle.from_dict(record)))
+            if len(batch) >= batch_size:
+                run_batch(pool, batch)
+                batch = []
+                write_checkpoint(checkpoint, path, handled, failed)
+                if stopped.is_set():
+                    break
+                done = summary["imported"] + summary["failed"]
+                print (f"{handled} records handled, {done / (time.perf_counter() - start):.0f} cars/s")
+        else:
+            run_batch(pool, batch)
+
+    if stopped.is_set():
+        summary["stopped"] = True
+        print ("The server is not responding, the import stopped; run it again to resume.")
+    if failed:
+        write_checkpoint(checkpoint, path, handled, failed)
+        print (f"{len(failed)} records failed; run the import again to send them again.")
+    elif os.path.exists(checkpoint):
+        os.remove(checkpoint)
+    summary["seconds"] = time.perf_counter() - start
+    summary["rate"] = (summary["imported"] + summary["failed"]) / summary["seconds"] if summary["seconds"] else 0.0
+    return summary
+
+
+# Function to run one operation without prompting.
+def run_operation (client, operation):
+    """
+    Runs one database operation described by a dictionary and returns a machine-readable result.
+
+    The operation has an "op" key ("list", "get", "add", "update", "delete", "search", "stats" or "validate"), an "id" 
+    for get/update/delete (optional for add, where it may also be given in "data") and a "data" 
+    record for add/update. An update may give only some of the 
+    fields; the others are taken from the stored car. A "list" may give "page", "limit", "sort", 
+    "order" and "filters" like `fetch_page`. An update sends only the changed fields. An update or 
+    a delete may give the "version" (the car's "version" field) or "etag" it expects; both are conditional 
+    writes (see `conditional_write`), and a conflict result has "conflict": True and the "current" 
+    car, so it can be retried against it. A "stats" loads the whole collection into columns and 
+    returns the report of `vehicle_analytics.FleetColumns.report`; it may give "top" (default: 10). 
+    A "validate" checks every car with `vehicle_record.validate_records` and returns the number 
+    "checked" and the "invalid" cars with their problems. A "search" gives a free-text "query" 
+    (and "limit", default: 10) and returns the best matching cars as [{"score", "car"}], from the 
+    cached collection (see `load_collection`) and its search index.
+
+    Parameters:
+    client (VehicleClient): The client of the database.
+    operation (dict): The operation to run.
+
+    Returns:
+    dict: The "op", the "id", "ok" (bool), the HTTP "status" when the server replied, and 
+          either the resulting "data" or an "error" message.
+    """
+    op = operation.get("op")
+    cid = operation.get("id")
+    data = operation.get("data") or {}
+    if op == "add":
+        # The id of a new car may be given in the operation, in its data, or not at all.
+        if cid is None:
+            cid = data.get("id")
+        elif data.get("id") is None:
+            data = dict(data, id=cid)
+    result = {"op": op, "id": cid, "ok": False}
+    if op not in ("list", "get", "add", "update", "delete", "search", "stats", "validate"):
+        result["error"] = f"unknown operation {op!r}"
+        return result
+    if op in ("get", "update", "delete") and (cid is None or not str(cid).isdigit()):
+        result["error"] = "the car id must contain only digits"
+        return result
+    try:
+        if op == "stats":
+            # Imported here: the analytics may load NumPy, which only this operation needs.
+            import vehicle_analytics
+            with client.get(stream=True) as reply:
+                result["status"] = reply.status_code
+                if reply.status_code != requests.codes.ok:
+                    result["error"] = "server error"
+                    return result
+                columns = vehicle_analytics.FleetColumns.from_records(iter_json_array(reply.iter_content(65536)))
+            with vehicle_stats.timer("analytics_seconds"):
+                result["data"] = columns.report(operation.get("top", 10))
+            result["ok"] = True
+            return result
+        if op == "search":
+            store = load_collection(client.server_address, client.port_number, client.database)
+            if store is None:
+                result["error"] = "server error"
+                return result
+            hits = store.search(str(operation.get("query") or ""), operation.get("limit", 10))
+            result.update(ok=True, data=[{"score": round(score, 3), "car": record} for record, score in hits])
+            return result
+        if op == "validate":
+            with client.get(stream=True) as reply:
+                result["status"] = reply.status_code
+                if reply.status_code != requests.codes.ok:
+                    result["error"] = "server error"
+                    return result
+                invalid = []
+                checked = sum(1 for _ in vehicle_record.checked(iter_json_array(reply.iter_content(65536)), invalid))
+            result.update(ok=True, data={"checked": checked, "invalid": invalid})
+            return result
+        if op == "list":
+            params = dict(operation.get("filters") or {})
+            for key in ("page", "limit", "sort", "order"):
+                if operation.get(key) is not None:
+                    params["_" + key] = operation[key]
+            reply = client.get(params=params)
+        elif op == "get":
+            reply = client.get(cid)
+        elif op == "delete" and operation.get("version") is None and operation.get("etag") is None:
+            reply = client.delete(cid)
+        elif op == "add":
+            errors = validate_car(data)
+            if errors:
+                result["error"] = "; ".join(errors)
+                return result
+            reply = client.post(data, headers={"If-None-Match": "*"} if data.get("id") is not None else {})
         else:
-            print ("Server error!")
+            # Updates, and deletes of an expected version, are conditional writes.
+            stored, etag = fetch_car(client, cid)
+            if stored is None:
+                result.update(status=requests.codes.not_found, error=f"the cid {cid} is not in the database")
+                return result
+            if ((operation.get("version") is not None and stored.get("version") != operation["version"]) 
+                    or (operation.get("etag") is not None and etag != operation["etag"])):
+                result.update(status=requests.codes.precondition_failed, conflict=True, current=stored, etag=etag,
+                              error=f"the cid {cid} is no longer the expected version")
+                return result
+            if op == "delete":
+                return conditional_write(client, "delete", cid, base=stored, etag=etag)
+            changes = changed_fields(stored, dict(stored, **{key: value for key, value in data.items() if key != "id"}))
+            errors = validate_car(dict(stored, **changes))
+            if errors:
+                result["error"] = "; ".join(errors)
+                return result
+            if not changes:
+                result.update(ok=True, status=requests.codes.ok, data=stored)
+                return result
+            return conditional_write(client, "update", cid, changes, stored, etag)
+    except requests.RequestException as e:
+        result["error"] = f"communication error ({e.__class__.__name__})"
+        return result
+    except ValueError:
+        result["error"] = "the server sent an invalid car list"
+        return result
+    result["status"] = reply.status_code
+    if reply.status_code in (requests.codes.ok, requests.codes.created, requests.codes.no_content):
+        result["ok"] = True
+        if op != "delete" and reply.content:
+            result["data"] = reply.json()
+            if op == "add":
+                result["id"] = result["data"].get("id")
+    elif reply.status_code == requests.codes.not_found:
+        result["error"] = f"the cid {cid} is not in the database"
+    elif op == "add" and reply.status_code in (requests.codes.precondition_failed, requests.codes.conflict):
+        result["error"] = f"the cid {cid} is already in the database"
+    else:
+        result["error"] = "server error"
+    return result
 
 
+# Function to read the operations of a batch file.
+def read_operations (file):
+    """ Yields the operations of a batch file with one JSON object per line; blank lines and lines starting with # are skipped. """
+    for number, line in enumerate(file, 1):
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError:
+            yield {"op": None, "line": number}
+
 
+# Function to run a batch of operations over one connection.
+def run_batch (client, operations, out=None):
+    """
+    Runs every operation with `run_operation` over the same pooled connection and writes one JSON 
+    result per line to `out` (default: `sys.stdout`) as soon as it is known.
+
+    Returns:
+    int: The number of operations that failed.
+    """
+    out = out or sys.stdout
+    failed = 0
+    for operation in operations:
+        result = run_operation(client, operation)
+        if "line" in operation:
+            result["error"] = f"line {operation['line']} is not valid JSON"
+        failed += not result["ok"]
+        out.write(json.dumps(result) + "\n")
+        out.flush()
+    return failed
+
+
+# Function to export the collection to a file.
+def export_cars (server_address, port_number, database, output=None, output_format="jsonl", compression=None):
+    """
+    Streams the collection from the server into a file (or `sys.stdout`) without holding the 
+    records in memory.
 
+    Parameters:
+    server_address (str): The address of the server.
+    port_number (int): The port number to use for the connection.
+    database (str): The name of the database.
+    output (str or None): The file to write; None writes to `sys.stdout`.
+    output_format (str): "jsonl", "csv", "json" (a JSON array) or "columnar" (the compact binary 
+                         layout of `vehicle_snapshot`, read back with `vehicle_snapshot.read_columnar`).
+    compression (str or None): "none", "gzip" or "zstd"; None picks it from the extension of `output`.
+
+    Returns:
+    int: The number of cars exported.
+
+    Exceptions:
+    requests.RequestException, ValueError: If the car list could not be read (see `stream_cars`); 
+                                           `output` is then left as it was.
+    """
+    vehicles = stream_cars(server_address, port_number, database)
+    if not output:
+        out = vehicle_snapshot.open_file(sys.stdout.buffer, "wb", compression)
+        try:
+            return vehicle_snapshot.write_snapshot(vehicles, out, output_format, format_rows)
+        finally:
+            out.flush()
+    # The cars go to a temporary file that only replaces `output` once the export is complete.
+    temporary = output + ".tmp"
+    try:
+        with open(temporary, "wb") as raw:
+            out = vehicle_snapshot.open_file(raw, "wb", compression or vehicle_snapshot.compression_of(output))
+            count = vehicle_snapshot.write_snapshot(vehicles, out, output_format, format_rows)
+            out.close()
+    except BaseException:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+        raise
+    os.replace(temporary, output)
+    return count
@@ -0,0 +1,168 @@
+import re
+
+""" This module defines the car record of the vintage car database and the rules a car must
+    follow, shared by the prompts, the import, the sync with the server and the `validate`
+    command:
+        - id: digits only (it may be missing when the server assigns it),
+        - brand and model: not empty, only letters, digits and white space,
+        - production_year: an integer from 1900 to 2000,
+        - convertible: true, false or missing.
+
+    `validate_records` checks a whole collection in one pass and reports every violation with the
+    id of the car. The checks are precompiled regular expressions, and a brand or model is only
+    checked the first time it is seen, so a million cars take about a second.
+"""
+
+FIELDS = ('id', 'brand', 'model', 'production_year', 'convertible')
+FIRST_YEAR = 1900
+LAST_YEAR = 2000
+
+ID_PATTERN = re.compile(r"\d+")
+# Letters, digits and white space: \w without the underscore, or \s.
+NAME_PATTERN = re.compile(r"(?:[^\W_]|\s)+")
+YEAR_PATTERN = re.compile(r"\d{4}")
+
+
+# Car record.
+class Vehicle:
+    """
+    One car, with a slot per field instead of a dictionary, so a large collection takes about half
+    the memory of the same cars as dicts. Fields outside `FIELDS` (e.g. "updated_at" or "version")
+    are kept in `extra`.
+    """
+    __slots__ = FIELDS + ('extra',)
+
+    def __init__ (self, id=None, brand=None, model=None, production_year=None, convertible=None, **extra):
+        self.id = id
+        self.brand = brand
+        self.model = model
+        self.production_year = production_year
+        self.convertible = convertible
+        self.extra = extra or None
+
+    @classmethod
+    def from_dict (cls, record):
+        """ Builds a `Vehicle` from a car dictionary, e.g. one decoded from the server. """
+        return cls(**{str(key): value for key, value in record.items()})
+
+    def to_dict (self):
+        """ Returns the car as a dictionary, ready to be sent as JSON; a missing id is left out. """
+        record = {field: getattr(self, field) for field in FIELDS if field != "id" or self.id is not None}
+        if self.extra:
+            record.update(self.extra)
+        return record
+
+    def problems (self):
+        """ Returns the list of rules the car breaks; an empty list means the car is valid. """
+        return check(self.id, self.brand, self.model, self.production_year, self.convertible)
+
+    def is_valid (self):
+        return not self.problems()
+
+    def __eq__ (self, other):
+        return isinstance(other, Vehicle) and self.to_dict() == other.to_dict()
+
+    def __repr__ (self):
+        return "Vehicle(" + ", ".join(f"{key}={value!r}" for key, value in self.to_dict().items()) + ")"
+
+
+# Function to check a car id.
+def id_is_valid (cid):
+    """ Returns True if the id is made of digits only (an int is also accepted). """
+    if type(cid) is int:
+        return cid >= 0
+    return isinstance(cid, str) and ID_PATTERN.fullmatch(cid) is not None
+
+
+# Function to check a brand or model.
+def name_is_valid (name):
+    """ Returns True if the name is not empty and only contains letters, digits and white space. """
+    return isinstance(name, str) and NAME_PATTERN.fullmatch(name) is not None
+
+
+# Function to check a production year.
+def year_is_valid (production_year):
+    """ Returns True if the year is an integer (or a string of four digits) from 1900 to 2000. """
+    if isinstance(production_year, str):
+        if YEAR_PATTERN.fullmatch(production_year) is None:
+            return False
+        production_year = int(production_year)
+    return type(production_year) is int and FIRST_YEAR <= production_year <= LAST_YEAR
+
+
+# Function to list the rules the fields of a car break.
+def check (cid, brand, model, production_year, convertible):
+    """ Returns the list of rules broken by the given fields; an empty list means they are valid. """
+    problems = []
+    if cid not in (None, "") and not id_is_valid(cid):
+        problems.append(f"id {cid!r} must contain only digits")
+    if not name_is_valid(brand):
+        problems.append(f"brand {brand!r} must only contain letters, space and digits")
+    if not name_is_valid(model):
+        problems.append(f"model {model!r} must only contain letters, space and digits")
+    if not year_is_valid(production_year):
+        problems.append(f"production_year {production_year!r} must be from {FIRST_YEAR} to {LAST_YEAR}")
+    if not (convertible is None or convertible is True or convertible is False):
+        problems.append(f"convertible {convertible!r} must be true or false")
+    return problems
+
+
+# Function to check a car dictionary.
+def problems (record):
+    """ Returns the list of rules a car dictionary breaks; an empty list means the car is valid. """
+    return check(record.get("id"), record.get("brand"), record.get("model"),
+                 record.get("production_year"), record.get("convertible"))
+
+
+# Function to check cars while they are passed on.
+def checked (records, invalid):
+    """
+    Yields every record unchanged while checking it, and appends a {"index", "id", "problems"}
+    dictionary to `invalid` for every car that breaks a rule. Meant to be placed in a stream, e.g.
+    between the server and a sync, so the cars are checked without a second pass.
+
+    Only the cars that fail the quick checks (a known valid brand and model, an int year in range,
+    a boolean or missing convertible and a digit id) are checked again in full to describe the
+    problems; the brands and models that pass are remembered, so each name is matched once.
+    """
+    names = set()
+    match_id = ID_PATTERN.fullmatch
+    for index, record in enumerate(records):
+        get = record.get
+        cid = get("id")
+        brand = get("brand")
+        model = get("model")
+        year = get("production_year")
+        convertible = get("convertible")
+        try:
+            valid = (brand in names and model in names
+                     and type(year) is int and FIRST_YEAR <= year <= LAST_YEAR
+                     and (convertible is None or convertible is True or convertible is False)
+                     and (cid is None or (match_id(cid) is not None if type(cid) is str else type(cid) is int and cid >= 0)))
+        except TypeError:
+            # An unhashable brand or model.
+            valid = False
+        if not valid:
+            found = check(cid, brand, model, year, convertible)
+            if found:
+                invalid.append({"index": index, "id": cid, "problems": found})
+            else:
+                names.update((brand, model))
+        yield record
+
+
+# Function to check a whole collection.
+def validate_records (records):
+    """
+    Checks every car of a collection in one pass.
+
+    Parameters:
+    records (iterable): The car dictionaries, e.g. a list or a stream from the server or a file.
+
+    Returns:
+    list: One {"index", "id", "problems"} dictionary per invalid car, in the order of the cars.
+    """
+    invalid = []
+    for _ in checked(records, invalid):
+        pass
+    return invalid
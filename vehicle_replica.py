@@ -0,0 +1,385 @@
+import hashlib
+import json
+import os
+import sqlite3
+
+import vehicle_module as vm
+
+requests = vm.lazy_import("requests")
+
+""" This module keeps a local SQLite replica of the vintage car database, so that cars can be
+    read and filtered at local-disk speed and changed while the server is not responding. Changes
+    made offline are queued and replayed in order when the server comes back.
+"""
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS vehicles (
+    id TEXT PRIMARY KEY,
+    brand TEXT,
+    model TEXT,
+    production_year INTEGER,
+    convertible INTEGER,
+    record TEXT NOT NULL,       -- the whole car as JSON
+    server_digest TEXT,         -- digest of the last known server version, NULL if not on the server
+    deleted INTEGER NOT NULL DEFAULT 0,
+    dirty INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS vehicles_brand ON vehicles (brand);
+CREATE INDEX IF NOT EXISTS vehicles_model ON vehicles (model);
+CREATE INDEX IF NOT EXISTS vehicles_production_year ON vehicles (production_year);
+CREATE TABLE IF NOT EXISTS pending (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    op TEXT NOT NULL,
+    id TEXT NOT NULL,
+    data TEXT,
+    base_digest TEXT            -- the server version the change was made against, NULL if the car did not exist
+);
+CREATE TABLE IF NOT EXISTS conflicts (
+    seq INTEGER PRIMARY KEY,
+    op TEXT NOT NULL,
+    id TEXT NOT NULL,
+    data TEXT,
+    server_record TEXT
+);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+"""
+
+
+# Function to compute the digest of a car record.
+def digest (record):
+    """ Returns a digest of the record that does not depend on the order of its keys, or None for no record. """
+    if record is None:
+        return None
+    return hashlib.sha1(json.dumps(record, sort_keys=True).encode()).hexdigest()
+
+
+# Function to choose where the replica of a database is stored.
+def default_path (server_address, port_number, database):
+    """
+    Returns the replica file of a database: the VINTAGE_CAR_DB_REPLICA environment variable if it
+    is set, otherwise a file under ~/.vintage_car_db named after the server, port and database.
+    """
+    if "VINTAGE_CAR_DB_REPLICA" in os.environ:
+        return os.environ["VINTAGE_CAR_DB_REPLICA"]
+    name = f"{server_address.split('://')[-1]}_{port_number}_{database}".replace("/", "_").replace(":", "_")
+    return os.path.join(os.path.expanduser("~"), ".vintage_car_db", name + ".sqlite3")
+
+
+# Local persistent replica of the vehicle database.
+class VehicleReplica:
+    """
+    Holds a copy of the collection in an SQLite file with the same fields as `vehicle.json`.
+
+    Reads (`get`, `find`, `fetch_page`) are answered from the file. `queue` applies a change
+    locally and appends it to the pending queue together with the digest of the server version
+    it was made against; `replay` sends the queue in order and reports a conflict, instead of
+    overwriting, when the server version of a car has changed in the meantime. `sync` brings the
+    replica up to date with the server.
+
+    Parameters:
+    - path (str): The SQLite file; it is created with its directory when missing.
+    """
+    def __init__ (self, path):
+        if path != ":memory:" and os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.db = sqlite3.connect(path)
+        self.db.executescript(SCHEMA)
+
+    def close (self):
+        self.db.close()
+
+    def _meta (self, key, value=None):
+        if value is None:
+            row = self.db.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+            return row[0] if row else None
+        self.db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    def _write (self, record, server_digest, dirty, deleted=0):
+        convertible = record.get("convertible")
+        self.db.execute(
+            "INSERT OR REPLACE INTO vehicles (id, brand, model, production_year, convertible, record, server_digest, deleted, dirty) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (str(record.get("id")), record.get("brand"), record.get("model"), record.get("production_year"),
+             None if convertible is None else int(convertible), json.dumps(record), server_digest, deleted, dirty))
+
+    def is_synced (self):
+        """ Returns True once the replica has been filled from the server at least once. """
+        return self._meta("synced") is not None
+
+    def pending_count (self):
+        """ Returns the number of changes waiting to be replayed. """
+        return self.db.execute("SELECT COUNT(*) FROM pending").fetchone()[0]
+
+    # Reading.
+    def get (self, cid):
+        """ Returns the car with the given id, or None. """
+        row = self.db.execute("SELECT record FROM vehicles WHERE id = ? AND NOT deleted", (str(cid),)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _where (self, filters):
+        clauses, values = ["NOT deleted"], []
+        for key, value in (filters or {}).items():
+            if key in ("production_year_gte", "production_year_lte"):
+                clauses.append(f"production_year {'>=' if key.endswith('gte') else '<='} ?")
+                values.append(int(value))
+            elif key == "convertible":
+                clauses.append("convertible = ?")
+                values.append(1 if str(value).lower() in ("true", "1") else 0)
+            elif key in vm.COLUMNS:
+                clauses.append(f"{key} = ?")
+                values.append(value)
+            else:
+                raise ValueError(f"Unknown filter {key!r}.")
+        return " AND ".join(clauses), values
+
+    def find (self, sort=None, order="asc", limit=None, offset=0, **filters):
+        """
+        Returns the cars matching the json-server style filters (brand, model, production_year_gte,
+        production_year_lte, convertible), sorted by one of `vehicle_module.COLUMNS`.
+        """
+        where, values = self._where(filters)
+        query = f"SELECT record FROM vehicles WHERE {where}"
+        if sort:
+            if sort not in vm.COLUMNS:
+                raise ValueError(f"Unknown column {sort!r}.")
+            query += f" ORDER BY {sort} {'DESC' if order == 'desc' else 'ASC'}"
+        if limit is not None:
+            query += " LIMIT ? OFFSET ?"
+            values += [limit, offset]
+        return [json.loads(row[0]) for row in self.db.execute(query, values)]
+
+    def fetch_page (self, page=1, limit=20, sort=None, order="asc", filters=None):
+        """ Same contract as `vehicle_module.fetch_page`, answered from the replica. """
+        where, values = self._where(filters)
+        total = self.db.execute(f"SELECT COUNT(*) FROM vehicles WHERE {where}", values).fetchone()[0]
+        return self.find(sort, order, limit, (page - 1) * limit, **(filters or {})), total
+
+    # Offline changes.
+    def queue (self, op, cid, data=None):
+        """
+        Applies a change ("add", "update" or "delete") to the replica and queues it for the server.
+
+        Returns:
+        str or None: An error message if the change cannot be applied locally, None otherwise.
+        """
+        cid = str(cid)
+        row = self.db.execute("SELECT record, server_digest, deleted, dirty FROM vehicles WHERE id = ?", (cid,)).fetchone()
+        exists = row is not None and not row[2]
+        if op == "add" and exists:
+            return f"The cid {cid} is already in the database."
+        if op in ("update", "delete") and not exists:
+            return f"The cid {cid} is not in the database."
+        # The server will hold the local version once the earlier queued changes are replayed.
+        if row is None:
+            base = None
+        elif row[3]:
+            base = None if row[2] else digest(json.loads(row[0]))
+        else:
+            base = row[1]
+        server_digest = row[1] if row else None
+        with self.db:
+            if op == "delete":
+                self.db.execute("UPDATE vehicles SET deleted = 1, dirty = 1 WHERE id = ?", (cid,))
+            else:
+                self._write(dict(data, id=cid), server_digest, dirty=1)
+            self.db.execute("INSERT INTO pending (op, id, data, base_digest) VALUES (?, ?, ?, ?)",
+                            (op, cid, None if data is None else json.dumps(dict(data, id=cid)), base))
+        return None
+
+    def replay (self, client):
+        """
+        Sends the queued changes to the server in order.
+
+        Before each change the server version of the car is fetched; if its digest differs from the
+        version the change was made against, the change is moved to the conflicts table and the local
+        car is reset to the server version at the next `sync`. Otherwise the fetched version is the
+        one the change was queued against, and updates and deletes are sent with
+        `vehicle_module.conditional_write` against it (If-Match with its ETag, the changed fields
+        only, and its "version" incremented), so a change made on the server since the check is
+        reported as a conflict too instead of being overwritten. Replaying stops at the first
+        communication or server error, keeping the rest of the queue.
+
+        Returns:
+        dict: The number of changes "replayed", the list of "conflicts" (op, id, server record) and
+              the number still "pending".
+        """
+        summary = {"replayed": 0, "conflicts": []}
+        for seq, op, cid, data, base in self.db.execute(
+                "SELECT seq, op, id, data, base_digest FROM pending ORDER BY seq").fetchall():
+            try:
+                server_record, etag = vm.fetch_car(client, cid)
+            except (requests.RequestException, ValueError):
+                break
+            if digest(server_record) != base:
+                self._conflict(seq, op, cid, data, server_record)
+                summary["conflicts"].append((op, cid, server_record))
+                continue
+            record = None if data is None else json.loads(data)
+            if op == "add":
+                try:
+                    reply = client.post(record)
+                except requests.RequestException:
+                    break
+                if reply.status_code != requests.codes.created:
+                    break
+                record = reply.json() if reply.content else record
+            else:
+                changes = vm.changed_fields(server_record, record) if op == "update" else None
+                if op == "update" and not changes:
+                    record = server_record
+                else:
+                    result = vm.conditional_write(client, op, cid, changes, server_record, etag)
+                    if result.get("conflict"):
+                        self._conflict(seq, op, cid, data, result["current"])
+                        summary["conflicts"].append((op, cid, result["current"]))
+                        continue
+                    if not result["ok"]:
+                        break
+                    record = result.get("data")
+            with self.db:
+                self.db.execute("DELETE FROM pending WHERE seq = ?", (seq,))
+                self._settle(cid, digest(record), record)
+            summary["replayed"] += 1
+        summary["pending"] = self.pending_count()
+        return summary
+
+    def _conflict (self, seq, op, cid, data, server_record):
+        # The change is moved to the conflicts table, with the server version it conflicts with.
+        with self.db:
+            self.db.execute("INSERT INTO conflicts (seq, op, id, data, server_record) VALUES (?, ?, ?, ?, ?)",
+                            (seq, op, cid, data, json.dumps(server_record)))
+            self.db.execute("DELETE FROM pending WHERE seq = ?", (seq,))
+            self._settle(cid, None)
+
+    def _settle (self, cid, server_digest, record=None):
+        # Once no change of the car is pending any more, the local row is clean again, holding the 
+        # server version of the car when it is known.
+        if self.db.execute("SELECT 1 FROM pending WHERE id = ?", (cid,)).fetchone():
+            return
+        self.db.execute("DELETE FROM vehicles WHERE id = ? AND deleted", (cid,))
+        if record is not None:
+            self._write(record, server_digest, dirty=0)
+        else:
+            self.db.execute("UPDATE vehicles SET dirty = 0, server_digest = ? WHERE id = ?", (server_digest, cid))
+
+    # Synchronisation.
+    def upsert (self, record):
+        """ Stores the server version of a car; a car with queued changes keeps its local version. """
+        cid, record_digest = str(record.get("id")), digest(record)
+        if self.db.execute("SELECT 1 FROM vehicles WHERE id = ? AND dirty", (cid,)).fetchone():
+            self.db.execute("UPDATE vehicles SET server_digest = ? WHERE id = ?", (record_digest, cid))
+        else:
+            self._write(record, record_digest, dirty=0)
+
+    def remove (self, cid):
+        """ Forgets a car removed from the server; a car with queued changes keeps its local version. """
+        cid = str(cid)
+        removed = self.db.execute("DELETE FROM vehicles WHERE id = ? AND NOT dirty", (cid,)).rowcount
+        self.db.execute("UPDATE vehicles SET server_digest = NULL WHERE id = ?", (cid,))
+        return bool(removed)
+
+    def ids (self):
+        """ Returns the ids of the cars known to be on the server. """
+        return [row[0] for row in self.db.execute("SELECT id FROM vehicles WHERE server_digest IS NOT NULL")]
+
+    def __len__ (self):
+        return self.db.execute("SELECT COUNT(*) FROM vehicles WHERE server_digest IS NOT NULL").fetchone()[0]
+
+    def sync (self, client):
+        """
+        Brings the replica up to date with the server.
+
+        Once the replica has been filled, `vehicle_module.delta_sync` is used whenever the server 
+        supports it, so only the changed cars are transferred. Otherwise the collection is requested 
+        with the ETag of the last sync, so nothing is transferred when it has not changed; when it has, 
+        it is streamed and parsed one car at a time, and only the rows whose digest changed are written. 
+        Cars with queued changes keep their local version.
+
+        Returns:
+        int or None: The number of changes applied, or None if the server did not reply with 200 OK
+                     or 304 Not Modified.
+
+        Exceptions:
+        requests.RequestException: If there is a communication error.
+        """
+        state = json.loads(self._meta("sync") or "null")
+        if self.is_synced() and state and state["mode"] != "full":
+            with self.db:
+                changes = vm.delta_sync(client, self, state)
+                if changes is not None:
+                    self._meta("sync", json.dumps(state))
+                    return changes
+
+        headers = {}
+        if self._meta("etag") and self.is_synced() and state and state["mode"] == "full":
+            headers["If-None-Match"] = self._meta("etag")
+        state = vm.start_sync(client)
+        with client.get(headers=headers, stream=True) as reply:
+            if reply.status_code == requests.codes.not_modified:
+                return 0
+            if reply.status_code != requests.codes.ok:
+                return None
+            known = dict(self.db.execute("SELECT id, server_digest FROM vehicles WHERE NOT dirty"))
+            dirty = {row[0] for row in self.db.execute("SELECT id FROM vehicles WHERE dirty")}
+            changes = count = tombstones = 0
+            hwm = None
+            with self.db:
+                for record in vm.iter_json_array(reply.iter_content(65536)):
+                    if record.get("updated_at") is not None:
+                        hwm = record["updated_at"] if hwm is None else max(hwm, record["updated_at"])
+                    if record.get("deleted"):
+                        # A tombstone: the car is left in `known` and removed below.
+                        tombstones += 1
+                        continue
+                    count += 1
+                    cid, record_digest = str(record.get("id")), digest(record)
+                    if cid in dirty:
+                        self.db.execute("UPDATE vehicles SET server_digest = ? WHERE id = ?", (record_digest, cid))
+                        dirty.discard(cid)
+                    elif known.pop(cid, 0) != record_digest:
+                        self._write(record, record_digest, dirty=0)
+                        changes += 1
+                # What is left was removed from the server.
+                self.db.executemany("DELETE FROM vehicles WHERE id = ?", [(cid,) for cid in known])
+                self.db.executemany("UPDATE vehicles SET server_digest = NULL WHERE id = ?", [(cid,) for cid in dirty])
+                changes += len(known)
+                state = vm.prime_slices(client, vm.finish_sync(state, count, hwm, tombstones, reply.headers.get("ETag")))
+                self._meta("sync", json.dumps(state))
+                self._meta("etag", reply.headers.get("ETag") or "")
+                self._meta("synced", "1")
+        return changes
+
+
+# Function to add a car while offline.
+def add_car_offline (replica):
+    """ Prompts for a new car like `vehicle_module.add_car` and queues it in the replica. """
+    data = vm.input_car_data (True)
+    if data.get("id") is None:
+        print ("A Car ID is needed while working offline.")
+        return
+    error = replica.queue("add", data["id"], data)
+    print (error or f'The entry {json.dumps(data)} will be posted when the server is back.')
+
+
+# Function to delete a car while offline.
+def delete_car_offline (replica):
+    """ Prompts for a Car ID like `vehicle_module.delete_car` and queues its deletion in the replica. """
+    cid = vm.enter_id ()
+    if cid is None:
+        print ("No Car ID entered, nothing to delete.")
+        return
+    error = replica.queue("delete", cid)
+    print (error or f'The entry of {cid} will be deleted when the server is back.')
+
+
+# Function to update a car while offline.
+def update_car_offline (replica):
+    """ Prompts for a Car ID and new data like `vehicle_module.update_car` and queues the update in the replica. """
+    cid = vm.enter_id ()
+    if cid is None:
+        print ("No Car ID entered, nothing to update.")
+        return
+    data = vm.input_car_data (False)
+    error = replica.queue("update", cid, data)
+    print (error or f'The new data {data} will be sent for cid no. {cid} when the server is back.')
@@ -0,0 +1,149 @@
+import random
+import threading
+import time
+
+""" This module keeps the client usable when a server is slow, flaky or down. `VehicleClient`
+    sends every request through these parts:
+        - `RetryPolicy` decides which failed attempts are sent again and how long to wait first:
+          exponential backoff with full jitter (a random wait between 0 and base * 2**attempt,
+          capped), or the Retry-After of the server. Attempts that never reached the server
+          (connection refused, connect timeout) are retried for every method; the others only for
+          idempotent methods (GET, HEAD, PUT, DELETE, OPTIONS) or requests carrying an
+          Idempotency-Key, so an add or a conditional update is never applied twice.
+        - `CircuitBreaker` counts consecutive failures. Once the server failed `failure_threshold`
+          times, calls fail at once for `reset_timeout` seconds instead of each waiting for its
+          timeouts; then one trial call is let through, and its outcome closes or reopens it.
+        - `HealthProbe` checks the server from a background thread every few seconds (a HEAD
+          request, no car data), so the menu knows whether the server is up without blocking, and
+          a recovered server closes the circuit without waiting for the reset timeout.
+    The parts do not depend on the HTTP library: the client reports the outcome of every attempt.
+"""
+
+IDEMPOTENT_METHODS = frozenset(("GET", "HEAD", "PUT", "DELETE", "OPTIONS"))
+# Replies that say the server is overloaded or restarting, worth another attempt later.
+RETRY_STATUSES = frozenset((429, 502, 503, 504))
+
+
+# Retry decisions and waits.
+class RetryPolicy:
+    """
+    Parameters:
+    - retries (int): The number of attempts made after the first one.
+    - backoff_factor (float): The base of the exponential backoff, in seconds.
+    - backoff_max (float): The longest wait between two attempts, in seconds.
+    """
+    def __init__ (self, retries=3, backoff_factor=0.3, backoff_max=10.0):
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+        self.backoff_max = backoff_max
+
+    def should_retry (self, method, headers, attempt, sent=True, status=None):
+        """
+        Tells if a failed attempt (`attempt` counts from 0) is sent again. `sent` is False when the
+        request never reached the server; `status` is the HTTP status of a reply, None for an error.
+        """
+        if attempt >= self.retries:
+            return False
+        if status is not None and status not in RETRY_STATUSES:
+            return False
+        return not sent or method.upper() in IDEMPOTENT_METHODS or "Idempotency-Key" in (headers or {})
+
+    def delay (self, attempt, retry_after=None):
+        """ Returns the seconds to wait before the next attempt, with full jitter, or the server's Retry-After (capped). """
+        if retry_after is not None:
+            try:
+                return min(max(float(retry_after), 0.0), self.backoff_max)
+            except ValueError:
+                pass
+        return random.uniform(0, min(self.backoff_max, self.backoff_factor * 2 ** attempt))
+
+
+# Fail-fast switch of one server.
+class CircuitBreaker:
+    """
+    Closed: calls go through. Open: calls are refused until `reset_timeout` seconds have passed.
+    Half-open: one trial call goes through, the others are refused until it ends.
+
+    Parameters:
+    - failure_threshold (int): The consecutive failures that open the circuit.
+    - reset_timeout (float): The seconds the circuit stays open before a trial call.
+    """
+    def __init__ (self, failure_threshold=5, reset_timeout=30.0, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    def allow (self):
+        """ Returns True if a call may be sent now. """
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and self.clock() - self.opened_at >= self.reset_timeout:
+                self.state = "half-open"
+                return True
+            return False
+
+    def success (self):
+        """ Records a call the server answered: the circuit closes. """
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+
+    def failure (self):
+        """ Records a failed call (no reply, or a 5xx / 429 reply). """
+        with self._lock:
+            self.failures += 1
+            if self.state == "half-open" or self.failures >= self.failure_threshold:
+                self.state = "open"
+                self.opened_at = self.clock()
+
+    def retry_in (self):
+        """ Returns the seconds until the next trial call (0 if calls go through). """
+        with self._lock:
+            if self.state != "open":
+                return 0.0
+            return max(0.0, self.reset_timeout - (self.clock() - self.opened_at))
+
+
+# Background check of a server.
+class HealthProbe:
+    """
+    Calls `check()` (which returns True when the server is up) right away and then every
+    `interval` seconds, from a daemon thread.
+    """
+    def __init__ (self, check, interval=5.0):
+        self.check = check
+        self.interval = interval
+        self.healthy = None
+        self.checked_at = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start (self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        return self
+
+    def _run (self):
+        while True:
+            try:
+                healthy = bool(self.check())
+            except Exception:
+                healthy = False
+            self.healthy, self.checked_at = healthy, time.monotonic()
+            if self._stop.wait(self.interval):
+                return
+
+    def stop (self):
+        self._stop.set()
+
+    def status (self):
+        """ Returns the last result (True or False), or None before the first check or when it is older than two intervals. """
+        if self.checked_at is None or time.monotonic() - self.checked_at > 2 * self.interval:
+            return None
+        return self.healthy
@@ -0,0 +1,241 @@
+import bisect
+import heapq
+import re
+
+""" This module finds cars by brand and model from free text, e.g. "bmw 12sd", "toyo" or "lexsu".
+
+    `SearchIndex` splits the brand and model of every car into lower-case words (terms) and keeps:
+        - the sorted list of the distinct terms, searched with bisect for prefixes (the leaves of a
+          trie, without the per-character nodes),
+        - the cars of every term (postings),
+        - the terms of every trigram, so a misspelt word is only compared (by edit distance) with
+          the terms that share trigrams with it.
+    The index is built once from a collection and then kept up to date with `add`, `update` and
+    `remove`; only the terms of the changed car are touched.
+
+    Every word of the query must match a term of the car: exactly (score 1), as a prefix (up to
+    0.9, more for longer prefixes) or within the edit distance allowed for its length (up to 0.7).
+    A car scores the mean of its best match for every word, and the hits are ranked by score, ties
+    in the order the cars were indexed.
+
+    Example:
+        index = SearchIndex(vehicle_module.stream_cars("http://localhost", 3000, "vehicles"))
+        index.search("toyta a54")   # [("2000", 0.79...)]
+"""
+
+FIELDS = ("brand", "model")
+WORD_PATTERN = re.compile(r"[^\W_]+")
+
+
+# Function to split a text into search terms.
+def terms_of (text):
+    """ Returns the lower-case words of a text (letters and digits). """
+    return WORD_PATTERN.findall(text.lower()) if isinstance(text, str) else []
+
+
+# Function to list the trigrams of a term.
+def trigrams (term):
+    """ Returns the set of trigrams of a term, padded so the first and last letters count as much as the others. """
+    padded = f"  {term} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+# Function to tell how many typos a word may contain.
+def allowed_typos (word):
+    """ Returns 0 for words of up to 3 characters, 1 up to 6 and 2 for longer words. """
+    return 0 if len(word) <= 3 else 1 if len(word) <= 6 else 2
+
+
+# Function to compute a bounded edit distance.
+def edit_distance (a, b, limit):
+    """
+    Returns the number of typos between `a` and `b` (insertions, deletions, substitutions and
+    swaps of two neighbouring letters), or `limit + 1` as soon as it is known to be larger than `limit`.
+    """
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    before, previous = None, list(range(len(b) + 1))
+    for i, char in enumerate(a, 1):
+        current = [i]
+        for j, other in enumerate(b, 1):
+            distance = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char != other))
+            if i > 1 and j > 1 and char == b[j - 2] and a[i - 2] == other:
+                distance = min(distance, before[j - 2] + 1)
+            current.append(distance)
+        if min(current) > limit:
+            return limit + 1
+        before, previous = previous, current
+    return previous[-1]
+
+
+# In-memory search index over brand and model.
+class SearchIndex:
+    """
+    Prefix and typo-tolerant search over the brand and model of a collection.
+
+    Parameters:
+    - records (iterable): The car records to index (dictionaries with an "id").
+    """
+    def __init__ (self, records=()):
+        self._terms = []
+        self._postings = {}
+        self._trigrams = {}
+        self._documents = {}
+        self._order = {}
+        self._added = 0
+        self.add_many(records)
+
+    def __len__ (self):
+        return len(self._documents)
+
+    def __contains__ (self, cid):
+        return str(cid) in self._documents
+
+    def _store (self, record, split):
+        # Stores the terms and postings of a car and returns the terms that are new to the index.
+        cid = str(record.get("id"))
+        if cid in self._documents:
+            self.remove(cid)
+        terms = ()
+        for field in FIELDS:
+            text = record.get(field)
+            if isinstance(text, str):
+                words = split.get(text)
+                if words is None:
+                    words = split[text] = tuple(terms_of(text))
+                terms += words
+        if len(terms) > 1:
+            terms = tuple(dict.fromkeys(terms))
+        self._documents[cid] = terms
+        self._order[cid] = self._added
+        self._added += 1
+        new = []
+        for term in terms:
+            postings = self._postings.get(term)
+            if postings is None:
+                postings = self._postings[term] = {}
+                new.append(term)
+            postings[cid] = None
+        return new
+
+    def _index_trigrams (self, terms):
+        for term in terms:
+            for trigram in trigrams(term):
+                self._trigrams.setdefault(trigram, set()).add(term)
+
+    def add (self, record):
+        """ Indexes a car; a car with the same id is replaced. """
+        new = self._store(record, {})
+        for term in new:
+            bisect.insort(self._terms, term)
+        self._index_trigrams(new)
+
+    def add_many (self, records):
+        """
+        Indexes many cars, e.g. a whole collection. The words of every distinct brand and model are
+        only split once, and the term list is sorted once at the end.
+        """
+        split = {}
+        new = []
+        for record in records:
+            new += self._store(record, split)
+        if new:
+            self._terms = sorted(self._postings)
+            # A term may have been added and removed again by a later car with the same id.
+            self._index_trigrams(term for term in set(new) if term in self._postings)
+
+    def update (self, record):
+        """ Re-indexes a changed car. """
+        self.add(record)
+
+    def remove (self, cid):
+        """ Removes a car from the index. Returns False if it was not indexed. """
+        terms = self._documents.pop(str(cid), None)
+        if terms is None:
+            return False
+        del self._order[str(cid)]
+        for term in terms:
+            postings = self._postings[term]
+            del postings[str(cid)]
+            if not postings:
+                # The last car with this term is gone: forget the term itself.
+                del self._postings[term]
+                position = bisect.bisect_left(self._terms, term)
+                if position < len(self._terms) and self._terms[position] == term:
+                    del self._terms[position]
+                for trigram in trigrams(term):
+                    matching = self._trigrams.get(trigram, set())
+                    matching.discard(term)
+                    if not matching:
+                        self._trigrams.pop(trigram, None)
+        return True
+
+    def matches (self, word):
+        """ Returns {term: score} for the terms matching one query word exactly, as a prefix or with typos. """
+        found = {}
+        terms = self._terms
+        for position in range(bisect.bisect_left(terms, word), len(terms)):
+            term = terms[position]
+            if not term.startswith(word):
+                break
+            found[term] = 1.0 if term == word else 0.8 + 0.1 * len(word) / len(term)
+        typos = allowed_typos(word)
+        if typos:
+            grams = trigrams(word)
+            shared = {}
+            for trigram in grams:
+                for term in self._trigrams.get(trigram, ()):
+                    shared[term] = shared.get(term, 0) + 1
+            # Every edit changes at most 3 trigrams, so terms sharing fewer cannot be close enough.
+            needed = len(grams) - 3 * typos
+            for term, count in shared.items():
+                if term in found or count < needed:
+                    continue
+                distance = edit_distance(word, term, typos)
+                if distance <= typos:
+                    found[term] = 0.7 * (1 - distance / max(len(word), len(term)))
+        return found
+
+    def search (self, query, limit=10):
+        """
+        Returns the best matching cars of a query as [(id, score)], the best first.
+
+        Parameters:
+        query (str): Free text, e.g. "bmw 12sd"; every word must match the brand or the model.
+        limit (int): The maximum number of hits.
+        """
+        words = list(dict.fromkeys(terms_of(query)))
+        if not words or limit <= 0:
+            return []
+        order = self._order
+        if len(words) == 1:
+            # The cars of the best terms come first: take them in score order until the limit is reached.
+            groups = {}
+            for term, score in self.matches(words[0]).items():
+                groups.setdefault(score, []).append(self._postings[term])
+            hits = []
+            seen = set()
+            for score in sorted(groups, reverse=True):
+                postings = groups[score]
+                for cid in postings[0] if len(postings) == 1 else heapq.merge(*postings, key=order.__getitem__):
+                    if cid not in seen:
+                        seen.add(cid)
+                        hits.append((cid, score))
+                        if len(hits) == limit:
+                            return hits
+            return hits
+        scores = []
+        for word in words:
+            best = {}
+            # Lower scores first, so the best score of a car is the one left in the dict.
+            for term, score in sorted(self.matches(word).items(), key=lambda item: item[1]):
+                best.update(dict.fromkeys(self._postings[term], score))
+            if not best:
+                return []
+            scores.append(best)
+        scores.sort(key=len)
+        candidates = scores[0].keys()
+        for best in scores[1:]:
+            candidates = candidates & best.keys()
+        hits = ((cid, sum(best[cid] for best in scores) / len(scores)) for cid in candidates)
+        return heapq.nlargest(limit, hits, key=lambda hit: (hit[1], -order[hit[0]]))
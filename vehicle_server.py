@@ -0,0 +1,575 @@
+import argparse
+import hashlib
+import itertools
+import json
+import os
+import re
+import secrets
+import sys
+import threading
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+""" This module is a small REST server for the vintage car database, written in Python so the
+    application does not need Node.js. It serves a JSON file shaped like `vehicle.json` with the
+    contract of `json-server --watch vehicle.json`:
+        - GET, HEAD and POST on /{database}: list (with filters, sorting and paging) and create,
+        - GET, HEAD, PUT, PATCH and DELETE on /{database}/{id}: read, replace, update and remove,
+        - 201 on create, 200 on read, update and delete, 404 for an unknown database or id.
+
+    Every top-level list of the file is a database. The cars are kept in memory in a dictionary
+    keyed by id, so a lookup or a write does not scan the collection, and every request runs in
+    its own thread. Writes are appended to a log next to the file (`vehicle.json.log`, one JSON
+    line per change) instead of rewriting the whole file; after `COMPACT_EVERY` changes (and when
+    the server stops) the file is rewritten once from memory in the background and the log is
+    started again. On start, the file is read and the log replayed on top of it.
+
+    Beyond json-server:
+        - replies carry an ETag (per car, per collection and per query result) and a matching
+          If-None-Match is answered with 304 Not Modified; the car and collection ETags hold a
+          nonce drawn at every start, so a server started without its log (its change numbers
+          start again) never matches a tag of an earlier run,
+        - PUT, PATCH and DELETE with If-Match are refused with 412 when the car changed, a POST with
+          "If-None-Match: *" with 412 when the id is taken (409 without the header), and a PATCH
+          carrying an integer "version" with 409 unless it is the stored version + 1,
+        - GET /{database}/_changes?since=<seq>&limit=<n> returns the changes made after `seq` as
+          {"seq", "changes": [{"seq", "id", "deleted", "record"}], "more"}, and 410 Gone when
+          they are no longer known (e.g. after a restart); `limit=0` only returns the current seq.
+
+    Usage:
+        python vehicle_server.py vehicle.json [--port 3000] [--host localhost] [--compact-every 10000] [--fsync] [--quiet]
+"""
+
+COMPACT_EVERY = 10000
+CHANGES_LIMIT = 1000
+PAGE_LIMIT = 10
+OPERATORS = ("gte", "lte", "ne", "like")
+
+
+# Function to write a value the way it appears in a query string.
+def _text (value):
+    return value if isinstance(value, str) else json.dumps(value)
+
+
+# Function to order the values of a field.
+def _sort_key (value):
+    """ Orders numbers before strings, strings before other values and missing values last. """
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return (0, value, "")
+    if isinstance(value, str):
+        return (1, 0, value)
+    if value is None:
+        return (3, 0, "")
+    return (2, 0, json.dumps(value))
+
+
+# Function to compare a field with a query value.
+def _compare (value, wanted):
+    """ Returns -1, 0 or 1; numbers are compared as numbers when the query value is one. """
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        try:
+            wanted_number = float(wanted)
+            return (value > wanted_number) - (value < wanted_number)
+        except ValueError:
+            pass
+    value = _text(value)
+    return (value > wanted) - (value < wanted)
+
+
+# Function to build the filter of a query.
+def record_filter (query):
+    """
+    Returns a function telling if a record matches the json-server filters of a query, or None if
+    the query has no filter:
+        - field=value (repeated: any of the values), field_ne=value,
+        - field_gte=value and field_lte=value (numbers compared as numbers),
+        - field_like=regex (case insensitive, anywhere in the value).
+    Parameters starting with "_" (paging, sorting) are not filters.
+
+    Exceptions:
+    re.error: If a `_like` value is not a valid regular expression.
+    """
+    tests = []
+    for key, values in query.items():
+        if key.startswith("_"):
+            continue
+        field, _, operator = key.rpartition("_")
+        if not field or operator not in OPERATORS:
+            field, operator = key, "eq"
+        if operator == "eq":
+            tests.append(lambda record, field=field, values=set(values):
+                         field in record and _text(record[field]) in values)
+        elif operator == "ne":
+            tests.append(lambda record, field=field, values=set(values): _text(record.get(field)) not in values)
+        elif operator == "like":
+            patterns = [re.compile(value, re.IGNORECASE) for value in values]
+            tests.append(lambda record, field=field, patterns=patterns:
+                         field in record and all(pattern.search(_text(record[field])) for pattern in patterns))
+        else:
+            sign = 1 if operator == "gte" else -1
+            tests.append(lambda record, field=field, values=values, sign=sign:
+                         field in record and all(_compare(record[field], value) * sign >= 0 for value in values))
+    if not tests:
+        return None
+    return lambda record: all(test(record) for test in tests)
+
+
+# One database of the server.
+class Collection:
+    """
+    The records of one database, keyed by their id as a string, with the sequence number of the
+    last change of every car changed since the server started (`changed`, oldest first, deleted
+    ids included) for the change feed. Records are never modified in place: a write stores a new
+    dictionary, so lists of records taken under the lock stay valid after it is released.
+    """
+    def __init__ (self, records, base, epoch):
+        self.records = {}
+        self.changed = OrderedDict()
+        self.base = base
+        self.seq = base
+        self.epoch = epoch
+        self.next_id = 1
+        self._cache = None
+        missing = []
+        for record in records:
+            if record.get("id") in (None, ""):
+                missing.append(record)
+            else:
+                self.records[str(record["id"])] = record
+                self._count(str(record["id"]))
+        for record in missing:
+            self.put(str(self.next_id), dict(record, id=str(self.next_id)), base)
+
+    def _count (self, cid):
+        if cid.isdigit() and int(cid) >= self.next_id:
+            self.next_id = int(cid) + 1
+
+    def put (self, cid, record, seq):
+        """ Stores (or, with `record` None, removes) car `cid` as the change number `seq`. """
+        if record is None:
+            self.records.pop(cid, None)
+        else:
+            self.records[cid] = record
+            self._count(cid)
+        self.changed[cid] = seq
+        self.changed.move_to_end(cid)
+        self.seq = seq
+        self._cache = None
+
+    def etag (self, cid):
+        """ Returns the ETag of car `cid`: the nonce of the server start and the number of its last change. """
+        return f'"{self.epoch}-{self.changed.get(cid, self.base)}"'
+
+    def changes (self, since, limit):
+        """ Returns the feed of the changes made after `since` (see the module documentation). """
+        found = []
+        for cid in reversed(self.changed):
+            if self.changed[cid] <= since:
+                break
+            found.append(cid)
+        found.reverse()
+        more = len(found) > limit
+        entries = [{"seq": self.changed[cid], "id": cid, "deleted": cid not in self.records,
+                    "record": self.records.get(cid)} for cid in found[:limit]]
+        return {"seq": entries[-1]["seq"] if more else max(self.seq, since), "changes": entries, "more": more}
+
+
+# Request handler of the server.
+class VehicleHandler (BaseHTTPRequestHandler):
+    """ Serves the REST contract described in the module documentation. """
+    protocol_version = "HTTP/1.1"
+    # Headers and body are written separately; without this, Nagle's algorithm delays every reply.
+    disable_nagle_algorithm = True
+    server_version = "VehicleServer/1.0"
+
+    def log_message (self, format, *args):
+        if not self.server.quiet:
+            super().log_message(format, *args)
+
+    def _reply (self, status, body=b"{}", etag=None, headers=None, send_body=True):
+        if not isinstance(body, bytes):
+            body = json.dumps(body).encode()
+        if etag and status == 200 and etag in self._tags("If-None-Match"):
+            status, body = 304, b""
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        if etag:
+            self.send_header("ETag", etag)
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        if send_body:
+            self.wfile.write(body)
+
+    def _error (self, status, message, send_body=True):
+        self._reply(status, {"error": message}, send_body=send_body)
+
+    def _tags (self, header):
+        # The entity tags of an If-Match / If-None-Match header; weak tags are compared as strong ones.
+        value = self.headers.get(header)
+        if value is None:
+            return ()
+        return [tag.strip().removeprefix("W/") for tag in value.split(",")]
+
+    def _target (self):
+        """ Returns (collection name, id or None, query) of the request; the name is None for an unknown database. """
+        parts = urlsplit(self.path)
+        segments = [segment for segment in parts.path.split("/") if segment]
+        if not 1 <= len(segments) <= 2 or segments[0] not in self.server.collections:
+            return None, None, {}
+        return segments[0], (segments[1] if len(segments) == 2 else None), parse_qs(parts.query)
+
+    def _read_body (self):
+        """ 
+        Reads the body of the request. Every handler that may receive one reads it before any reply, 
+        so the unread bytes of a rejected request are not parsed as the next request of the connection.
+        """
+        return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+    def _parse_body (self, body):
+        """ Returns the JSON object sent with the request, or None (after replying 400) if it is not one. """
+        try:
+            record = json.loads(body or b"{}")
+        except ValueError:
+            record = None
+        if not isinstance(record, dict):
+            self._error(400, "the body must be a JSON object")
+            return None
+        return record
+
+    def do_GET (self, send_body=True):
+        name, cid, query = self._target()
+        if name is None:
+            return self._error(404, "not found", send_body)
+        server = self.server
+        if cid == "_changes":
+            try:
+                since = int(query.get("since", ["0"])[0])
+                limit = int(query.get("limit", [str(CHANGES_LIMIT)])[0])
+            except ValueError:
+                return self._error(400, "since and limit must be integers", send_body)
+            feed = server.changes(name, since, limit)
+            if feed is None:
+                return self._error(410, f"the changes since {since} are no longer known", send_body)
+            return self._reply(200, feed, send_body=send_body)
+        if cid is not None:
+            with server.lock:
+                collection = server.collections[name]
+                record = collection.records.get(cid)
+                etag = collection.etag(cid)
+            if record is None:
+                return self._error(404, f"{cid} not found", send_body)
+            return self._reply(200, record, etag, send_body=send_body)
+        if not query:
+            body, etag = server.collection(name)
+            return self._reply(200, body, etag, send_body=send_body)
+        try:
+            rows, total = server.query(name, query)
+        except re.error as e:
+            return self._error(400, f"invalid regular expression ({e})", send_body)
+        except ValueError:
+            return self._error(400, "_page, _limit, _start and _end must be integers", send_body)
+        body = json.dumps(rows).encode()
+        etag = '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+        headers = {} if total is None else {"X-Total-Count": str(total)}
+        self._reply(200, body, etag, headers, send_body)
+
+    def do_HEAD (self):
+        self.do_GET(send_body=False)
+
+    def do_POST (self):
+        name, cid, _ = self._target()
+        body = self._read_body()
+        if name is None or cid is not None:
+            return self._error(404, "not found")
+        record = self._parse_body(body)
+        if record is None:
+            return
+        with self.server.lock:
+            collection = self.server.collections[name]
+            if record.get("id") in (None, ""):
+                record["id"] = str(collection.next_id)
+            cid = str(record["id"])
+            if cid in collection.records:
+                status = 412 if "*" in self._tags("If-None-Match") else 409
+                return self._error(status, f"{cid} already exists")
+            self.server.write(name, cid, record)
+            etag = collection.etag(cid)
+        self._reply(201, record, etag, {"Location": f"/{name}/{cid}"})
+
+    def do_PUT (self, merge=False):
+        name, cid, _ = self._target()
+        body = self._read_body()
+        if name is None or cid is None:
+            return self._error(404, "not found")
+        changes = self._parse_body(body)
+        if changes is None:
+            return
+        with self.server.lock:
+            collection = self.server.collections[name]
+            current = collection.records.get(cid)
+            if current is None:
+                return self._error(404, f"{cid} not found")
+            if not self._matches(collection, cid):
+                return self._error(412, f"{cid} was changed by another writer")
+            version = changes.get("version")
+            if merge and type(version) is int and type(current.get("version")) is int and version != current["version"] + 1:
+                return self._error(409, f"version {version} of {cid} does not follow the stored version {current['version']}")
+            record = dict(current, **changes) if merge else changes
+            record["id"] = current["id"]
+            self.server.write(name, cid, record)
+            etag = collection.etag(cid)
+        self._reply(200, record, etag)
+
+    def do_PATCH (self):
+        self.do_PUT(merge=True)
+
+    def do_DELETE (self):
+        name, cid, _ = self._target()
+        self._read_body()
+        if name is None or cid is None:
+            return self._error(404, "not found")
+        with self.server.lock:
+            collection = self.server.collections[name]
+            if cid not in collection.records:
+                return self._error(404, f"{cid} not found")
+            if not self._matches(collection, cid):
+                return self._error(412, f"{cid} was changed by another writer")
+            self.server.write(name, cid, None)
+        self._reply(200)
+
+    def _matches (self, collection, cid):
+        # True if the request has no If-Match header, or one that matches the stored car.
+        tags = self._tags("If-Match")
+        return not tags or "*" in tags or collection.etag(cid) in tags
+
+
+# The vehicle database server.
+class VehicleServer (ThreadingHTTPServer):
+    """
+    Holds the databases in memory and serves them with `VehicleHandler`, one thread per request.
+
+    Parameters:
+    - path (str or None): The JSON file of the databases, e.g. "vehicle.json"; None keeps them in
+      memory only (e.g. as a stand-in in tests and benchmarks).
+    - address (tuple): The (host, port) to listen on; port 0 picks a free port.
+    - data (dict or None): The databases to serve instead of reading `path`, as {name: [records]}.
+    - compact_every (int): The number of logged changes after which the file is rewritten.
+    - fsync (bool): If True, every change is flushed to the disk before it is acknowledged.
+    - quiet (bool): If True, requests are not logged.
+    """
+    daemon_threads = True
+
+    def __init__ (self, path=None, address=("localhost", 3000), data=None, compact_every=COMPACT_EVERY,
+                  fsync=False, quiet=False):
+        super().__init__(address, VehicleHandler)
+        self.path = path
+        self.log_path = path + ".log" if path else None
+        self.compact_every = compact_every
+        self.fsync = fsync
+        self.quiet = quiet
+        self.lock = threading.RLock()
+        self.seq = 0
+        # Change numbers restart when the log is lost, so the ETags also carry a nonce of this start.
+        self.epoch = secrets.token_hex(4)
+        self.logged = 0
+        self._log = None
+        self._compacting = threading.Lock()
+        self._thread = None
+        if data is None and path and os.path.exists(path):
+            with open(path, encoding="utf-8") as file:
+                data = json.load(file)
+        elif data is None:
+            data = {"vehicles": []}
+        # Values that are not lists (e.g. settings) are not databases, but are written back.
+        self.other = {key: value for key, value in data.items() if not isinstance(value, list)}
+        entries = []
+        if self.log_path:
+            for log_path in (self.log_path + ".old", self.log_path):
+                entries += self._read_log(log_path)
+        changes = [entry for entry in entries if "collection" in entry]
+        self.seq = max([entry["seq"] for entry in entries] + [1])
+        # The file holds the databases as they were before the first logged change.
+        base = changes[0]["seq"] - 1 if changes else self.seq
+        self.collections = {name: Collection(records, base, self.epoch)
+                            for name, records in data.items() if isinstance(records, list)}
+        for entry in changes:
+            collection = self.collections.setdefault(entry["collection"], Collection((), base, self.epoch))
+            collection.put(str(entry["id"]), None if entry.get("deleted") else entry["record"], entry["seq"])
+        if self.log_path:
+            self._log = open(self.log_path, "a", encoding="utf-8")
+            if changes:
+                self.compact()
+
+    @staticmethod
+    def _read_log (log_path):
+        entries = []
+        if os.path.exists(log_path):
+            with open(log_path, encoding="utf-8") as file:
+                for line in file:
+                    try:
+                        entries.append(json.loads(line))
+                    except ValueError:
+                        # The last line of a log may be cut short by a crash.
+                        break
+        return entries
+
+    def write (self, name, cid, record):
+        """ Stores (or, with `record` None, removes) a car and logs the change; the caller holds the lock. """
+        self.seq += 1
+        self.collections[name].put(cid, record, self.seq)
+        if self._log is None:
+            return
+        entry = {"seq": self.seq, "collection": name, "id": cid}
+        entry.update({"deleted": True} if record is None else {"record": record})
+        self._log.write(json.dumps(entry) + "\n")
+        self._log.flush()
+        if self.fsync:
+            os.fsync(self._log.fileno())
+        self.logged += 1
+        if self.logged >= self.compact_every and not self._compacting.locked():
+            threading.Thread(target=self.compact, daemon=True).start()
+
+    def compact (self):
+        """
+        Rewrites the file from memory and starts an empty log. The log is renamed first (under the
+        lock, so no change is lost) and only removed once the new file is in place: a crash at any
+        point leaves a file and logs that replay to the same databases.
+        """
+        if not self.log_path or not self._compacting.acquire(blocking=False):
+            return
+        try:
+            with self.lock:
+                self._log.close()
+                os.replace(self.log_path, self.log_path + ".old")
+                self._log = open(self.log_path, "a", encoding="utf-8")
+                # The first line of the new log keeps the sequence number for the change feed.
+                self._log.write(json.dumps({"seq": self.seq}) + "\n")
+                self._log.flush()
+                self.logged = 0
+                data = dict(self.other)
+                data.update((name, list(collection.records.values())) for name, collection in self.collections.items())
+            temporary = self.path + ".tmp"
+            with open(temporary, "w", encoding="utf-8") as file:
+                json.dump(data, file, indent=2)
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(temporary, self.path)
+            os.remove(self.log_path + ".old")
+        finally:
+            self._compacting.release()
+
+    def collection (self, name):
+        """ 
+        Returns (body, ETag) of a whole database; the body is cached until the next change. The ETag 
+        is the nonce of the server start and the number of the last change.
+        """
+        with self.lock:
+            collection = self.collections[name]
+            if collection._cache is not None:
+                return collection._cache
+            records, seq = list(collection.records.values()), collection.seq
+        body = json.dumps(records).encode()
+        etag = f'"{self.epoch}-{seq}"'
+        with self.lock:
+            if collection.seq == seq:
+                collection._cache = (body, etag)
+        return body, etag
+
+    def query (self, name, query):
+        """
+        Returns (records, total) of a database query: the records matching the filters (see
+        `record_filter`), sorted by `_sort`/`_order` (comma separated, e.g. "brand,model" and
+        "asc,desc") and cut by `_page`/`_limit` or `_start`/`_end`/`_limit`. `total` is the number
+        of matching records when they were cut, None otherwise.
+        """
+        value = lambda key, default=None: query[key][0] if key in query else default
+        start, end, cut = 0, None, True
+        if "_page" in query:
+            limit = int(value("_limit", PAGE_LIMIT))
+            start = (max(int(value("_page")), 1) - 1) * limit
+            end = start + limit
+        elif "_start" in query or "_end" in query or "_limit" in query:
+            start = int(value("_start", 0))
+            end = int(value("_end")) if "_end" in query else (start + int(value("_limit")) if "_limit" in query else None)
+        else:
+            cut = False
+        matches = record_filter(query)
+        with self.lock:
+            records = self.collections[name].records.values()
+            if matches is None and "_sort" not in query:
+                # A plain page is read from the index in place, without copying the whole collection.
+                return list(itertools.islice(records, start, end)), (len(records) if cut else None)
+            rows = list(records) if matches is None else [record for record in records if matches(record)]
+        if "_sort" in query:
+            orders = value("_order", "asc").split(",")
+            fields = value("_sort").split(",")
+            # Sort by the last field first: the sort is stable, so the first field ends up primary.
+            for position in reversed(range(len(fields))):
+                order = orders[min(position, len(orders) - 1)]
+                rows.sort(key=lambda record, field=fields[position]: _sort_key(record.get(field)), reverse=order == "desc")
+        return rows[start:end], (len(rows) if cut else None)
+
+    def changes (self, name, since, limit):
+        """ Returns the change feed of a database after `since`, or None if those changes are no longer known. """
+        with self.lock:
+            collection = self.collections[name]
+            if limit <= 0:
+                return {"seq": self.seq, "changes": [], "more": False}
+            if since < collection.base or since > self.seq:
+                return None
+            return collection.changes(since, limit)
+
+    def start (self):
+        """ Serves requests from a background thread and returns the server. """
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop (self):
+        """ Stops a server started with `start`. """
+        self.shutdown()
+        self.server_close()
+
+    def server_close (self):
+        super().server_close()
+        # Also called when the address cannot be bound, before the log is opened.
+        if getattr(self, "_log", None) is not None:
+            if self.logged:
+                self.compact()
+            self._log.close()
+            self._log = None
+
+
+def main (argv=None):
+    parser = argparse.ArgumentParser(description="Serve a vintage car database file over HTTP (like json-server).")
+    parser.add_argument("file", help="the JSON file of the databases, e.g. vehicle.json (created if missing)")
+    parser.add_argument("--host", default="localhost", help="the host to listen on (default: localhost)")
+    parser.add_argument("--port", "-p", type=int, default=3000, help="the port to listen on (default: 3000)")
+    parser.add_argument("--compact-every", type=int, default=COMPACT_EVERY,
+                        help=f"rewrite the file after this many changes (default: {COMPACT_EVERY})")
+    parser.add_argument("--fsync", action="store_true", help="flush every change to the disk before replying")
+    parser.add_argument("--quiet", "-q", action="store_true", help="do not log the requests")
+    args = parser.parse_args(argv)
+    try:
+        server = VehicleServer(args.file, (args.host, args.port), compact_every=args.compact_every,
+                               fsync=args.fsync, quiet=args.quiet)
+    except (OSError, ValueError) as e:
+        print (f"Cannot serve {args.file}: {e}", file=sys.stderr)
+        return 1
+    print (f"Serving {args.file} on http://{args.host}:{server.server_address[1]}")
+    for name, collection in server.collections.items():
+        print (f"    /{name}: {len(collection.records)} records")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit (main())
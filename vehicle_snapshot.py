@@ -0,0 +1,260 @@
+import gzip
+import io
+import json
+import os
+import struct
+from array import array
+
+""" This module writes and reads compact snapshots of the vintage car database: compressed files
+    (gzip, or zstd with the optional `zstandard` package) and a columnar binary layout.
+
+    The columnar layout ("VCOL", version 1) stores, after a header with the number of cars:
+        - the ids, as one block of UTF-8 text separated by newlines (ids are read back as strings),
+        - brand and model, dictionary-encoded: the list of distinct values and one code per car,
+        - production_year as int16 (MISSING_YEAR when missing),
+        - convertible as two bitsets (is set / is true),
+        - the fields outside the five columns, as JSON keyed by row.
+    All integers are little-endian. `read_columnar` loads every column with bulk array reads.
+"""
+
+MAGIC = b"VCOL"
+VERSION = 1
+COLUMNS = ['id', 'brand', 'model', 'production_year', 'convertible']
+# The int16 value standing for a missing production year.
+MISSING_YEAR = -32768
+
+
+# Function to choose the compression of a file from its name.
+def compression_of (path):
+    """ Returns "gzip" for .gz files, "zstd" for .zst / .zstd files and "none" otherwise. """
+    extension = os.path.splitext(path)[1].lower()
+    return {".gz": "gzip", ".zst": "zstd", ".zstd": "zstd"}.get(extension, "none")
+
+
+# Function to strip the compression extension from a file name.
+def base_name (path):
+    """ Returns the file name without its compression extension, e.g. "cars.jsonl" for "cars.jsonl.gz". """
+    return os.path.splitext(path)[0] if compression_of(path) != "none" else path
+
+
+# Function to open a file with optional compression.
+def open_file (path, mode="rb", compression=None):
+    """
+    Opens a file in binary mode ("rb" or "wb"), compressing or decompressing it on the fly.
+
+    Parameters:
+    path (str or file): The file name, or a binary file object that is already open.
+    mode (str): "rb" or "wb".
+    compression (str or None): "none", "gzip" or "zstd"; None picks it from the file extension.
+    """
+    compression = compression or (compression_of(path) if isinstance(path, str) else "none")
+    raw = open(path, mode) if isinstance(path, str) else path
+    if compression == "gzip":
+        return gzip.GzipFile(fileobj=raw, mode=mode)
+    if compression == "zstd":
+        try:
+            import zstandard
+        except ImportError:
+            raise ImportError("zstd compression needs the zstandard package: pip install zstandard") from None
+        if mode == "wb":
+            return zstandard.ZstdCompressor().stream_writer(raw, closefd=isinstance(path, str))
+        return zstandard.ZstdDecompressor().stream_reader(raw, closefd=isinstance(path, str))
+    if compression != "none":
+        raise ValueError(f"Unknown compression {compression!r}.")
+    return raw
+
+
+def _write_block (out, data):
+    out.write(struct.pack("<I", len(data)))
+    out.write(data)
+
+
+def _read_block (file):
+    (size,) = struct.unpack("<I", _read_exactly(file, 4))
+    return _read_exactly(file, size)
+
+
+def _read_exactly (file, size):
+    data = file.read(size)
+    while len(data) < size:
+        more = file.read(size - len(data))
+        if not more:
+            raise ValueError("The columnar snapshot is truncated.")
+        data += more
+    return data
+
+
+# Function to write cars in the columnar layout.
+def write_columnar (records, out):
+    """
+    Writes car records to a binary file in the columnar layout.
+
+    The records are consumed one at a time into compact arrays, so the memory used grows with the
+    encoded size of the collection (a few bytes per car plus the ids) rather than with the records.
+
+    Parameters:
+    records (iterable): The car records.
+    out (file): A binary file opened for writing (e.g. by `open_file`).
+
+    Returns:
+    int: The number of cars written.
+    """
+    ids = []
+    dictionaries = {"brand": {}, "model": {}}
+    codes = {"brand": array("I"), "model": array("I")}
+    years = array("h")
+    is_set = bytearray()
+    is_true = bytearray()
+    extras = {}
+    for row, record in enumerate(records):
+        ids.append(str(record.get("id")))
+        for name in ("brand", "model"):
+            value = record.get(name)
+            codes[name].append(dictionaries[name].setdefault(value, len(dictionaries[name])))
+        year = record.get("production_year")
+        encodable = type(year) is int and MISSING_YEAR < year <= 32767
+        years.append(year if encodable else MISSING_YEAR)
+        if row % 8 == 0:
+            is_set.append(0)
+            is_true.append(0)
+        convertible = record.get("convertible")
+        if convertible is not None:
+            is_set[-1] |= 1 << (row % 8)
+            if convertible:
+                is_true[-1] |= 1 << (row % 8)
+        extra = {key: value for key, value in record.items() if key not in COLUMNS}
+        if year is not None and not encodable:
+            extra["production_year"] = year
+        if extra:
+            extras[row] = extra
+
+    out.write(MAGIC + struct.pack("<BI", VERSION, len(ids)))
+    _write_block(out, "\n".join(ids).encode())
+    for name in ("brand", "model"):
+        values = list(dictionaries[name])
+        _write_block(out, json.dumps(values).encode())
+        # Codes take 1, 2 or 4 bytes, depending on the number of distinct values.
+        typecode = "B" if len(values) <= 0xFF else "H" if len(values) <= 0xFFFF else "I"
+        column = array(typecode, codes[name])
+        out.write(typecode.encode())
+        _write_block(out, _little_endian(column))
+    _write_block(out, _little_endian(years))
+    _write_block(out, bytes(is_set))
+    _write_block(out, bytes(is_true))
+    _write_block(out, json.dumps(extras).encode())
+    return len(ids)
+
+
+def _little_endian (column):
+    if column.itemsize > 1 and struct.pack("=H", 1) != struct.pack("<H", 1):
+        column = array(column.typecode, column)
+        column.byteswap()
+    return column.tobytes()
+
+
+def _from_little_endian (typecode, data):
+    column = array(typecode)
+    column.frombytes(data)
+    if column.itemsize > 1 and struct.pack("=H", 1) != struct.pack("<H", 1):
+        column.byteswap()
+    return column
+
+
+# Function to load a columnar snapshot.
+def read_columnar (source, decode=True):
+    """
+    Loads a columnar snapshot.
+
+    Parameters:
+    source (str or file): The file name (compression is taken from the extension) or a binary file.
+    decode (bool): False keeps the encoded columns: "brand" and "model" are then (distinct values, 
+                   array of codes) pairs and "convertible" is the (is set, is true) pair of bitsets.
+
+    Returns:
+    dict: One list per column of `COLUMNS` ("production_year" is an int16 array with `MISSING_YEAR`
+          for a missing year), plus "extras": a dict from row to the fields outside the columns
+          (and to years that do not fit in int16).
+    """
+    with open_file(source, "rb") as file:
+        header = _read_exactly(file, 9)
+        if header[:4] != MAGIC:
+            raise ValueError("The file is not a columnar snapshot.")
+        version, count = struct.unpack("<BI", header[4:])
+        if version != VERSION:
+            raise ValueError(f"Unsupported columnar snapshot version {version}.")
+        ids = _read_block(file).decode()
+        ids = ids.split("\n") if count else []
+        columns = {"id": ids}
+        for name in ("brand", "model"):
+            values = json.loads(_read_block(file))
+            typecode = _read_exactly(file, 1).decode()
+            codes = _from_little_endian(typecode, _read_block(file))
+            columns[name] = [values[code] for code in codes] if decode else (values, codes)
+        columns["production_year"] = _from_little_endian("h", _read_block(file))
+        is_set = _read_block(file)
+        is_true = _read_block(file)
+        if not decode:
+            columns["convertible"] = (is_set, is_true)
+        else:
+            columns["convertible"] = [bool(is_true[row >> 3] >> (row & 7) & 1) if is_set[row >> 3] >> (row & 7) & 1 else None
+                                      for row in range(count)]
+        columns["extras"] = {int(row): extra for row, extra in json.loads(_read_block(file)).items()}
+    return columns
+
+
+# Function to turn loaded columns back into records.
+def iter_records (columns):
+    """ Yields the car records of columns loaded by `read_columnar`. """
+    extras = columns["extras"]
+    for row, values in enumerate(zip(columns["id"], columns["brand"], columns["model"],
+                                     columns["production_year"], columns["convertible"])):
+        record = dict(zip(COLUMNS, values))
+        if record["production_year"] == MISSING_YEAR:
+            record["production_year"] = None
+        record.update(extras.get(row, ()))
+        yield record
+
+
+# Function to write cars in one of the snapshot formats.
+def write_snapshot (records, out, output_format, format_rows=None):
+    """
+    Writes car records to a binary file as "jsonl", "json", "csv" or "columnar".
+
+    Parameters:
+    records (iterable): The car records, consumed one at a time.
+    out (file): A binary file opened for writing (e.g. by `open_file`).
+    output_format (str): The format.
+    format_rows (callable or None): The function formatting a chunk of rows as CSV text
+                                    (`vehicle_module.format_rows`), needed for "csv".
+
+    Returns:
+    int: The number of cars written.
+    """
+    if output_format == "columnar":
+        return write_columnar(records, out)
+    text = io.TextIOWrapper(out, encoding="utf-8", newline="", write_through=False)
+    count = 0
+    if output_format == "json":
+        text.write("[")
+        for record in records:
+            text.write(("," if count else "") + "\n  " + json.dumps(record))
+            count += 1
+        text.write("\n]\n")
+    elif output_format == "csv":
+        text.write(",".join(COLUMNS) + "\n")
+        chunk = []
+        for record in records:
+            chunk.append(record)
+            if len(chunk) == 1000:
+                text.write(format_rows(chunk, "csv"))
+                count += len(chunk)
+                chunk = []
+        text.write(format_rows(chunk, "csv"))
+        count += len(chunk)
+    else:
+        for record in records:
+            text.write(json.dumps(record) + "\n")
+            count += 1
+    text.flush()
+    text.detach()
+    return count
@@ -0,0 +1,225 @@
+import json
+import math
+import sys
+import threading
+import time
+
+""" This module records where the time of a session goes: request latencies (time to first byte
+    and transfer), payload sizes, JSON decoding, rendering and retries. Recording is off until
+    `enable` is called, and the collected histograms can be printed as a summary or exported as
+    JSON or Prometheus text. Hooks registered with `add_hook` receive every event as it happens.
+
+    Example:
+        vehicle_stats.enable()
+        vehicle_stats.add_hook(lambda event: print(event["metric"], event["value"]))
+        ...
+        print(vehicle_stats.to_prometheus())
+"""
+
+# Upper bounds of the histogram buckets: seconds for timings, bytes for sizes.
+SECONDS_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, math.inf)
+BYTES_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216, 67108864, math.inf)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, math.inf)
+
+# The metrics that are recorded, with their unit and help text.
+METRICS = {
+    "request_seconds": ("seconds", "Total duration of an HTTP request"),
+    "ttfb_seconds": ("seconds", "Time until the reply headers arrived (connection included)"),
+    "transfer_seconds": ("seconds", "Time spent reading the reply body"),
+    "request_bytes": ("bytes", "Size of the request body"),
+    "response_bytes": ("bytes", "Size of the reply body"),
+    "json_decode_seconds": ("seconds", "Time spent decoding JSON replies"),
+    "render_seconds": ("seconds", "Time spent rendering the car list"),
+    "analytics_seconds": ("seconds", "Time spent computing the fleet statistics"),
+    "search_seconds": ("seconds", "Time spent building the search index and searching it"),
+    "retries": ("count", "Retries needed by a request"),
+}
+
+
+# Histogram of one metric with one set of labels.
+class Histogram:
+    """ Counts observations in fixed buckets and keeps their count, sum, minimum and maximum. """
+    def __init__ (self, bounds):
+        self.bounds = bounds
+        self.buckets = [0] * len(bounds)
+        self.count = 0
+        self.total = 0.0
+        self.minimum = math.inf
+        self.maximum = -math.inf
+
+    def observe (self, value):
+        for i, bound in enumerate(self.bounds):
+            if value <= bound:
+                self.buckets[i] += 1
+                break
+        self.count += 1
+        self.total += value
+        self.minimum = min(self.minimum, value)
+        self.maximum = max(self.maximum, value)
+
+    def percentile (self, p):
+        """ Returns the upper bound of the bucket holding the p-th percentile (the maximum for the last bucket). """
+        rank = p / 100 * self.count
+        seen = 0
+        for bound, count in zip(self.bounds, self.buckets):
+            seen += count
+            if seen >= rank and count:
+                return min(bound, self.maximum)
+        return self.maximum
+
+    def as_dict (self):
+        return {"count": self.count, "sum": self.total,
+                "min": self.minimum if self.count else None, "max": self.maximum if self.count else None,
+                "p50": self.percentile(50), "p90": self.percentile(90), "p99": self.percentile(99),
+                "buckets": {("+Inf" if math.isinf(bound) else str(bound)): count
+                            for bound, count in zip(self.bounds, self.buckets)}}
+
+
+_enabled = False
+_trace = None
+_hooks = []
+_histograms = {}
+_lock = threading.Lock()
+
+
+# Function to switch recording on.
+def enable (trace=None):
+    """
+    Starts recording. If `trace` is a file (e.g. `sys.stderr`), every event is also written to it
+    as one line, as soon as it happens.
+    """
+    global _enabled, _trace
+    _enabled = True
+    _trace = trace
+
+
+# Function to switch recording off.
+def disable ():
+    global _enabled, _trace
+    _enabled = False
+    _trace = None
+
+
+def is_enabled ():
+    return _enabled
+
+
+# Function to register a hook.
+def add_hook (hook):
+    """ Calls `hook(event)` for every recorded event; an event is a dict with "metric", "value" and the labels. """
+    _hooks.append(hook)
+
+
+def remove_hook (hook):
+    _hooks.remove(hook)
+
+
+# Function to forget everything recorded so far.
+def reset ():
+    with _lock:
+        _histograms.clear()
+
+
+# Function to record one observation.
+def record (metric, value, **labels):
+    """
+    Adds an observation of `metric` (one of `METRICS`) with the given labels, e.g.
+    `record("request_seconds", 0.012, method="GET", target="collection")`. Does nothing while disabled.
+    """
+    if not _enabled:
+        return
+    key = (metric, tuple(sorted(labels.items())))
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            bounds = {"bytes": BYTES_BUCKETS, "count": COUNT_BUCKETS}.get(METRICS[metric][0], SECONDS_BUCKETS)
+            histogram = _histograms[key] = Histogram(bounds)
+        histogram.observe(value)
+    event = dict(labels, metric=metric, value=value)
+    if _trace is not None:
+        _trace.write(" ".join(f"{key}={value}" for key, value in event.items()) + "\n")
+    for hook in _hooks:
+        hook(event)
+
+
+# Function to time a block of code.
+class timer:
+    """ Context manager recording the duration of its block as `metric`, e.g. `with timer("render_seconds"): ...`. """
+    def __init__ (self, metric, **labels):
+        self.metric = metric
+        self.labels = labels
+
+    def __enter__ (self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__ (self, *exc_info):
+        record(self.metric, time.perf_counter() - self.start, **self.labels)
+
+
+# Function to export the histograms as JSON.
+def to_json ():
+    """ Returns every histogram as a JSON text: a list of {"metric", "labels", ...histogram fields}. """
+    with _lock:
+        items = [dict(histogram.as_dict(), metric=metric, labels=dict(labels))
+                 for (metric, labels), histogram in sorted(_histograms.items())]
+    return json.dumps(items, indent=2)
+
+
+# Function to export the histograms in the Prometheus text format.
+def to_prometheus (prefix="vintage_car_db_"):
+    """ Returns every histogram in the Prometheus text exposition format. """
+    lines = []
+    with _lock:
+        items = sorted(_histograms.items())
+    described = set()
+    for (metric, labels), histogram in items:
+        name = prefix + metric
+        if metric not in described:
+            lines.append(f"# HELP {name} {METRICS[metric][1]}")
+            lines.append(f"# TYPE {name} histogram")
+            described.add(metric)
+        label_text = ",".join(f'{key}="{value}"' for key, value in labels)
+        cumulative = 0
+        for bound, count in zip(histogram.bounds, histogram.buckets):
+            cumulative += count
+            le = "+Inf" if math.isinf(bound) else repr(bound)
+            lines.append(f'{name}_bucket{{{label_text + "," if label_text else ""}le="{le}"}} {cumulative}')
+        lines.append(f"{name}_sum{{{label_text}}} {histogram.total}")
+        lines.append(f"{name}_count{{{label_text}}} {histogram.count}")
+    return "\n".join(lines) + "\n"
+
+
+# Function to build a readable summary.
+def summary ():
+    """ Returns a table with the count, total, p50, p90, p99 and maximum of every histogram. """
+    with _lock:
+        items = sorted(_histograms.items())
+    if not items:
+        return "No statistics recorded.\n"
+    lines = [f"{'metric':<22}{'labels':<40}{'count':>7}{'total':>11}{'p50':>10}{'p90':>10}{'p99':>10}{'max':>10}"]
+    for (metric, labels), histogram in items:
+        unit = METRICS[metric][0]
+
+        def show (value):
+            if unit == "seconds":
+                return f"{value * 1000:.1f}ms"
+            return f"{value:.0f}"
+
+        label_text = ",".join(f"{key}={value}" for key, value in labels)
+        lines.append(f"{metric:<22}{label_text:<40}{histogram.count:>7}{show(histogram.total):>11}"
+                     f"{show(histogram.percentile(50)):>10}{show(histogram.percentile(90)):>10}"
+                     f"{show(histogram.percentile(99)):>10}{show(histogram.maximum):>10}")
+    return "\n".join(lines) + "\n"
+
+
+# Function to write the statistics in the chosen format.
+def dump (output_format="text", out=None):
+    """ Writes the statistics to `out` (default: `sys.stderr`) as "text", "json" or "prometheus". """
+    out = out or sys.stderr
+    if output_format == "json":
+        out.write(to_json() + "\n")
+    elif output_format == "prometheus":
+        out.write(to_prometheus())
+    else:
+        out.write(summary())
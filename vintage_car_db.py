@@ -6,7 +6,19 @@ It connects to a server hosting the database and provides a menu-driven interfac
 Users can add, list, delete, or update car entries in the database using the provided options.
 
 Usage:
-    vintage_car_db.py <server_address> [port_number] [database] [cid]
+    vintage_car_db.py [menu] <server_address> [port_number] [database] [cid]
+    vintage_car_db.py list <server_address> [port_number] [database] [--format table|csv|jsonl]
+    vintage_car_db.py get <cid> <server_address> [port_number] [database]
+    vintage_car_db.py list|get|search ... [--endpoint [NAME=]URL ...] [--endpoints FILE]
+    vintage_car_db.py add <server_address> [port_number] [database] [--id ID --brand B --model M --year Y --convertible y|n] [--json FILE|-]
+    vintage_car_db.py update <cid> <server_address> [port_number] [database] [--brand B ...] [--json FILE|-]
+    vintage_car_db.py delete <cid> <server_address> [port_number] [database]
+    vintage_car_db.py search <query> <server_address> [port_number] [database] [--limit N] [--format table|jsonl]
+    vintage_car_db.py stats <server_address> [port_number] [database] [--input FILE] [--top N] [--format text|json]
+    vintage_car_db.py validate <server_address> [port_number] [database] [--input FILE] [--format text|jsonl]
+    vintage_car_db.py import <file> <server_address> [port_number] [database] [--workers N] [--batch-size N] [--checkpoint FILE]
+    vintage_car_db.py export <server_address> [port_number] [database] [--output FILE] [--format jsonl|csv|json|columnar] [--compress none|gzip|zstd]
+    vintage_car_db.py batch FILE <server_address> [port_number] [database]   (or --batch FILE ...)
     
 Arguments:
     <server_address> (str): The address of the server hosting the vehicle database.
@@ -22,80 +34,531 @@ The script performs the following:
     - Add a new car entry
     - Delete a car entry by ID
     - Update an existing car entry by ID
+    - Search cars by brand and model
 4. Handles errors in communication with the server and input validation.
+5. Keeps a local SQLite replica of the database (under ~/.vintage_car_db, or the file named by the 
+   VINTAGE_CAR_DB_REPLICA environment variable). When the server stops responding the menu keeps 
+   working from the replica; changes are queued and replayed in order once the server is back, 
+   and changes whose car was modified on the server in the meantime are reported as conflicts.
+
+The subcommands run one operation without prompting, so the tool can be used from scripts and 
+cron jobs. `get`, `add`, `update` and `delete` print one JSON result; `add` and `update` take 
+the car as flags or as a JSON object (`--json -` reads it from stdin), and `update` only changes 
+the given fields. `list` prints every car as a table or as CSV / JSONL for piping into other tools, 
+`stats` prints the cars and convertibles per brand, a histogram of the 
+production years by decade, the models listed more than once per brand and the most common brands and models, 
+`search` prints the cars whose brand and model best match a free-text query (prefixes and small 
+typos included), best first, 
+`validate` lists every car that breaks the validation rules, with its id, 
+`export` streams them to a file (JSONL, CSV, JSON or the compact columnar layout, optionally gzip 
+or zstd compressed), and `import` loads cars from a JSON, JSONL or CSV file, validating 
+them with the same rules as the prompts and posting them in parallel batches with a resumable 
+checkpoint. `batch FILE` runs many operations (one JSON object per line, e.g. 
+{"op": "delete", "id": "1234"}) over one connection and prints one JSON result per operation.
+
+`list`, `get` and `search` can read several databases at once, e.g. regional catalogues on different 
+servers: every --endpoint (e.g. eu=http://eu.example.com:3000/vehicles) and every line of the 
+--endpoints file is queried in parallel, next to the server given on the command line if any. 
+The cars are merged by id and tagged with the names of the databases holding them ("source"); 
+an endpoint that fails is reported on stderr and makes the exit code 1, the others are still shown.
+
+Every mode accepts --stats[=text|json|prometheus], which writes a summary of request latencies 
+(time to first byte and transfer), payload sizes, JSON decoding, rendering and retries to stderr 
+on exit, and --trace, which writes every recorded event to stderr as it happens.
+
+The HTTP libraries (requests and urllib3) are only loaded when an operation reaches the server, 
+so --help and argument errors return without paying for their import; `vehicle_benchmark.py 
+--startup` checks the startup time against its target.
+
+Every request has connect and read timeouts (--connect-timeout, --read-timeout), failures that are 
+safe to repeat are retried with jittered exponential backoff (--retries), and a server that keeps 
+failing is not called again for a while (circuit breaker), so a stalled server cannot hang the tool. 
+The menu checks the server from a background probe instead of downloading the car list.
 
 Exit Codes:
-    1 - Incorrect arguments or invalid input
-    2 - ValueError during argument validation
+    0 - Success
+    1 - Invalid input, a failed operation or a server that is not responding
+    2 - Invalid arguments (e.g. a port number outside 1..65535 or a car id that is not numeric)
 """
 
+import argparse
+import atexit
 import json
-import requests
-import vehicle_module as vm
+import os
 import sys
+import time
 
+import vehicle_module as vm
+import vehicle_record
+import vehicle_snapshot
+import vehicle_stats
 
 
-if len(sys.argv) not in [2, 3, 4, 5]:
-    print ("Usage: vintage_car_db.py, <server_address>, [port_number], [database], [cid]")
-    sys.exit(1)
-
-server_address = sys.argv[1]
-
 default_port_number = 3000
 default_database = "vehicles"
 default_cid = None
-
-try:
-    port_number = int(sys.argv[2]) if len(sys.argv)> 2 else default_port_number
-    if not (1 <= port_number <= 65536):
-        raise ValueError (f'Port number musr be an  integer between 1 and 65536, but got {sys.argv[2]}')
-
-    database = sys.argv[3] if len(sys.argv) > 3 else default_database
-    cid = sys.argv[4] if len(sys.argv) == 5 else default_cid
-    if cid and not cid.isdigit():
-        raise ValueError (f'Car id must be mumeric integer.')
-except ValueError as e:
-    print (e)
-    sys.exit (2)
-
-
-
-while True:
-    server_running, vehicle_data = vm.check_server(server_address, port_number, database)
-    # if not vm.check_server(server_address, port_number, database):
-    if not server_running:
-        print("Server is not responding - quitting!")
-        sys.exit (1)
-
-    vm.print_menu ()
-    choice = vm.read_user_choice ()
-    if choice == "0":
-        print ("You exit the program. Bye!")
-        sys.exit (0)
-    elif choice == "1":
-        vm.list_cars (vehicle_data)
-    elif choice  == "2":
-        vm.add_car (server_address, port_number, database)
-    elif choice == "3":
-        vm.delete_car (server_address, port_number, database)
-    elif choice == "4":
-        vm.update_car (server_address, port_number, database)
-    
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
+# Seconds between two syncs of the menu's replica when nothing was written in the meantime.
+REPLICA_SYNC_SECONDS = 60.0
+
+# The subcommands; a first argument that is none of these (nor an option) starts the menu.
+COMMANDS = ("menu", "list", "get", "add", "update", "delete", "search", "stats", "validate", "import", "export", "batch")
+
+
+# Function to apply the instrumentation options.
+def instrumentation_arguments (argv):
+    """
+    Applies --stats[=text|json|prometheus] (a summary of request latencies, payload sizes, JSON 
+    decoding, rendering and retries, written to stderr on exit) and --trace (every event written 
+    to stderr as it happens), which are accepted anywhere on the command line, and returns the 
+    remaining arguments.
+    """
+    remaining = []
+    for argument in argv:
+        if argument == "--trace":
+            vehicle_stats.enable(trace=sys.stderr)
+        elif argument == "--stats" or argument.startswith("--stats="):
+            stats_format = argument.partition("=")[2] or "text"
+            if stats_format not in ("text", "json", "prometheus"):
+                print (f"Unknown statistics format {stats_format!r}, use text, json or prometheus.")
+                sys.exit (1)
+            if not vehicle_stats.is_enabled():
+                vehicle_stats.enable()
+            atexit.register(vehicle_stats.dump, stats_format)
+        else:
+            remaining.append(argument)
+    return remaining
+
+
+# Function to map the older command lines onto the subcommands.
+def legacy_arguments (argv, parser):
+    """ 
+    Rewrites `--batch FILE ...` as `batch FILE ...` and `<server_address> ...` as 
+    `menu <server_address> ...`, so the command lines of earlier versions keep working. 
+    Options placed before the server address or the subcommand (e.g. `--connect-timeout 5`) are 
+    moved after the subcommand, which defines them; their values are told apart from the server 
+    address by the number of values each option of `menu` takes in `parser`.
+    """
+    if "--batch" in argv:
+        index = argv.index("--batch")
+        return ["batch"] + argv[:index] + argv[index + 1:]
+    # argparse has no public way to reach a subparser or its options.
+    subcommands = next(action for action in parser._actions if isinstance(action, argparse._SubParsersAction))
+    values = {}
+    for action in parser._actions + subcommands.choices["menu"]._actions:
+        count = 1 if action.nargs is None or action.nargs == "?" else action.nargs if isinstance(action.nargs, int) else 0
+        values.update(dict.fromkeys(action.option_strings, count))
+    index = 0
+    while index < len(argv):
+        argument = argv[index]
+        if argument.startswith("-"):
+            index += 1 if "=" in argument else 1 + values.get(argument, 0)
+            continue
+        if argument in COMMANDS:
+            return [argument] + argv[:index] + argv[index + 1:]
+        return ["menu"] + argv
+    return argv
+
+
+# Function to check the port number argument.
+def port_number_type (text):
+    try:
+        port_number = int(text)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Port number must be an integer, but got {text}")
+    if not (1 <= port_number <= 65535):
+        raise argparse.ArgumentTypeError(f"Port number must be an integer between 1 and 65535, but got {text}")
+    return port_number
+
+
+# Function to check a timeout argument.
+def seconds_type (text):
+    try:
+        seconds = float(text)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"A timeout must be a number of seconds, but got {text}")
+    if seconds <= 0:
+        raise argparse.ArgumentTypeError(f"A timeout must be positive, but got {text}")
+    return seconds
+
+
+# Function to check the car id argument.
+def cid_type (text):
+    if not text.isdigit():
+        raise argparse.ArgumentTypeError("Car id must be a numeric integer.")
+    return text
+
+
+# Function to check an --endpoint argument.
+def endpoint_type (text):
+    import vehicle_fanout
+    try:
+        return vehicle_fanout.parse_endpoint(text)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+# Function to add the server arguments shared by every subcommand.
+def add_server_arguments (parser, fan_out=False):
+    """ Adds the server arguments; with `fan_out`, the server is optional and --endpoint/--endpoints name more databases. """
+    if fan_out:
+        parser.add_argument("server_address", nargs="?", help="the address of the server hosting the vehicle database "
+                                                              "(optional with --endpoint or --endpoints)")
+        parser.add_argument("--endpoint", action="append", type=endpoint_type, default=[], metavar="[NAME=]URL",
+                            help="another database to read, e.g. eu=http://localhost:3001/vehicles (repeatable)")
+        parser.add_argument("--endpoints", metavar="FILE", help="a file with one [NAME=]URL endpoint per line")
+    else:
+        parser.add_argument("server_address", help="the address of the server hosting the vehicle database")
+    parser.add_argument("port_number", nargs="?", type=port_number_type, default=default_port_number,
+                        help=f"the port number of the server (default: {default_port_number})")
+    parser.add_argument("database", nargs="?", default=default_database,
+                        help=f"the name of the database (default: {default_database})")
+    parser.add_argument("--connect-timeout", type=seconds_type, metavar="SECONDS",
+                        help="seconds to wait for a connection to the server (default: 3.05)")
+    parser.add_argument("--read-timeout", type=seconds_type, metavar="SECONDS",
+                        help="seconds to wait for the server to send data (default: 30)")
+    parser.add_argument("--retries", type=int, metavar="N",
+                        help="attempts made again after a failure that is safe to retry (default: 3)")
+
+
+# Function to add the car data arguments of add and update.
+def add_car_arguments (parser, with_id):
+    if with_id:
+        parser.add_argument("--id", help="the car id (digits only)")
+    parser.add_argument("--brand")
+    parser.add_argument("--model")
+    parser.add_argument("--year", type=int, dest="production_year", help="the production year (1900..2000)")
+    parser.add_argument("--convertible", choices=["y", "n"])
+    parser.add_argument("--json", metavar="FILE", help="read the car as a JSON object from FILE, or from stdin with -")
+
+
+# Function to collect the car data given on the command line.
+def car_data (args):
+    data = {}
+    if args.json:
+        with (sys.stdin if args.json == "-" else open(args.json, encoding="utf-8")) as file:
+            data.update(json.load(file))
+    for key in ("id", "brand", "model", "production_year"):
+        if getattr(args, key, None) is not None:
+            data[key] = getattr(args, key)
+    if args.convertible is not None:
+        data["convertible"] = args.convertible == "y"
+    return data
+
+
+# Function to build the parser of the command line.
+def command_parser ():
+    parser = argparse.ArgumentParser(
+        prog="vintage_car_db.py",
+        description="Manage the vintage car database. Without a subcommand, "
+                    "`vintage_car_db.py <server_address> [port_number] [database] [cid]` starts the menu.",
+        epilog="Every mode also accepts --stats[=text|json|prometheus] and --trace.")
+    commands = parser.add_subparsers(dest="command", required=True, metavar="command")
+
+    command = commands.add_parser("menu", help="manage the cars from an interactive menu (the default)")
+    add_server_arguments(command)
+    command.add_argument("cid", nargs="?", type=cid_type, default=default_cid,
+                         help="a car shown before the first menu")
+
+    command = commands.add_parser("list", help="print every car")
+    add_server_arguments(command, fan_out=True)
+    command.add_argument("--format", choices=["table", "csv", "jsonl"], default="table",
+                         help="output format; csv and jsonl are meant for piping into other tools (default: table)")
+
+    command = commands.add_parser("get", help="print one car as JSON")
+    command.add_argument("cid", help="the car id")
+    add_server_arguments(command, fan_out=True)
+
+    command = commands.add_parser("add", help="add a car given with flags or as JSON")
+    add_server_arguments(command)
+    add_car_arguments(command, True)
+
+    command = commands.add_parser("update", help="change the given fields of a car")
+    command.add_argument("cid", help="the car id")
+    add_server_arguments(command)
+    add_car_arguments(command, False)
+
+    command = commands.add_parser("delete", help="delete a car")
+    command.add_argument("cid", help="the car id")
+    add_server_arguments(command)
+
+    command = commands.add_parser("search", help="find cars by brand and model, tolerating prefixes and typos")
+    command.add_argument("query", help='the words to look for, e.g. "bmw 12sd" (quoted when there are several)')
+    add_server_arguments(command, fan_out=True)
+    command.add_argument("--limit", type=int, default=20, help="the maximum number of cars printed (default: 20)")
+    command.add_argument("--format", choices=["table", "jsonl"], default="table",
+                         help="output format; jsonl prints one {score, car} object per match (default: table)")
+
+    command = commands.add_parser("stats", help="print fleet statistics: brands, decades, duplicate models, top-N")
+    add_server_arguments(command)
+    command.add_argument("--input", "-i", metavar="FILE",
+                         help="compute the statistics from an exported file (e.g. a .vcol snapshot) instead of the server")
+    command.add_argument("--top", type=int, default=10, help="number of brands and models in the top lists (default: 10)")
+    command.add_argument("--format", choices=["text", "json"], default="text", help="output format (default: text)")
+
+    command = commands.add_parser("validate", help="check every car against the validation rules and list the violations")
+    add_server_arguments(command)
+    command.add_argument("--input", "-i", metavar="FILE", help="check an exported or importable file instead of the server")
+    command.add_argument("--format", choices=["text", "jsonl"], default="text",
+                         help="output format; jsonl prints one {index, id, problems} object per invalid car (default: text)")
+
+    command = commands.add_parser("import", help="import cars from a JSON, JSONL or CSV file")
+    command.add_argument("file", help="the .json, .jsonl or .csv file to import")
+    add_server_arguments(command)
+    command.add_argument("--workers", type=int, default=8, help="number of cars posted at the same time (default: 8)")
+    command.add_argument("--batch-size", type=int, default=500, help="number of cars between two checkpoints (default: 500)")
+    command.add_argument("--checkpoint", help="checkpoint file used to resume an interrupted import (default: <file>.checkpoint)")
+
+    command = commands.add_parser("export", help="write every car to a file")
+    add_server_arguments(command)
+    command.add_argument("--output", "-o", help="the file to write (default: stdout)")
+    command.add_argument("--format", choices=["jsonl", "csv", "json", "columnar"],
+                         help="output format; columnar is the compact binary layout of vehicle_snapshot "
+                              "(default: taken from the output extension .jsonl/.csv/.json/.vcol, else jsonl)")
+    command.add_argument("--compress", choices=["none", "gzip", "zstd"],
+                         help="compression (default: taken from the output extension .gz/.zst, else none)")
+
+    command = commands.add_parser("batch", help="run the operations of a JSONL file over one connection",
+                                  description="Run the operations of FILE (one JSON object per line, - for stdin) "
+                                              "over one connection and print one JSON result per operation.")
+    command.add_argument("file", metavar="FILE", help="the operations, one JSON object per line (- for stdin)")
+    add_server_arguments(command)
+    return parser
+
+
+# Function to run a subcommand over several databases.
+def run_fan_out (args):
+    """ Runs `list`, `get` or `search` over the server of the command line and the endpoints, in parallel, and returns the exit code. """
+    import vehicle_fanout
+    endpoints = []
+    if args.server_address:
+        endpoints.append({"name": f"{args.server_address.partition('://')[2] or args.server_address}:{args.port_number}/{args.database}",
+                          "server_address": args.server_address, "port_number": args.port_number, "database": args.database})
+    endpoints += args.endpoint
+    try:
+        if args.endpoints:
+            endpoints += vehicle_fanout.read_endpoints(args.endpoints)
+        vehicle_fanout.check_endpoints(endpoints)
+    except (OSError, ValueError) as e:
+        print (f"Invalid endpoints: {e}", file=sys.stderr)
+        return 1
+    columns = vm.COLUMNS + ["source"]
+    if args.command == "list":
+        records, errors = vehicle_fanout.list_all(endpoints)
+        vm.render_rows(records, args.format, columns=columns)
+    elif args.command == "get":
+        records, errors = vehicle_fanout.get_all(endpoints, args.cid)
+        print (json.dumps({"op": "get", "id": args.cid, "ok": bool(records), "data": records, "errors": errors}))
+        if not records:
+            return 1
+    else:
+        hits, errors = vehicle_fanout.search_all(endpoints, args.query, args.limit)
+        if args.format == "jsonl":
+            for hit in hits:
+                print (json.dumps(hit))
+        else:
+            vm.render_rows([hit["car"] for hit in hits], columns=columns)
+    for name, error in errors.items():
+        print (f"{name}: {error}", file=sys.stderr)
+    return 1 if errors else 0
+
+
+# Function to report a failed download of the car list.
+def report_download_error (error):
+    """ Prints why the car list could not be read, on stderr so the message never mixes with the data. """
+    if isinstance(error, vm.requests.HTTPError) and error.response is not None:
+        print (f"Server error! (HTTP {error.response.status_code})", file=sys.stderr)
+    elif isinstance(error, vm.requests.RequestException):
+        print (f"Communication error! ({error.__class__.__name__})", file=sys.stderr)
+    else:
+        print ("The server sent an invalid car list.", file=sys.stderr)
+
+
+# Function to run a non-interactive subcommand.
+def run_command (args):
+    """ Runs the parsed subcommand and returns the exit code. """
+    if args.command in ("list", "get", "search") and (args.endpoint or args.endpoints):
+        return run_fan_out(args)
+    if args.command == "list":
+        try:
+            vm.render_rows(vm.stream_cars(args.server_address, args.port_number, args.database), args.format)
+        except BrokenPipeError:
+            # The reader of the pipe went away (e.g. `| head`), stop quietly.
+            sys.stderr.close()
+        except (vm.requests.RequestException, ValueError) as e:
+            report_download_error(e)
+            return 1
+        return 0
+    if args.command == "export":
+        output_format = args.format
+        if output_format is None:
+            extension = os.path.splitext(vehicle_snapshot.base_name(args.output or ""))[1].lower()
+            output_format = {".csv": "csv", ".json": "json", ".vcol": "columnar"}.get(extension, "jsonl")
+        try:
+            count = vm.export_cars(args.server_address, args.port_number, args.database,
+                                   args.output, output_format, args.compress)
+        except (vm.requests.RequestException, ValueError) as e:
+            report_download_error(e)
+            return 1
+        print (f"Exported {count} cars.", file=sys.stderr)
+        return 0
+    if args.command == "stats":
+        import vehicle_analytics
+        if args.input:
+            if vehicle_snapshot.base_name(args.input).lower().endswith(".vcol"):
+                columns = vehicle_analytics.FleetColumns.from_snapshot(args.input)
+            else:
+                columns = vehicle_analytics.FleetColumns.from_records(vm.read_car_records(args.input))
+            with vehicle_stats.timer("analytics_seconds"):
+                report = columns.report(args.top)
+        else:
+            client = vm.get_client(args.server_address, args.port_number, args.database)
+            result = vm.run_operation(client, {"op": "stats", "top": args.top})
+            if not result["ok"]:
+                print (json.dumps(result))
+                return 1
+            report = result["data"]
+        print (json.dumps(report, indent=2) + "\n" if args.format == "json" else vehicle_analytics.format_report(report), end="")
+        return 0
+    if args.command == "search":
+        result = vm.run_operation(vm.get_client(args.server_address, args.port_number, args.database),
+                                  {"op": "search", "query": args.query, "limit": args.limit})
+        if not result["ok"]:
+            print (json.dumps(result))
+            return 1
+        if args.format == "jsonl":
+            for hit in result["data"]:
+                print (json.dumps(hit))
+        else:
+            vm.render_rows([hit["car"] for hit in result["data"]])
+        return 0
+    if args.command == "validate":
+        if args.input:
+            invalid = []
+            checked = sum(1 for _ in vehicle_record.checked(vm.read_car_records(args.input), invalid))
+        else:
+            result = vm.run_operation(vm.get_client(args.server_address, args.port_number, args.database), {"op": "validate"})
+            if not result["ok"]:
+                print (json.dumps(result))
+                return 1
+            checked, invalid = result["data"]["checked"], result["data"]["invalid"]
+        for item in invalid:
+            if args.format == "jsonl":
+                print (json.dumps(item))
+            else:
+                print (f'id {item["id"]} (record {item["index"]}): {"; ".join(item["problems"])}')
+        print (f"{checked} cars checked, {len(invalid)} invalid.", file=sys.stderr)
+        return 1 if invalid else 0
+    if args.command == "import":
+        client = vm.get_client(args.server_address, args.port_number, args.database, pool_size=args.workers)
+        summary = vm.import_cars(client, args.file, args.workers, args.batch_size, args.checkpoint)
+        print (f'Imported {summary["imported"]} cars in {summary["seconds"]:.1f} s ({summary["rate"]:.0f} cars/s), '
+               f'{summary["invalid"]} invalid, {summary["duplicate"]} duplicate, {summary["failed"]} failed, {summary["skipped"]} skipped from the checkpoint.')
+        return 1 if summary["failed"] or summary["stopped"] else 0
+
+    client = vm.get_client(args.server_address, args.port_number, args.database)
+    if args.command == "batch":
+        with (sys.stdin if args.file == "-" else open(args.file, encoding="utf-8")) as file:
+            failed = vm.run_batch(client, vm.read_operations(file))
+        return 1 if failed else 0
+
+    operation = {"op": args.command, "id": getattr(args, "cid", None)}
+    if args.command in ("add", "update"):
+        operation["data"] = car_data(args)
+        if args.command == "add":
+            operation["id"] = operation["data"].get("id")
+    result = vm.run_operation(client, operation)
+    print (json.dumps(result))
+    return 0 if result["ok"] else 1
+
+
+# Function to run the interactive menu.
+def run_menu (server_address, port_number, database, cid=None):
+    """ Runs the menu until the user quits (exit code 0) or the server is gone without a replica (exit code 1). """
+    # The replica needs sqlite3, so it is only imported by the menu.
+    import vehicle_replica
+
+    # Show the car given on the command line before the first menu.
+    if cid is not None:
+        result = vm.run_operation(vm.get_client(server_address, port_number, database), {"op": "get", "id": cid})
+        if result["ok"]:
+            vm.print_json(result["data"])
+        else:
+            print (f"Car {cid}: {result['error']}.")
+
+    # Local replica, used to keep working when the server is not responding.
+    # Set VINTAGE_CAR_DB_REPLICA to an empty string to disable it.
+    client = vm.get_client(server_address, port_number, database)
+    replica_path = vehicle_replica.default_path(server_address, port_number, database)
+    replica = vehicle_replica.VehicleReplica(replica_path) if replica_path else None
+    offline = False
+    # When the replica was last synced; None syncs it at the next menu shown online.
+    synced_at = None
+    # The server is checked in the background, so the menu never waits for a server that is down.
+    client.start_health_probe()
+
+    while True:
+        # Only probe the server here, the car list is streamed when it is needed.
+        online = vm.server_is_alive(server_address, port_number, database)
+        if not online and (replica is None or not replica.is_synced()):
+            # Nothing to fall back on: make sure this is not a transient failure before giving up.
+            online = client.wait_available()
+        if online and replica is not None:
+            try:
+                if replica.pending_count():
+                    summary = replica.replay(client)
+                    print (f'{summary["replayed"]} offline changes sent to the server, {summary["pending"]} still pending.')
+                    for op, conflict_cid, server_record in summary["conflicts"]:
+                        print (f'Conflict: the {op} of cid {conflict_cid} was dropped, the server now holds {server_record}.')
+                    synced_at = None
+                # A sync may download the whole collection (a server without validators or change 
+                # feed), so it is only made at the start, after a write, when the server is back, 
+                # and otherwise every REPLICA_SYNC_SECONDS.
+                if offline or synced_at is None or time.monotonic() - synced_at >= REPLICA_SYNC_SECONDS:
+                    replica.sync(client)
+                    synced_at = time.monotonic()
+            except (vm.requests.RequestException, ValueError):
+                pass
+        if not online:
+            if replica is None or not replica.is_synced():
+                print("Server is not responding - quitting!")
+                return 1
+            if not offline:
+                print("Server is not responding - working offline from the local replica.")
+        offline = not online
+
+        vm.print_menu ()
+        choice = vm.read_user_choice ()
+        if choice == "0":
+            print ("You exit the program. Bye!")
+            return 0
+        elif choice == "1":
+            vm.browse_cars (server_address, port_number, database, source=replica.fetch_page if offline else None)
+        elif choice  == "2":
+            vehicle_replica.add_car_offline (replica) if offline else vm.add_car (server_address, port_number, database)
+        elif choice == "3":
+            vehicle_replica.delete_car_offline (replica) if offline else vm.delete_car (server_address, port_number, database)
+        elif choice == "4":
+            vehicle_replica.update_car_offline (replica) if offline else vm.update_car (server_address, port_number, database)
+        elif choice == "5":
+            vm.search_cars (server_address, port_number, database, store=vm.VehicleStore(replica.find()) if offline else None)
+        if choice in ("2", "3", "4") and not offline:
+            # A write: the replica is synced before the next menu.
+            synced_at = None
+
+
+def main (argv=None):
+    argv = instrumentation_arguments(sys.argv[1:] if argv is None else argv)
+    parser = command_parser()
+    args = parser.parse_args(legacy_arguments(argv, parser))
+    if args.server_address is None and not (args.endpoint or args.endpoints):
+        parser.error(f"{args.command}: give a server address, --endpoint or --endpoints")
+    for option in ("connect_timeout", "read_timeout", "retries"):
+        if getattr(args, option) is not None:
+            vm.CLIENT_DEFAULTS[option] = getattr(args, option)
+    if args.command == "menu":
+        return run_menu(args.server_address, args.port_number, args.database, args.cid)
+    return run_command(args)
+
+
+if __name__ == "__main__":
+    sys.exit (main())